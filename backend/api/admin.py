@@ -1,7 +1,20 @@
 from django.contrib import admin
-from .models import Journal, MoodStat, Insight
+from .models import Journal, Insight, EmotionJob
+from .jobs import enqueue_reprocessing
+
+
+@admin.register(Journal)
+class JournalAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'date')
+    list_filter = ('date',)
+    actions = ['reprocess_emotions']
+
+    @admin.action(description='Reprocess emotions')
+    def reprocess_emotions(self, request, queryset):
+        count = enqueue_reprocessing(queryset)
+        self.message_user(request, f'{count} journal(s) queued for reprocessing')
+
 
 # Register your models here.
-admin.site.register(Journal)
-admin.site.register(MoodStat)
-admin.site.register(Insight)
\ No newline at end of file
+admin.site.register(Insight)
+admin.site.register(EmotionJob)
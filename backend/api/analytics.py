@@ -0,0 +1,146 @@
+"""
+Incrementally maintained mood rollups.
+
+Every change to a journal's moodStats is applied as a delta (subtract the old
+values, add the new ones) to the day, week and month MoodRollup rows the
+journal's date falls in, so reading a chart costs one row per bucket no
+matter how long the history is.
+"""
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Journal, MoodRollup
+
+# MoodStats field -> MoodRollup running sum
+SUM_FIELDS = {
+    'percentHappiness': 'sumHappiness',
+    'percentFear': 'sumFear',
+    'percentSadness': 'sumSadness',
+    'percentDisgust': 'sumDisgust',
+    'percentAnger': 'sumAnger',
+}
+
+# MoodStats.dominantMood -> MoodRollup counter
+DOMINANT_FIELDS = {
+    'happy': 'happyCount',
+    'fear': 'fearCount',
+    'sad': 'sadCount',
+    'disgust': 'disgustCount',
+    'anger': 'angerCount',
+}
+
+
+def period_starts(day):
+    return {
+        'day': day,
+        'week': day - timedelta(days=day.weekday()),
+        'month': day.replace(day=1),
+    }
+
+
+def mood_values(mood_stat):
+    """Snapshot a MoodStats (or None) as a dict that apply_mood_change understands."""
+    if mood_stat is None:
+        return None
+    values = {field: getattr(mood_stat, field) for field in SUM_FIELDS}
+    values['dominantMood'] = mood_stat.dominantMood
+    return values
+
+
+def _delta(old, new):
+    changes = {'entry_count': (new is not None) - (old is not None)}
+    for field, total in SUM_FIELDS.items():
+        changes[total] = (new or {}).get(field, 0.0) - (old or {}).get(field, 0.0)
+    for mood, counter in DOMINANT_FIELDS.items():
+        changes[counter] = int((new or {}).get('dominantMood') == mood) - int((old or {}).get('dominantMood') == mood)
+    return {field: value for field, value in changes.items() if value}
+
+
+def apply_mood_change(user_id, old_date=None, old=None, new_date=None, new=None):
+    """
+    Move a journal's contribution in the rollups.
+
+    `old`/`new` are mood_values() dicts (None when there was/is no analysis)
+    and `old_date`/`new_date` the journal date they were/are counted under.
+    """
+    apply_mood_changes([(user_id, old_date, old, new_date, new)])
+
+
+def apply_mood_changes(changes):
+    """
+    Batch form of apply_mood_change for many journals at once.
+
+    `changes` is an iterable of (user_id, old_date, old, new_date, new)
+    tuples. Deltas are summed per rollup row first, so each affected row is
+    written once no matter how many journals fall into it.
+    """
+    totals = {}
+    for user_id, old_date, old, new_date, new in changes:
+        if old is not None and new is not None and old_date == new_date:
+            parts = [(new_date, _delta(old, new))]
+        else:
+            parts = []
+            if old is not None:
+                parts.append((old_date, _delta(old, None)))
+            if new is not None:
+                parts.append((new_date, _delta(None, new)))
+        for day, delta in parts:
+            for period, start in period_starts(day).items():
+                row = totals.setdefault((user_id, period, start), {})
+                for field, value in delta.items():
+                    row[field] = row.get(field, 0) + value
+
+    with transaction.atomic():
+        for (user_id, period, start), delta in totals.items():
+            _apply_bucket(user_id, period, start, {field: value for field, value in delta.items() if value})
+
+
+def _apply_bucket(user_id, period, start, changes):
+    if not changes:
+        return
+    updates = {field: F(field) + value for field, value in changes.items()}
+    rows = MoodRollup.objects.filter(user_id=user_id, period=period, period_start=start)
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            MoodRollup.objects.create(user_id=user_id, period=period, period_start=start, **changes)
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(**updates)
+
+
+def rebuild_rollups(user):
+    """Recompute a user's rollups from scratch."""
+    with transaction.atomic():
+        MoodRollup.objects.filter(user=user).delete()
+        totals = {}
+        journals = Journal.objects.filter(user=user, mood__isnull=False).only('date', 'mood', 'dominant_mood')
+        for journal in journals.iterator(chunk_size=1000):
+            changes = _delta(None, mood_values(journal.moodStats))
+            for period, start in period_starts(journal.date).items():
+                row = totals.setdefault((period, start), {})
+                for field, value in changes.items():
+                    row[field] = row.get(field, 0) + value
+        MoodRollup.objects.bulk_create([
+            MoodRollup(user=user, period=period, period_start=start, **changes)
+            for (period, start), changes in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+def rollup_summary(rollup):
+    """Averages and dominant-mood counts for one rollup row."""
+    count = rollup.entry_count
+    return {
+        'period': rollup.period,
+        'periodStart': rollup.period_start,
+        'entryCount': count,
+        'averages': {
+            field: (getattr(rollup, total) / count if count else 0.0)
+            for field, total in SUM_FIELDS.items()
+        },
+        'dominantMoodCounts': {
+            mood: getattr(rollup, counter) for mood, counter in DOMINANT_FIELDS.items()
+        },
+    }
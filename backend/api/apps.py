@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import repair_search_index
+    repair_search_index(connections[using])
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import conditional, metrics, snapshots  # noqa: F401 -- registers their signal receivers
+        post_migrate.connect(repair_search_index, sender=self)
@@ -0,0 +1,69 @@
+"""
+Async versions of the LLM-bound endpoints for ASGI deployments.
+
+DRF views are sync, so these are plain Django async views that keep the
+URLs, JWT authentication and response bodies of their DRF counterparts.
+Under an ASGI server a request waiting on Gemini or the database holds no
+worker thread, so one process can keep many slow LLM calls in flight.
+urls.py routes to them when ASYNC_VIEWS is enabled.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .models import Journal
+from .serializers import JournalSerializer, DailyGreetingSerializer, EmotionJobSerializer
+from .emotions import is_processed
+from .jobs import enqueue_emotion_job
+from .greetings import agreeting_for
+from .conditional import conditional, current_etag, quarter_hour, set_conditional_headers
+
+
+async def authenticate(request):
+    """The user for the request's JWT, or None."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def unauthorized():
+    return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+
+@csrf_exempt
+@require_POST
+async def process_emotions(request, pk):
+    """Async JournalViewSet.process_emotions: the journal if already processed, otherwise 202 with the queued job."""
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+
+    journal = await Journal.objects.select_related('insights').filter(user=user, pk=pk).afirst()
+    if journal is None:
+        return JsonResponse({"detail": "No Journal matches the given query."}, status=404)
+    if is_processed(journal):
+        return JsonResponse(JournalSerializer(journal).data)
+
+    job, created = await sync_to_async(enqueue_emotion_job)(journal)
+    return JsonResponse(EmotionJobSerializer(job).data, status=202)
+
+
+@conditional(quarter_hour)
+@require_GET
+async def daily_greeting_today(request):
+    """Async DailyGreetingViewSet.today."""
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+
+    try:
+        daily_greeting = await agreeting_for(user)
+    except Exception as e:
+        return JsonResponse({"error": f"Failed to generate daily greetings: {str(e)}"}, status=500)
+    # Read after agreeting_for, which bumps the version when it generates the greeting
+    etag = await sync_to_async(current_etag)(user.id, quarter_hour)
+    return set_conditional_headers(JsonResponse(DailyGreetingSerializer(daily_greeting).data), *etag)
@@ -0,0 +1,197 @@
+"""
+Conditional GET for a user's own data.
+
+Every user has a version in the default cache: a timestamp replaced after
+each committed write to their journals, streak, profile, insights or
+greetings. Cacheable reads send it as their ETag (and Last-Modified) with
+`Cache-Control: private, no-cache`, so browsers revalidate every time.
+NotModifiedMiddleware answers a request whose If-None-Match still matches
+with 304 before the view runs, checking the JWT signature but not loading
+the user, so an unchanged resource costs one cache read and no ORM query.
+With Redis (REDIS_URL) that read doesn't touch the database; with the
+default DatabaseCache it is one query on the cache table.
+Under ASGI the middleware runs natively async, so async views aren't
+adapted to a thread for it.
+
+Writes that skip model signals (bulk_create, bulk_update, update) call
+bump_user_version themselves.
+"""
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from django.contrib.auth.models import User
+from .models import DailyGreeting, Insight, Journal, UserProfile, UserStreak
+
+VERSION_KEY = 'user-version:{}'
+
+
+def user_version(user_id):
+    """The user's current version, starting a new one if the cache has none."""
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            # Another request started one first; keep ours if it can't be read back yet
+            version = cache.get(key, version)
+    return version
+
+
+def bump_user_version(*user_ids):
+    """Give the users new versions once the current transaction commits."""
+    def bump():
+        now = time.time_ns()
+        cache.set_many({VERSION_KEY.format(user_id): now for user_id in set(user_ids)}, None)
+    transaction.on_commit(bump)
+
+
+def quarter_hour():
+    """
+    ETag suffix for responses that also change with the clock. Greeting
+    periods start on the hour in every timezone, and every UTC offset is a
+    multiple of 15 minutes.
+    """
+    return f'-{int(time.time() // 900)}'
+
+
+def current_etag(user_id, suffix=None):
+    """
+    (ETag, version) for the user's data right now. Read it before querying so
+    a racing write only makes it older, unless the view writes itself.
+    """
+    version = user_version(user_id)
+    return f'"{user_id}-{version}{suffix() if suffix else ""}"', version
+
+
+def set_conditional_headers(response, etag, version):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(version / 1e9)
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def conditional(suffix=None):
+    """Mark a function view for NotModifiedMiddleware; the view sets the headers with current_etag itself."""
+    def decorator(view):
+        view.etag_suffix = suffix
+        view.conditional = True
+        return view
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag/Last-Modified to the viewset actions in `conditional_actions`,
+    a mapping of action name to an ETag suffix function or None.
+    """
+    conditional_actions = {}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.conditional_etag = None
+        if request.method in ('GET', 'HEAD') and self.action in self.conditional_actions:
+            self.conditional_etag = current_etag(request.user.id, self.conditional_actions[self.action])
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'conditional_etag', None) and response.status_code == 200:
+            set_conditional_headers(response, *self.conditional_etag)
+        return response
+
+
+def _etag_suffix(view_func, method):
+    """(True, suffix) if the view marks this request as conditional, else (False, None)."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is not None:
+        action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+        actions = getattr(cls, 'conditional_actions', {})
+        return action in actions, actions.get(action)
+    return getattr(view_func, 'conditional', False), getattr(view_func, 'etag_suffix', None)
+
+
+def token_user_id(request):
+    """The user id in the request's JWT once its signature and expiry check out, without loading the user."""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = header and auth.get_raw_token(header)
+    if not raw:
+        return None
+    try:
+        return auth.get_validated_token(raw).get(api_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+def _revalidation(request, view_func):
+    """(user id, ETag suffix) if the request revalidates a conditional view with a valid token, else None."""
+    if request.method not in ('GET', 'HEAD') or 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+    is_conditional, suffix = _etag_suffix(view_func, request.method)
+    if not is_conditional:
+        return None
+    user_id = token_user_id(request)
+    if user_id is None:
+        return None  # Let the view reject it
+    return user_id, suffix
+
+
+def _not_modified(request, etag, version):
+    if etag not in parse_etags(request.META['HTTP_IF_NONE_MATCH']):
+        return None
+    return set_conditional_headers(HttpResponseNotModified(), etag, version)
+
+
+class NotModifiedMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # The handler awaits a coroutine process_view as is instead of running it in a thread
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        revalidation = _revalidation(request, view_func)
+        if revalidation is None:
+            return None
+        return _not_modified(request, *current_etag(*revalidation))
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        revalidation = _revalidation(request, view_func)
+        if revalidation is None:
+            return None
+        return _not_modified(request, *await sync_to_async(current_etag)(*revalidation))
+
+
+@receiver([post_save, post_delete], sender=Journal)
+@receiver([post_save, post_delete], sender=UserStreak)
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=DailyGreeting)
+@receiver([post_save, post_delete], sender=Insight)
+def bump_owner_version(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def bump_user(sender, instance, **kwargs):
+    bump_user_version(instance.pk)
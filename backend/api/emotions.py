@@ -0,0 +1,76 @@
+from django.db import transaction
+from gemini_wrapper.client import GeminiUnavailable
+from gemini_wrapper.gemini_utils import analysis_fell_back, analyze_journal
+from .models import Journal, MoodStats, Insight, content_fingerprint
+from .analytics import apply_mood_change, mood_values
+
+
+def analyze_content(content: str):
+    """Run the Gemini analysis for a journal body.
+
+    Returns a tuple of (mood_stats, advice_list) where mood_stats uses the
+    MoodStats field names with percentages in the 0-100 range. Raises
+    GeminiUnavailable instead of returning the default analysis, so the
+    journal stays unprocessed and the job is retried.
+    """
+    emotions, advice_list = analyze_journal(content)
+    if analysis_fell_back(emotions, advice_list):
+        raise GeminiUnavailable("Gemini could not analyze the journal")
+    return mood_stats_from_emotions(emotions), list(advice_list)
+
+
+def mood_stats_from_emotions(emotions: dict) -> dict:
+    """Convert Gemini emotion probabilities to MoodStats field values."""
+    max_val = max(emotions.values())
+    top_emotions = [k for k, v in emotions.items() if v == max_val]
+
+    mood_stats = {
+        'percentHappiness': emotions['happy'] * 100,
+        'percentFear': emotions['fear'] * 100,
+        'percentSadness': emotions['sad'] * 100,
+        'percentDisgust': emotions['disgust'] * 100,
+        'percentAnger': emotions['anger'] * 100,
+        'dominantMood': top_emotions[0] if len(top_emotions) == 1 else ''
+    }
+    return mood_stats
+
+
+def save_analysis(journal: Journal, content: str, mood_stats: dict, advice_list: list):
+    """Persist an analysis result onto the journal and its Insight row.
+
+    `content` is the text that was analyzed, which may differ from the
+    journal's current body if the user kept typing while Gemini was working.
+    """
+    with transaction.atomic():
+        journal = Journal.objects.select_for_update().select_related('insights').get(pk=journal.pk)
+        previous = mood_values(journal.moodStats)
+        journal.moodStats = MoodStats(**mood_stats)
+
+        if journal.insights:
+            journal.insights.advice_messages = advice_list
+            journal.insights.save()
+        else:
+            journal.insights = Insight.objects.create(advice_messages=advice_list, user_id=journal.user_id)
+
+        journal.lastProcessedHash = content_fingerprint(content)
+        journal.save(update_fields=['mood', 'dominant_mood', 'insights', 'lastProcessedHash'])
+        apply_mood_change(journal.user_id, journal.date, previous, journal.date, mood_values(journal.moodStats))
+    return journal
+
+
+def save_advice(journal: Journal, advice_list: list) -> Insight:
+    """Persist advice generated on its own (see the stream_advice action) onto the journal's Insight."""
+    with transaction.atomic():
+        journal = Journal.objects.select_for_update().select_related('insights').get(pk=journal.pk)
+        if journal.insights:
+            journal.insights.advice_messages = advice_list
+            journal.insights.save(update_fields=['advice_messages'])
+        else:
+            journal.insights = Insight.objects.create(advice_messages=advice_list, user_id=journal.user_id)
+            journal.save(update_fields=['insights'])
+    return journal.insights
+
+
+def is_processed(journal: Journal) -> bool:
+    """Whether the journal's current content already has an analysis."""
+    return journal.lastProcessedHash == content_fingerprint(journal.content)
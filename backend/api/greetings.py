@@ -0,0 +1,295 @@
+"""
+Daily greeting generation, ahead of time and on demand.
+
+The prewarm_greetings command fills each greeting period's rows for recently
+active users shortly before the period starts, so the `today` endpoint is
+normally a single lookup. `greeting_for` still generates live when a row is
+missing (a new user, or the scheduler isn't running).
+
+A row whose `greetings` is empty is a placeholder for a generation that is
+still running. Its claim lapses after claim_lease(), which outlasts a whole
+Gemini call, and a waiting caller may then take the generation over.
+Callers that can't get greetings in time are given the fallback greetings.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from datetime import datetime, timedelta
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+from gemini_wrapper.calendar_service import DEFAULT_TIMEZONE, GREETING_PERIODS, get_timezone, greeting_moment
+from gemini_wrapper import gemini_utils
+from gemini_wrapper.gemini_utils import (
+    aget_daily_greeting_advice, fallback_daily_greetings, get_daily_greeting_advice, stream_daily_greeting_advice,
+)
+from asgiref.sync import sync_to_async
+from .models import Journal, DailyGreeting, UserProfile
+from .conditional import bump_user_version
+
+GREETING_LEASE_SLACK = 15.0  # Seconds a claim outlasts the Gemini deadline, for the reads and writes around the call
+GREETING_POLL_INTERVAL = 0.25
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_async_in_flight = {}  # Only touched from event loop threads, keyed by loop
+
+
+def claim_lease():
+    """How long a placeholder's claimant has to fill it before another caller may take over."""
+    return timedelta(seconds=gemini_utils.client.deadline + GREETING_LEASE_SLACK)
+
+
+def _take_over(greeting):
+    """Claim a placeholder whose lease ran out. False if it hasn't, or another caller got there first."""
+    now = timezone.now()
+    if greeting.claimed_at + claim_lease() > now:
+        return False
+    return bool(
+        DailyGreeting.objects.filter(pk=greeting.pk, greetings=[], claimed_at=greeting.claimed_at).update(claimed_at=now)
+    )
+
+
+def _with_fallback(greeting, tz_name, local):
+    """The placeholder with the fallback greetings, unsaved, so its generation can still finish."""
+    greeting.greetings = fallback_daily_greetings(tz_name, at=local)
+    return greeting
+
+
+def user_timezone(user):
+    """The user's IANA timezone name; periods and dates follow the user's local time."""
+    try:
+        return user.profile.timezone
+    except UserProfile.DoesNotExist:
+        return DEFAULT_TIMEZONE
+
+
+def current_slot(now=None, tz_name=DEFAULT_TIMEZONE):
+    """(date, time_period, local_time) of the greeting period `now` falls in."""
+    moment = greeting_moment(now or timezone.now(), tz_name)
+    return moment.date, moment.time_period, moment.local_time
+
+
+def next_slot(now=None, tz_name=DEFAULT_TIMEZONE):
+    """(date, time_period, starts_at) of the first greeting period after `now`."""
+    tz = get_timezone(tz_name)
+    local = (now or timezone.now()).astimezone(tz)
+    for day_offset in (0, 1):
+        day = local.date() + timedelta(days=day_offset)
+        # Greetings are per date, so midnight gets a new row when the date changes at 0:00
+        for hour, period in [(0, 'midnight'), *GREETING_PERIODS]:
+            starts_at = tz.localize(datetime(day.year, day.month, day.day, hour))
+            if starts_at > local:
+                return day, period, starts_at
+
+
+def upcoming_slots(now=None, lead=timedelta(minutes=30), tz_name=DEFAULT_TIMEZONE):
+    """The current period, plus the next one when it starts within `lead`."""
+    now = now or timezone.now()
+    slots = [current_slot(now, tz_name)]
+    following = next_slot(now, tz_name)
+    if following[2] - now <= lead:
+        slots.append(following)
+    return slots
+
+
+def active_users(since):
+    """Users who logged in or wrote a journal on or after `since`."""
+    return User.objects.filter(
+        Q(last_login__gte=since) | Q(journals__date__gte=since.date()),
+        is_active=True,
+    ).distinct()
+
+
+def prewarm_greetings(users, slot, tz_name=DEFAULT_TIMEZONE, batch_size=50, workers=4):
+    """
+    Create the greetings for `slot` for every user in `users` that doesn't
+    have them yet. `users` should all be in the `tz_name` timezone. Generation runs `workers` at a time and rows are written
+    one batch of users at a time. Returns the number of users greetings were
+    generated for.
+    """
+    slot_date, period, starts_at = slot
+    done = DailyGreeting.objects.filter(date=slot_date, time_period=period).values('user_id')
+    user_ids = list(users.exclude(id__in=done).order_by('id').values_list('id', flat=True))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='greetings') as pool:
+        for i in range(0, len(user_ids), batch_size):
+            batch = user_ids[i:i + batch_size]
+            entries = {user_id: [] for user_id in batch}
+            rows = Journal.objects.filter(user_id__in=batch, date=slot_date).order_by('id').values_list('user_id', 'content')
+            for user_id, content in rows:
+                entries[user_id].append(content)
+
+            texts = pool.map(lambda user_id: get_daily_greeting_advice(entries[user_id], tz_name, at=starts_at), batch)
+            greetings = [
+                DailyGreeting(user_id=user_id, date=slot_date, time_period=period, greetings=text)
+                for user_id, text in zip(batch, texts)
+            ]
+            # A row created by a live request in the meantime wins
+            DailyGreeting.objects.bulk_create(greetings, ignore_conflicts=True)
+            bump_user_version(*batch)
+    return len(user_ids)
+
+
+def greeting_for(user, now=None):
+    """
+    The user's greetings for the current period, generated live if they
+    weren't prewarmed. Concurrent callers for the same period share a single
+    Gemini call: threads in this process wait on one in-flight generation and
+    other processes wait for the placeholder row claimed by the first caller.
+    """
+    tz_name = user_timezone(user)
+    slot_date, period, local = current_slot(now, tz_name)
+    greeting = DailyGreeting.objects.filter(user=user, date=slot_date, time_period=period).first()
+    if greeting and greeting.greetings:
+        return greeting
+    try:
+        return _single_flight(
+            (user.id, slot_date, period),
+            lambda: _claim_and_generate(user, slot_date, period, local, tz_name),
+            timeout=claim_lease().total_seconds(),
+        )
+    except TimeoutError:
+        greeting = DailyGreeting(user=user, date=slot_date, time_period=period)
+        return _with_fallback(greeting, tz_name, local)
+
+
+def _single_flight(key, func, timeout=None):
+    """
+    Run func once per key at a time; concurrent callers get the same result.
+    Callers waiting on another's call raise TimeoutError after `timeout` seconds.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+    if not owner:
+        return future.result(timeout=timeout)
+
+    try:
+        result = func()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+def _claim_and_generate(user, slot_date, period, local, tz_name):
+    # An empty row marks the greetings as being generated; the unique
+    # constraint makes exactly one caller the one that creates it
+    greeting, claimed = DailyGreeting.objects.get_or_create(
+        user=user, date=slot_date, time_period=period, defaults={'greetings': [], 'claimed_at': timezone.now()}
+    )
+    if not claimed:
+        # The claim lapses within a lease of now, so a live caller gets a chance to take it over before giving up
+        give_up = time.monotonic() + claim_lease().total_seconds() + GREETING_POLL_INTERVAL
+        while not greeting.greetings and not _take_over(greeting):
+            if time.monotonic() >= give_up:
+                return _with_fallback(greeting, tz_name, local)
+            time.sleep(GREETING_POLL_INTERVAL)
+            greeting.refresh_from_db(fields=['greetings', 'claimed_at'])
+        if greeting.greetings:
+            return greeting
+
+    entries = list(Journal.objects.filter(user=user, date=slot_date).values_list('content', flat=True))
+    greetings = get_daily_greeting_advice(entries, tz_name, at=local)
+    DailyGreeting.objects.filter(pk=greeting.pk, greetings=[]).update(greetings=greetings)
+    bump_user_version(user.id)
+    greeting.refresh_from_db(fields=['greetings'])
+    return greeting
+
+
+def stream_greeting_for(user, now=None):
+    """
+    Streaming form of greeting_for. Yields ('greeting', text) for each message
+    as soon as it is generated, then ('done', DailyGreeting) once it is saved.
+    Existing greetings, and ones another caller is already generating, are
+    sent all at once when ready.
+    """
+    tz_name = user_timezone(user)
+    slot_date, period, local = current_slot(now, tz_name)
+    greeting, claimed = DailyGreeting.objects.get_or_create(
+        user=user, date=slot_date, time_period=period, defaults={'greetings': [], 'claimed_at': timezone.now()}
+    )
+    if not claimed:
+        if not greeting.greetings:
+            greeting = greeting_for(user, now)
+        for text in greeting.greetings:
+            yield 'greeting', text
+        yield 'done', greeting
+        return
+
+    entries = list(Journal.objects.filter(user=user, date=slot_date).values_list('content', flat=True))
+    messages = stream_daily_greeting_advice(entries, tz_name, at=local)
+    greetings = []
+    try:
+        for text in messages:
+            greetings.append(text)
+            yield 'greeting', text
+    finally:
+        # Finish and save even if the client disconnected, so the placeholder doesn't linger
+        greetings.extend(messages)
+        DailyGreeting.objects.filter(pk=greeting.pk, greetings=[]).update(greetings=greetings)
+        bump_user_version(user.id)
+    greeting.refresh_from_db(fields=['greetings'])
+    yield 'done', greeting
+
+
+async def auser_timezone(user):
+    tz_name = await UserProfile.objects.filter(user=user).values_list('timezone', flat=True).afirst()
+    return tz_name or DEFAULT_TIMEZONE
+
+
+async def agreeting_for(user, now=None):
+    """
+    Async form of greeting_for for ASGI views. Concurrent callers on the same
+    event loop await one generation task; other processes are coordinated
+    through the placeholder row as in the sync path.
+    """
+    tz_name = await auser_timezone(user)
+    slot_date, period, local = current_slot(now, tz_name)
+    greeting = await DailyGreeting.objects.filter(user=user, date=slot_date, time_period=period).afirst()
+    if greeting and greeting.greetings:
+        return greeting
+
+    key = (asyncio.get_running_loop(), user.id, slot_date, period)
+    task = _async_in_flight.get(key)
+    if task is None:
+        task = _async_in_flight[key] = asyncio.ensure_future(
+            _aclaim_and_generate(user, slot_date, period, local, tz_name)
+        )
+        task.add_done_callback(lambda _: _async_in_flight.pop(key, None))
+    # Shielded so one caller disconnecting, or giving up, doesn't cancel the others' generation
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), claim_lease().total_seconds())
+    except asyncio.TimeoutError:
+        greeting = DailyGreeting(user=user, date=slot_date, time_period=period)
+        return _with_fallback(greeting, tz_name, local)
+
+
+async def _aclaim_and_generate(user, slot_date, period, local, tz_name):
+    greeting, claimed = await DailyGreeting.objects.aget_or_create(
+        user=user, date=slot_date, time_period=period, defaults={'greetings': [], 'claimed_at': timezone.now()}
+    )
+    if not claimed:
+        give_up = time.monotonic() + claim_lease().total_seconds() + GREETING_POLL_INTERVAL
+        while not greeting.greetings and not await sync_to_async(_take_over)(greeting):
+            if time.monotonic() >= give_up:
+                return _with_fallback(greeting, tz_name, local)
+            await asyncio.sleep(GREETING_POLL_INTERVAL)
+            await greeting.arefresh_from_db(fields=['greetings', 'claimed_at'])
+        if greeting.greetings:
+            return greeting
+
+    entries = [content async for content in Journal.objects.filter(user=user, date=slot_date).values_list('content', flat=True)]
+    greetings = await aget_daily_greeting_advice(entries, tz_name, at=local)
+    await DailyGreeting.objects.filter(pk=greeting.pk, greetings=[]).aupdate(greetings=greetings)
+    await sync_to_async(bump_user_version)(user.id)
+    await greeting.arefresh_from_db(fields=['greetings'])
+    return greeting
@@ -0,0 +1,131 @@
+"""
+DB-backed queue for emotion processing.
+
+The web process only enqueues an EmotionJob and returns; the Gemini calls run
+in `manage.py process_emotion_jobs`, outside of any request or transaction.
+Jobs are claimed with a conditional UPDATE so several workers can share the
+table without a broker or SELECT ... FOR UPDATE SKIP LOCKED support. A
+failed attempt puts the job back with a `run_after` that backs off
+exponentially, so an upstream outage doesn't use up every attempt at once.
+"""
+import logging
+import random
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import EmotionJob
+from .emotions import analyze_content, save_analysis, is_processed
+from .similarity import ensure_embedding
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)  # Running jobs older than this are assumed to belong to a dead worker
+RETRY_DELAY = timedelta(seconds=30)  # Before the second attempt; doubles for each one after
+MAX_RETRY_DELAY = timedelta(minutes=30)
+
+
+def enqueue_emotion_job(journal):
+    """Queue a journal for processing, reusing an unfinished job if there is one.
+
+    Returns a tuple of (job, created).
+    """
+    job = EmotionJob.objects.filter(
+        journal=journal,
+        status__in=['pending', 'running'],
+    ).order_by('-created_at').first()
+    if job:
+        return job, False
+    return EmotionJob.objects.create(journal=journal, user_id=journal.user_id), True
+
+
+def enqueue_reprocessing(journals):
+    """
+    Queue a queryset of journals to be analyzed again even if their content
+    hasn't changed. Journals that already have an unfinished job keep it.
+
+    Returns the number of jobs created.
+    """
+    with transaction.atomic():
+        # Without a fingerprint the worker treats the journal as unprocessed
+        journals.update(lastProcessedHash=None)
+        queued = EmotionJob.objects.filter(journal__in=journals, status__in=['pending', 'running']).values('journal_id')
+        jobs = [
+            EmotionJob(journal_id=journal_id, user_id=user_id)
+            for journal_id, user_id in journals.exclude(id__in=queued).values_list('id', 'user_id')
+        ]
+        return len(EmotionJob.objects.bulk_create(jobs))
+
+
+def retry_delay(attempts):
+    """Backoff before the attempt after attempt number `attempts`, with jitter so failed jobs don't retry in lockstep."""
+    delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_next_job():
+    """Atomically move the oldest due pending job to running and return it."""
+    now = timezone.now()
+    due = EmotionJob.objects.filter(status='pending', run_after__lte=now)
+    candidates = due.order_by('run_after').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = due.filter(pk=job_id).update(
+            status='running',
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return EmotionJob.objects.select_related('journal').get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs(stale_after=STALE_AFTER):
+    """Return jobs abandoned by a crashed worker to the queue."""
+    cutoff = timezone.now() - stale_after
+    stale = EmotionJob.objects.filter(status='running', started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failed',
+        error='Worker stopped responding',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status='pending')
+    return requeued + failed
+
+
+def run_job(job):
+    """Process a claimed job. Failures are recorded on the job, not raised."""
+    journal = job.journal
+    try:
+        if not is_processed(journal):
+            content = journal.content
+            mood_stats, advice_list = analyze_content(content)
+            save_analysis(journal, content, mood_stats, advice_list)
+        # Similar-entry vectors from a remote embedder are made here, off the request path
+        ensure_embedding(journal)
+    except Exception as e:
+        logger.exception("Emotion job %s failed on attempt %s", job.id, job.attempts)
+        job.status = 'pending' if job.attempts < MAX_ATTEMPTS else 'failed'
+        job.error = str(e)
+    else:
+        job.status = 'done'
+        job.error = ''
+    if job.status == 'pending':
+        job.run_after = timezone.now() + retry_delay(job.attempts)
+        job.finished_at = None
+    else:
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'run_after'])
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Drain the queue in the current process. Returns the number of jobs run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
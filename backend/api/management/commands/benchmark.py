@@ -0,0 +1,523 @@
+import asyncio
+import io
+import json
+import subprocess
+import time
+import statistics
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import holidays
+import numpy as np
+import pytz
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.jobs import run_pending_jobs
+from api.metrics import QueryTimer
+from api.models import EmotionJob, Insight, Journal, MOODS, MoodStats
+from api.renderers import FastJSONRenderer
+from api.serializers import JournalSerializer
+from api.search import search_journals
+from api.snapshots import store_snapshots
+from api.similarity import top_k
+from api.streaks import rebuild_streak
+from api.trends import compute_trends
+from gemini_wrapper import gemini_utils, jsonlib
+from gemini_wrapper.calendar_service import greeting_moment
+from gemini_wrapper.cache import LLMCache
+from gemini_wrapper.client import GeminiClient
+from gemini_wrapper.embeddings import HashingEmbedder, normalize
+from gemini_wrapper.fake_client import FAKE_ADVICE, FakeGeminiClient, default_responder
+
+
+def time_call(func, repeat):
+    """Run func `repeat` times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def percentiles(timings):
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]).tolist()
+    return {'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3)}
+
+
+def synthetic_mood_history(entries, seed=0):
+    """Arrays shaped like load_mood_history() output: ~1.2 entries per day with gaps."""
+    rng = np.random.default_rng(seed)
+    gaps = rng.choice([0, 1, 1, 1, 2, 3], size=entries)
+    dates = np.datetime64('2000-01-01') + np.cumsum(gaps).astype('timedelta64[D]')
+    values = rng.dirichlet(np.ones(len(MOODS)), size=entries) * 100
+    dominant = values.argmax(axis=1).astype(np.int8)
+    return dates, values, dominant
+
+
+def bench_trends(options):
+    results = {}
+    for entries in (1_000, 10_000, 50_000):
+        history = synthetic_mood_history(entries)
+        results[f'{entries} entries'] = summarize(time_call(lambda: compute_trends(*history), options['repeat']))
+    return results
+
+
+def legacy_greeting_context(timezone='Asia/Manila'):
+    """Per-call context lookup as get_daily_greeting_advice did before the calendar service."""
+    current_time = datetime.now(pytz.timezone(timezone))
+    current_date = current_time.date()
+    is_holiday = current_date in holidays.PH()
+    holiday_name = holidays.PH().get(current_date) if is_holiday else None
+    return current_time.hour, current_time.strftime("%A"), is_holiday, holiday_name
+
+
+def bench_greetings(options):
+    repeat = options['repeat']
+    entries = ['Went for a run and finished my report.', 'Had dinner with friends.']
+    # Served from the LLM cache after the first call, so this measures everything around Gemini
+    client = GeminiClient(raw=FakeGeminiClient())
+    with patch.object(gemini_utils, 'client', client):
+        gemini_utils.get_daily_greeting_advice(entries)
+        advice = summarize(time_call(lambda: gemini_utils.get_daily_greeting_advice(entries), repeat))
+    return {
+        'context (legacy)': summarize(time_call(legacy_greeting_context, repeat)),
+        'context (calendar service)': summarize(time_call(greeting_moment, repeat)),
+        'get_daily_greeting_advice': advice,
+    }
+
+
+def measure(func):
+    """Run func once and return (wall seconds, peak traced memory in MiB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def wsgi_get(app, path, headers):
+    """GET through a WSGI application. Returns (status, seconds to the first body chunk)."""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+        **{f'HTTP_{name.upper().replace("-", "_")}': value for name, value in headers.items()},
+    }
+    status = []
+    start = time.perf_counter()
+    body = app(environ, lambda line, response_headers, exc_info=None: status.append(int(line.split()[0])))
+    first = None
+    try:
+        for chunk in body:
+            if chunk and first is None:
+                first = time.perf_counter() - start
+    finally:
+        body.close()
+    return status[0], first
+
+
+async def asgi_get(app, path, headers):
+    """GET through an ASGI application. Returns (status, seconds to the first body chunk)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), *((name.lower().encode(), value.encode()) for name, value in headers.items())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    requested = asyncio.Event()
+    status, first = [], None
+    start = time.perf_counter()
+
+    async def receive():
+        if requested.is_set():
+            await asyncio.Event().wait()  # The client never disconnects
+        requested.set()
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal first
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message.get('body') and first is None:
+            first = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    return status[0], first
+
+
+def bench_concurrency(options):
+    """
+    --requests users asking for today's greeting at once, through the whole
+    WSGI and ASGI applications with their middleware, against a fake Gemini
+    with a fixed --latency: a pool of --sync-workers threads on the WSGI app
+    versus one event loop on the ASGI app (which uses the async views when
+    ASYNC_VIEWS is on). Effective concurrency is total Gemini wait / wall
+    time. The stream rows also time the first greeting event. Each row gets
+    its own users, committed so every thread sees them and deleted afterwards.
+    """
+    requests, latency, workers = options['requests'], options['latency'], options['sync_workers']
+    client = GeminiClient(raw=FakeGeminiClient(latency=latency, chunk_latency=latency / 50), base_delay=0.05)
+    wsgi, asgi = get_wsgi_application(), get_asgi_application()
+    views = 'async views' if settings.ASYNC_VIEWS else 'sync views'
+    rows = [
+        (f'wsgi today ({workers} workers)', wsgi, '/api/daily-greetings/today/'),
+        (f'asgi today ({views})', asgi, '/api/daily-greetings/today/'),
+        (f'wsgi stream ({workers} workers)', wsgi, '/api/daily-greetings/stream/'),
+        ('asgi stream (1 event loop)', asgi, '/api/daily-greetings/stream/'),
+    ]
+
+    users = User.objects.bulk_create([
+        User(username=f'benchmark-concurrency-{index}') for index in range(requests * len(rows))
+    ])
+    results = {}
+    try:
+        with patch.object(gemini_utils, 'client', client), patch.object(gemini_utils, 'llm_cache', LLMCache(None)):
+            for index, (label, app, path) in enumerate(rows):
+                batch = [
+                    {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+                    for user in users[index * requests:(index + 1) * requests]
+                ]
+                if app is wsgi:
+                    def run():
+                        with ThreadPoolExecutor(max_workers=workers) as pool:
+                            return list(pool.map(lambda headers: wsgi_get(wsgi, path, headers), batch))
+                else:
+                    async def gather():
+                        return await asyncio.gather(*[asgi_get(asgi, path, headers) for headers in batch])
+
+                    def run():
+                        return asyncio.run(gather())
+
+                responses = []
+                elapsed, peak = measure(lambda: responses.extend(run()))
+                failed = sum(status >= 400 for status, _ in responses)
+                if failed:
+                    raise CommandError(f'{label}: {failed} of {requests} requests failed')
+                results[label] = {
+                    'requests': requests,
+                    'wall_s': round(elapsed, 2),
+                    'req_per_s': round(requests / elapsed, 1),
+                    'concurrency': round(requests * latency / elapsed, 1),
+                    'peak_mib': round(peak, 2),
+                }
+                if 'stream' in path:
+                    first = percentiles([seconds * 1000 for _, seconds in responses])
+                    results[label].update({f'first_event_{key}': value for key, value in first.items()})
+    finally:
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+    return results
+
+
+def synthetic_journals(user, entries, seed=0, words=40, vocabulary=5000, batch=10_000):
+    """Insert journals whose text follows a Zipf-like word distribution, a batch at a time."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    for offset in range(0, entries, batch):
+        size = min(batch, entries - offset)
+        words_per_row = rng.choice(vocabulary, size=(size, words), p=weights)
+        dates = (np.datetime64('2000-01-01') + rng.integers(0, 9000, size).astype('timedelta64[D]')).tolist()
+        Journal.objects.bulk_create([
+            Journal(user=user, date=day, title=f'term{row[0]} term{row[1]}', content=' '.join(f'term{word}' for word in row))
+            for row, day in zip(words_per_row, dates)
+        ], batch_size=2000)
+
+
+def bench_search(options):
+    """
+    Search over --entries synthetic journals of one user: the indexed
+    search_journals path against the icontains scan it replaces, for a
+    common, a mid-frequency, a rare and a two-word query. The rows are
+    inserted inside a transaction that is rolled back afterwards.
+    """
+    entries, repeat = options['entries'], options['repeat']
+    queries = {'common': 'term3', 'mid': 'term300', 'rare': 'term4000', 'two words': 'term30 term700'}
+    results = {}
+    with transaction.atomic():
+        user = User.objects.create(username='benchmark-search')
+        start = time.perf_counter()
+        synthetic_journals(user, entries)
+        results['insert + index'] = {'entries': entries, 'wall_s': round(time.perf_counter() - start, 1)}
+
+        journals = Journal.objects.filter(user=user)
+        for label, query in queries.items():
+            def indexed():
+                found = search_journals(journals, query)
+                return found.count(), list(found.order_by('-rank', '-date', '-id').values_list('id', flat=True)[:20])
+
+            def scan():
+                found = journals
+                for term in query.split():
+                    found = found.filter(Q(title__icontains=term) | Q(content__icontains=term))
+                return found.count(), list(found.order_by('-date', '-id').values_list('id', flat=True)[:20])
+
+            results[f'{label} (index)'] = {'matches': indexed()[0], **summarize(time_call(indexed, repeat))}
+            results[f'{label} (scan)'] = summarize(time_call(scan, min(repeat, 3)))
+        transaction.set_rollback(True)
+    return results
+
+
+def bench_similar(options):
+    """
+    Exact top-5 cosine search over one user's stored vectors (decoding the
+    float32 bytes included) and HashingEmbedder throughput.
+    """
+    repeat = options['repeat']
+    rng = np.random.default_rng(0)
+    embedder = HashingEmbedder()
+    results = {}
+    for entries in (1_000, 10_000, 100_000):
+        matrix = normalize(rng.standard_normal((entries, embedder.dimensions)))
+        blob = matrix.tobytes()
+        search = lambda: top_k(np.frombuffer(blob, dtype=np.float32).reshape(entries, embedder.dimensions), matrix[0], 5)
+        results[f'top 5 of {entries} vectors'] = summarize(time_call(search, repeat))
+
+    texts = [' '.join(f'term{word}' for word in rng.zipf(1.3, 150) % 5000) for _ in range(100)]
+    results['embed 100 entries (hashing)'] = summarize(time_call(lambda: embedder.embed(texts), repeat))
+    return results
+
+
+def synthetic_users(users, journals, seed=0, words=60, vocabulary=2000):
+    """
+    Users with `journals` analyzed entries each, dated over the last two
+    years, with their snapshots and streaks built. Returns the users.
+    """
+    rng = np.random.default_rng(seed)
+    today = timezone.localdate()
+    created = []
+    for index in range(users):
+        user = User.objects.create_user(username=f'benchmark-{index}')
+        values = rng.dirichlet(np.ones(len(MOODS)), size=journals) * 100
+        stats = [MoodStats(*row.tolist(), dominantMood=MOODS[row.argmax()]) for row in values]
+        insights = Insight.objects.bulk_create([Insight(user=user, advice_messages=FAKE_ADVICE) for _ in range(journals)])
+        ages = rng.integers(0, 730, journals).tolist()
+        created_journals = Journal.objects.bulk_create([
+            Journal(
+                user=user, date=today - timedelta(days=age), title=f'Entry {number}',
+                content=' '.join(f'word{word}' for word in rng.integers(0, vocabulary, words)),
+                moodStats=stat, insights=insight,
+            )
+            for number, (age, stat, insight) in enumerate(zip(ages, stats, insights))
+        ])
+        store_snapshots(created_journals)
+        rebuild_streak(user)
+        created.append(user)
+    return created
+
+
+def send(client, requests):
+    """
+    Send (method, path, headers) requests one after another. Returns
+    throughput, latency percentiles and queries per request.
+    """
+    timings, queries = [], []
+    start = time.perf_counter()
+    for method, path, headers in requests:
+        timer = QueryTimer()
+        began = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = getattr(client, method)(path, headers=headers)
+        timings.append((time.perf_counter() - began) * 1000)
+        queries.append(timer.count)
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {path} returned {response.status_code}')
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(timings),
+        'req_per_s': round(len(timings) / elapsed, 1),
+        **percentiles(timings),
+        'queries': round(statistics.mean(queries), 1),
+        'max_queries': max(queries),
+    }
+
+
+def bench_endpoints(options):
+    """
+    The main endpoints through the whole middleware and view stack, signed
+    in with JWTs, for --users synthetic users with --journals entries each,
+    against a fake Gemini with --latency and --failure-rate. Each row sends
+    --repeat rounds of one request per user; the worker row then drains
+    --jobs of the queued emotion jobs. Everything is rolled back afterwards.
+    """
+    repeat = options['repeat']
+    fake = FakeGeminiClient(latency=options['latency'], failure_rate=options['failure_rate'], seed=options['seed'])
+    client = Client()
+    results = {}
+    with patch.object(gemini_utils, 'client', GeminiClient(raw=fake, base_delay=0.05)), \
+            patch.object(gemini_utils, 'llm_cache', LLMCache(None)), transaction.atomic():
+        users = synthetic_users(options['users'], options['journals'], options['seed'])
+        auth = {user.id: {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'} for user in users}
+
+        def rounds(path, method='get', count=repeat):
+            return [(method, path, auth[user.id]) for _ in range(count) for user in users]
+
+        results['journals'] = send(client, rounds('/api/journals/'))
+        etags = {user.id: client.get('/api/journals/', headers=auth[user.id])['ETag'] for user in users}
+        results['journals (304)'] = send(client, [
+            ('get', '/api/journals/', {**auth[user.id], 'If-None-Match': etags[user.id]}) for _ in range(repeat) for user in users
+        ])
+        results['users/me'] = send(client, rounds('/api/users/me/'))
+        results['greeting (generated)'] = send(client, rounds('/api/daily-greetings/today/', count=1))
+        results['greeting (stored)'] = send(client, rounds('/api/daily-greetings/today/'))
+
+        latest = {
+            user.id: list(Journal.objects.filter(user=user).order_by('-date', '-id').values_list('id', flat=True)[:repeat])
+            for user in users
+        }
+        results['process_emotions'] = send(client, [
+            ('post', f'/api/journals/{journal_id}/process_emotions/', auth[user.id])
+            for index in range(repeat) for user in users
+            for journal_id in latest[user.id][index:index + 1]
+        ])
+
+        calls = len(fake.calls)
+        start = time.perf_counter()
+        jobs = run_pending_jobs(limit=options['jobs'])
+        elapsed = time.perf_counter() - start
+        results['emotion jobs'] = {
+            'jobs': jobs,
+            'jobs_per_s': round(jobs / elapsed, 1) if jobs else 0,
+            'done': EmotionJob.objects.filter(user__in=users, status='done').count(),
+            'retrying': EmotionJob.objects.filter(user__in=users, status='pending', attempts__gt=0).count(),
+            'gemini_calls': len(fake.calls) - calls,
+        }
+        transaction.set_rollback(True)
+    return results
+
+
+def bench_json(options):
+    """
+    Rendering serialized journal lists (full entries, as an export would
+    send them) with DRF's JSONRenderer against FastJSONRenderer, and parsing
+    a 50-entry Gemini batch response with json against jsonlib. Without
+    orjson the second rows are labelled "fallback" and use json too.
+    """
+    repeat = options['repeat']
+    rng = np.random.default_rng(0)
+    backend = 'orjson' if jsonlib.orjson is not None else 'fallback'
+    results = {}
+    for entries in (200, 10_000):
+        journals = []
+        for index in range(entries):
+            values = rng.dirichlet(np.ones(len(MOODS))) * 100
+            journals.append(Journal(
+                id=index, user_id=1, date=datetime(2024, 1, 1).date() + timedelta(days=index % 700),
+                title=f'Entry {index}', content=' '.join(f'word{word}' for word in rng.integers(0, 2000, 150)),
+                moodStats=MoodStats(*values.tolist(), dominantMood=MOODS[values.argmax()]),
+                insights=Insight(id=index, user_id=1, advice_messages=FAKE_ADVICE),
+            ))
+        data = JournalSerializer(journals, many=True).data
+        for label, renderer in (('json', JSONRenderer()), (backend, FastJSONRenderer())):
+            results[f'render {entries}, {label}'] = {
+                **summarize(time_call(lambda: renderer.render(data), repeat)),
+                'kib': round(len(renderer.render(data)) / 1024),
+            }
+
+    response = default_responder(''.join(f'<entry id="{index}">' for index in range(50)))
+    results['parse batch, json'] = summarize(time_call(lambda: json.loads(response), repeat))
+    results[f'parse batch, {backend}'] = summarize(time_call(lambda: jsonlib.loads(response), repeat))
+    return results
+
+
+SCENARIOS = {
+    'concurrency': bench_concurrency,
+    'endpoints': bench_endpoints,
+    'greetings': bench_greetings,
+    'json': bench_json,
+    'search': bench_search,
+    'similar': bench_similar,
+    'trends': bench_trends,
+}
+
+
+OPTIONS = ('repeat', 'requests', 'latency', 'entries', 'sync_workers', 'users', 'journals', 'jobs', 'failure_rate', 'seed')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def changes(stats, before):
+    """Relative change of each timing (`_ms`) shared with a baseline row."""
+    return '  '.join(
+        f'{key}={(value - before[key]) / before[key]:+.1%}'
+        for key, value in stats.items()
+        if key.endswith('_ms') and before.get(key)
+    )
+
+
+class Command(BaseCommand):
+    help = 'Runs performance benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run, any of {", ".join(sorted(SCENARIOS))} (default: all)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+        parser.add_argument('--requests', type=int, default=200, help='Simultaneous requests in the concurrency scenario')
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds the fake Gemini takes per call')
+        parser.add_argument('--entries', type=int, default=1_000_000, help='Synthetic journals in the search scenario')
+        parser.add_argument('--sync-workers', type=int, default=4, help='Sync workers to compare against (gunicorn workers x threads)')
+        parser.add_argument('--users', type=int, default=10, help='Synthetic users in the endpoints scenario')
+        parser.add_argument('--journals', type=int, default=200, help='Journals per synthetic user')
+        parser.add_argument('--jobs', type=int, default=20, help='Emotion jobs the worker runs in the endpoints scenario')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of fake Gemini calls that fail with a 503')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for synthetic data and fake Gemini failures')
+        parser.add_argument('--json', metavar='PATH', help='Save the results as JSON')
+        parser.add_argument('--compare', metavar='PATH', help='Show timing changes against results saved with --json')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        results = {}
+        for name in options['scenarios'] or sorted(SCENARIOS):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results[name] = SCENARIOS[name](options)
+            for label, stats in results[name].items():
+                line = '  '.join(f'{key}={value}' for key, value in stats.items())
+                self.stdout.write(f'  {label:<28} {line}')
+                change = changes(stats, baseline.get(name, {}).get(label, {}))
+                if change:
+                    self.stdout.write(f'  {"":<28} vs baseline: {change}')
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({
+                    'created': timezone.now().isoformat(),
+                    'commit': git_commit(),
+                    'database': connection.vendor,
+                    'options': {key: options[key] for key in OPTIONS},
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(f'Saved results to {options["json"]}')
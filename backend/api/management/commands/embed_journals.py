@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from api.similarity import refresh_embeddings
+
+
+class Command(BaseCommand):
+    help = 'Embeds journals that have no similar-entry vector from the current embedder yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only embed journals of this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(journals__isnull=False).distinct()
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        embedded = sum(refresh_embeddings(user) for user in users.iterator())
+        self.stdout.write(self.style.SUCCESS(f'{embedded} journal(s) embedded'))
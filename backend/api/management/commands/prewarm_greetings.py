@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.greetings import active_users, prewarm_greetings, upcoming_slots
+
+
+class Command(BaseCommand):
+    help = 'Generates daily greetings for active users before each time period starts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit instead of looping')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between passes')
+        parser.add_argument('--lead', type=float, default=30.0, help='Minutes before a period starts to generate its greetings')
+        parser.add_argument('--active-days', type=int, default=7, help='Only users active within this many days')
+        parser.add_argument('--batch-size', type=int, default=50, help='Users whose rows are written together')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent Gemini requests')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at least 1')
+
+        while True:
+            now = timezone.now()
+            users = active_users(now - timedelta(days=options['active_days']))
+            # Periods start at different moments in each timezone
+            for tz_name in set(users.values_list('profile__timezone', flat=True)) - {None}:
+                tz_users = users.filter(profile__timezone=tz_name)
+                for slot in upcoming_slots(now, lead=timedelta(minutes=options['lead']), tz_name=tz_name):
+                    count = prewarm_greetings(
+                        tz_users, slot, tz_name, batch_size=options['batch_size'], workers=options['workers']
+                    )
+                    if count:
+                        self.stdout.write(self.style.SUCCESS(
+                            f'Generated {slot[1]} greetings for {slot[0]} ({tz_name}) for {count} user(s)'
+                        ))
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from api.jobs import run_pending_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued emotion processing jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s)'))
+
+            processed = run_pending_jobs()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
+
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from api.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes mood rollups from existing journals' moods"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        for user in users.iterator():
+            buckets = rebuild_rollups(user)
+            self.stdout.write(f'{user.username}: {buckets} rollup(s)')
+        self.stdout.write(self.style.SUCCESS('Mood rollups rebuilt'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from api.models import Journal, UserStreak
+from api.streaks import rebuild_streak, reference_streaks
+
+
+def stored_streak(user):
+    streak = UserStreak.objects.filter(user=user).first()
+    if streak is None:
+        return 0, 0, None
+    return streak.current_streak, streak.longest_streak, streak.last_journal_date
+
+
+class Command(BaseCommand):
+    help = 'Recomputes journal streaks from scratch and verifies them against the journals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only recompute streaks for this username')
+        parser.add_argument('--check', action='store_true', help='Only report users whose stored streak is wrong')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        mismatches = 0
+        for user in users.iterator():
+            expected = reference_streaks(Journal.objects.filter(user=user).values_list('date', flat=True))
+            if options['check']:
+                actual = stored_streak(user)
+            else:
+                rebuild_streak(user)
+                actual = stored_streak(user)
+            if actual != expected:
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(f'{user.username}: stored {actual}, expected {expected}'))
+
+        if options['check']:
+            self.stdout.write(f'{mismatches} user(s) with a wrong streak')
+        elif mismatches:
+            raise CommandError(f'{mismatches} streak(s) still wrong after recomputing')
+        else:
+            self.stdout.write(self.style.SUCCESS('Streaks recomputed'))
@@ -0,0 +1,59 @@
+import os
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Journal
+from api.reprocess import reprocess_journals
+from gemini_wrapper.client import GeminiUnavailable
+
+
+class Command(BaseCommand):
+    help = 'Analyzes journals in batches, skipping ones whose content is already processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only process journals of this username')
+        parser.add_argument('--since', help='Only process journals dated on or after YYYY-MM-DD')
+        parser.add_argument('--force', action='store_true', help='Reprocess journals even if their content is unchanged')
+        parser.add_argument('--batch-size', type=int, default=10, help='Journals per Gemini request')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent Gemini requests')
+        parser.add_argument('--checkpoint', help='File recording the last committed journal id')
+        parser.add_argument('--resume', action='store_true', help='Continue after the id stored in --checkpoint')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at least 1')
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume requires --checkpoint')
+
+        journals = Journal.objects.all()
+        if options['user']:
+            journals = journals.filter(user__username=options['user'])
+        if options['since']:
+            try:
+                journals = journals.filter(date__gte=date.fromisoformat(options['since']))
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        checkpoint = options['checkpoint']
+        if checkpoint and not options['resume'] and os.path.exists(checkpoint):
+            # A fresh run starts from the beginning and overwrites the checkpoint
+            os.remove(checkpoint)
+
+        committed = [0]
+
+        def report(count, last_id):
+            committed[0] += count
+            self.stdout.write(f'Processed {count} journal(s) up to id {last_id}')
+
+        try:
+            total = reprocess_journals(
+                journals,
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                force=options['force'],
+                checkpoint=checkpoint,
+                on_batch=report,
+            )
+        except GeminiUnavailable as e:
+            hint = ' Run again with --resume to continue.' if checkpoint else ''
+            raise CommandError(f'Stopped after {committed[0]} journal(s): {e}.{hint}')
+        self.stdout.write(self.style.SUCCESS(f'{total} journal(s) processed'))
@@ -0,0 +1,137 @@
+"""
+Per-request timing and the /metrics endpoint.
+
+RequestMetricsMiddleware times every request and counts and times the
+queries it runs, labelled by the view name (so `journal-list`, not each
+URL). Every database connection gets an execute wrapper when it is created,
+which charges its queries to the request in the current context. Contexts
+follow sync_to_async into the thread pool, so async views' queries are
+counted too. Requests slower than SLOW_REQUEST_SECONDS are also logged with
+their query figures.
+
+/metrics serves these together with the Gemini call metrics from
+gemini_wrapper in the Prometheus text format. It requires METRICS_TOKEN as
+a bearer token, and is only open without one when DEBUG is on.
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotFound
+from gemini_wrapper.metrics import REGISTRY, Histogram
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '1.0'))
+
+REQUEST_SECONDS = Histogram('http_request_seconds', 'Time to build each response', ['method', 'view', 'status'])
+DB_QUERIES = Histogram(
+    'http_db_queries', 'Database queries per request', ['method', 'view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_SECONDS = Histogram('http_db_seconds', 'Time per request spent in database queries', ['method', 'view'])
+
+
+class QueryTimer:
+    """Connection execute_wrapper that counts and times queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+_request_timer = ContextVar('request_query_timer', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def instrument(connection):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument(connection)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported didn't get the signal
+        for connection in connections.all(initialized_only=True):
+            instrument(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        timer, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self.finish(request, response, timer, start)
+
+    def start(self):
+        timer = QueryTimer()
+        return timer, _request_timer.set(timer), time.perf_counter()
+
+    def finish(self, request, response, timer, start):
+        elapsed = time.perf_counter() - start
+        view = view_label(request)
+        REQUEST_SECONDS.observe(elapsed, method=request.method, view=view, status=response.status_code)
+        DB_QUERIES.observe(timer.count, method=request.method, view=view)
+        DB_SECONDS.observe(timer.seconds, method=request.method, view=view)
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            logger.warning(
+                'Slow request: %s %s took %.2fs with %d queries (%.2fs in the database)',
+                request.method, view, elapsed, timer.count, timer.seconds,
+            )
+        return response
+
+
+def metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        return HttpResponseNotFound()
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=403)
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
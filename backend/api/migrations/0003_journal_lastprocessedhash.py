@@ -0,0 +1,38 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_hashes(apps, schema_editor):
+    Journal = apps.get_model('api', 'Journal')
+    processed = Journal.objects.exclude(lastProcessedContent__isnull=True).only('id', 'lastProcessedContent')
+    batch = []
+    for journal in processed.iterator(chunk_size=1000):
+        journal.lastProcessedHash = hashlib.sha256(journal.lastProcessedContent.encode('utf-8')).hexdigest()
+        batch.append(journal)
+        if len(batch) >= 1000:
+            Journal.objects.bulk_update(batch, ['lastProcessedHash'])
+            batch = []
+    if batch:
+        Journal.objects.bulk_update(batch, ['lastProcessedHash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_emotionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journal',
+            name='lastProcessedHash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        # Rows that were never processed keep a NULL hash and are processed on the next request.
+        migrations.RunPython(backfill_hashes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='journal',
+            name='lastProcessedContent',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_journal_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('entry_count', models.IntegerField(default=0)),
+                ('sumHappiness', models.FloatField(default=0.0)),
+                ('sumFear', models.FloatField(default=0.0)),
+                ('sumSadness', models.FloatField(default=0.0)),
+                ('sumDisgust', models.FloatField(default=0.0)),
+                ('sumAnger', models.FloatField(default=0.0)),
+                ('happyCount', models.IntegerField(default=0)),
+                ('fearCount', models.IntegerField(default=0)),
+                ('sadCount', models.IntegerField(default=0)),
+                ('disgustCount', models.IntegerField(default=0)),
+                ('angerCount', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'period', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_moodrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailygreeting',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+    ]
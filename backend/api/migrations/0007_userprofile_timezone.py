@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_dailygreeting_date_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='timezone',
+            field=models.CharField(default='Asia/Manila', max_length=64),
+        ),
+    ]
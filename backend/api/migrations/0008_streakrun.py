@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:30
+
+from datetime import timedelta
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def runs_from_dates(dates):
+    """Frozen copy of api.streaks.runs_from_dates."""
+    runs = []
+    for day in dates:
+        if runs and runs[-1][1] == day - timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def build_runs(apps, schema_editor):
+    # Seed runs and streaks from existing journals; recompute_streaks does the same later on
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Journal = apps.get_model('api', 'Journal')
+    StreakRun = apps.get_model('api', 'StreakRun')
+    UserStreak = apps.get_model('api', 'UserStreak')
+    for user in User.objects.iterator():
+        dates = Journal.objects.filter(user=user).order_by('date').values_list('date', flat=True).distinct()
+        runs = [
+            StreakRun(user=user, start=start, end=end, length=(end - start).days + 1)
+            for start, end in runs_from_dates(list(dates))
+        ]
+        StreakRun.objects.bulk_create(runs)
+        latest = runs[-1] if runs else None
+        UserStreak.objects.update_or_create(user=user, defaults={
+            'current_streak': latest.length if latest else 0,
+            'longest_streak': max((run.length for run in runs), default=0),
+            'last_journal_date': latest.end if latest else None,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_userprofile_timezone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreakRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('length', models.IntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='streak_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'start'], name='streakrun_user_start_idx'), models.Index(fields=['user', 'end'], name='streakrun_user_end_idx'), models.Index(fields=['user', 'length'], name='streakrun_user_length_idx')],
+            },
+        ),
+        migrations.RunPython(build_runs, migrations.RunPython.noop),
+    ]
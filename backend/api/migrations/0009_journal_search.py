@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# Frozen copies of the DDL in api.search
+SEARCH_CONFIG = 'english'
+POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE api_journal ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS journal_search_idx ON api_journal USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS journal_search_idx",
+    "ALTER TABLE api_journal DROP COLUMN IF EXISTS search_vector",
+]
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_journal_fts USING fts5("
+    "title, content, content='api_journal', content_rowid='id', tokenize='porter unicode61')",
+    """
+    CREATE TRIGGER IF NOT EXISTS api_journal_fts_insert AFTER INSERT ON api_journal BEGIN
+        INSERT INTO api_journal_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_journal_fts_delete AFTER DELETE ON api_journal BEGIN
+        INSERT INTO api_journal_fts(api_journal_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_journal_fts_update AFTER UPDATE OF title, content ON api_journal BEGIN
+        INSERT INTO api_journal_fts(api_journal_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO api_journal_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    "INSERT INTO api_journal_fts(api_journal_fts) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS api_journal_fts_insert",
+    "DROP TRIGGER IF EXISTS api_journal_fts_delete",
+    "DROP TRIGGER IF EXISTS api_journal_fts_update",
+    "DROP TABLE IF EXISTS api_journal_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements.get(schema_editor.connection.vendor, []):
+                cursor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over journal titles and content: a generated tsvector
+    column with a GIN index on PostgreSQL, an FTS5 table kept in sync by
+    triggers on SQLite. See api/search.py.
+    """
+
+    dependencies = [
+        ('api', '0008_streakrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}),
+            run({'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
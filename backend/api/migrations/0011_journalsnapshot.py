@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_journalembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalSnapshot',
+            fields=[
+                ('journal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='api.journal')),
+                ('detail', models.TextField()),
+                ('summary', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+import struct
+from django.db import migrations, models
+
+# Frozen copies of api.models.MOOD_FIELDS, MOODS and MoodStats.PACKING
+MOOD_FIELDS = ('percentHappiness', 'percentFear', 'percentSadness', 'percentDisgust', 'percentAnger')
+MOODS = ('happy', 'fear', 'sad', 'disgust', 'anger')
+PACKING = struct.Struct('<5H')
+BATCH_SIZE = 1000
+
+
+def pack_moods(apps, schema_editor):
+    Journal = apps.get_model('api', 'Journal')
+    JournalSnapshot = apps.get_model('api', 'JournalSnapshot')
+    db = schema_editor.connection.alias
+
+    journals = Journal.objects.using(db).filter(moodStats__isnull=False).select_related('moodStats').order_by('pk')
+    batch = []
+    for journal in journals.iterator(chunk_size=BATCH_SIZE):
+        stat = journal.moodStats
+        journal.mood = PACKING.pack(*(round(min(max(getattr(stat, field), 0.0), 100.0) * 100) for field in MOOD_FIELDS))
+        journal.dominant_mood = MOODS.index(stat.dominantMood) if stat.dominantMood in MOODS else -1
+        batch.append(journal)
+        if len(batch) >= BATCH_SIZE:
+            Journal.objects.using(db).bulk_update(batch, ['mood', 'dominant_mood'])
+            batch = []
+    Journal.objects.using(db).bulk_update(batch, ['mood', 'dominant_mood'])
+
+    # Snapshots embed the MoodStat id; they are re-rendered on the next read
+    JournalSnapshot.objects.using(db).all().delete()
+
+
+def unpack_moods(apps, schema_editor):
+    Journal = apps.get_model('api', 'Journal')
+    MoodStat = apps.get_model('api', 'MoodStat')
+    JournalSnapshot = apps.get_model('api', 'JournalSnapshot')
+    db = schema_editor.connection.alias
+
+    for journal in Journal.objects.using(db).filter(mood__isnull=False).iterator(chunk_size=BATCH_SIZE):
+        values = dict(zip(MOOD_FIELDS, (value / 100 for value in PACKING.unpack(bytes(journal.mood)))))
+        dominant = MOODS[journal.dominant_mood] if journal.dominant_mood is not None and journal.dominant_mood >= 0 else ''
+        journal.moodStats = MoodStat.objects.using(db).create(**values, dominantMood=dominant)
+        journal.save(update_fields=['moodStats'])
+    JournalSnapshot.objects.using(db).all().delete()
+
+
+class Migration(migrations.Migration):
+    """
+    Move MoodStat rows inline onto Journal: the five percentages packed as
+    uint16 basis points in `mood` and the dominant mood as a MOODS index in
+    `dominant_mood`. See api.models.MoodStats. The MoodStat table is
+    dropped in 0013, in its own transaction.
+    """
+
+    dependencies = [
+        ('api', '0011_journalsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journal',
+            name='mood',
+            field=models.BinaryField(blank=True, editable=False, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='journal',
+            name='dominant_mood',
+            field=models.SmallIntegerField(blank=True, choices=[(-1, 'tie'), (0, 'happy'), (1, 'fear'), (2, 'sad'), (3, 'disgust'), (4, 'anger')], null=True),
+        ),
+        migrations.RunPython(pack_moods, unpack_moods),
+    ]
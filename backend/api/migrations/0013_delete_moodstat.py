@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_journal_mood'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='journal',
+            name='moodStats',
+        ),
+        migrations.DeleteModel(
+            name='MoodStat',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:16
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_delete_moodstat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='emotionjob',
+            name='api_emotion_status_e3a0ec_idx',
+        ),
+        migrations.AddField(
+            model_name='emotionjob',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='emotionjob',
+            index=models.Index(fields=['status', 'run_after'], name='api_emotion_status_903bb1_idx'),
+        ),
+    ]
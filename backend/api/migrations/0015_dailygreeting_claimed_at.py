@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_emotionjob_run_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailygreeting',
+            name='claimed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
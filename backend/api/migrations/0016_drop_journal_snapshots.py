@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def drop_snapshots(apps, schema_editor):
+    # The stored JSON predates the `id` in moodStats; snapshots are re-rendered on the next read
+    JournalSnapshot = apps.get_model('api', 'JournalSnapshot')
+    JournalSnapshot.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_dailygreeting_claimed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_snapshots, drop_snapshots),
+    ]
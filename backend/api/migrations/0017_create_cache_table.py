@@ -0,0 +1,22 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # The default cache is a DatabaseCache unless REDIS_URL is set; this does nothing for other backends
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+    """
+    Create the DatabaseCache table on migrate, so user versions for
+    conditional GET work without a separate `createcachetable` step.
+    """
+
+    dependencies = [
+        ('api', '0016_drop_journal_snapshots'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
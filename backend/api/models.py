@@ -1,13 +1,66 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
+import hashlib
+import struct
+
+MOOD_FIELDS = ('percentHappiness', 'percentFear', 'percentSadness', 'percentDisgust', 'percentAnger')
+MOODS = ('happy', 'fear', 'sad', 'disgust', 'anger')
+MOOD_CODES = {mood: code for code, mood in enumerate(MOODS)}
+NO_MOOD = -1  # Ties and unprocessed entries have no dominant mood
+
+
+def content_fingerprint(content):
+    """Fixed-size digest of a journal body, used to tell whether it has changed since processing."""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+
+class MoodStats:
+    """
+    A journal's mood percentages, stored inline on Journal.
+
+    Journal.mood packs the five percentages in MOOD_FIELDS order as
+    little-endian uint16 basis points (10 bytes), and Journal.dominant_mood
+    holds the MOODS index of the dominant mood, or NO_MOOD for a tie. `id`
+    is the journal's, in place of the primary key MoodStat rows had.
+    """
+    __slots__ = (*MOOD_FIELDS, 'dominantMood', 'id')
+    PACKING = struct.Struct('<5H')
+
+    def __init__(self, percentHappiness, percentFear, percentSadness, percentDisgust, percentAnger, dominantMood='', id=None):
+        self.percentHappiness = percentHappiness
+        self.percentFear = percentFear
+        self.percentSadness = percentSadness
+        self.percentDisgust = percentDisgust
+        self.percentAnger = percentAnger
+        self.dominantMood = dominantMood
+        self.id = id
+
+    def pack(self):
+        """Return the (mood, dominant_mood) column values."""
+        basis_points = (round(min(max(getattr(self, field), 0.0), 100.0) * 100) for field in MOOD_FIELDS)
+        return self.PACKING.pack(*basis_points), MOOD_CODES.get(self.dominantMood, NO_MOOD)
+
+    @classmethod
+    def unpack(cls, packed, code, id=None):
+        values = (value / 100 for value in cls.PACKING.unpack(bytes(packed)))
+        return cls(*values, dominantMood=MOODS[code] if code is not None and code >= 0 else '', id=id)
+
+    def __eq__(self, other):
+        if not isinstance(other, MoodStats):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in (*MOOD_FIELDS, 'dominantMood'))
+
+    def __str__(self):
+        return self.dominantMood
 
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     has_seen_welcome = models.BooleanField(default=False)
+    timezone = models.CharField(max_length=64, default='Asia/Manila')  # IANA name; greetings follow the user's local time
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -16,24 +69,61 @@ class Journal(models.Model):
     title = models.CharField(max_length=200)
     date = models.DateField()
     content = models.TextField()
-    lastProcessedContent = models.TextField(null=True, blank=True) # For checking if the content has been processed to avoid processing the same content multiple times
+    lastProcessedHash = models.CharField(max_length=64, null=True, blank=True) # content_fingerprint of the last processed content, to avoid processing the same content multiple times
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='journals')
-    moodStats = models.OneToOneField('MoodStat', on_delete=models.CASCADE, related_name='journal', null=True, blank=True)
+    mood = models.BinaryField(max_length=MoodStats.PACKING.size, null=True, blank=True, editable=False)  # MoodStats.pack(); null until processed
+    dominant_mood = models.SmallIntegerField(null=True, blank=True, choices=[(NO_MOOD, 'tie'), *enumerate(MOODS)])
     insights = models.OneToOneField('Insight', on_delete=models.CASCADE, related_name='journal', null=True, blank=True)
 
     def __str__(self):
         return self.title
 
-class MoodStat(models.Model):
-    percentHappiness = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
-    percentFear = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
-    percentSadness = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
-    percentDisgust = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
-    percentAnger = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
-    dominantMood = models.CharField(max_length=200)
+    @property
+    def moodStats(self):
+        if self.mood is None:
+            return None
+        return MoodStats.unpack(self.mood, self.dominant_mood, self.pk)
+
+    @moodStats.setter
+    def moodStats(self, value):
+        self.mood, self.dominant_mood = value.pack() if value is not None else (None, None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='journal_user_date_idx'),
+            models.Index(fields=['user', '-id'], name='journal_user_recent_idx'),
+        ]
+
+class JournalEmbedding(models.Model):
+    """
+    Unit-length float32 embedding of a journal's title and content, stored as
+    raw bytes. Dropped when the text changes and recomputed on the next
+    similar-entries request. Maintained by api/similarity.py.
+    """
+    journal = models.OneToOneField(Journal, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='journal_embeddings')
+    embedder = models.CharField(max_length=64)  # Embedder.name; vectors of different embedders aren't comparable
+    vector = models.BinaryField()
 
     def __str__(self):
-        return self.dominantMood
+        return f"Embedding for {self.journal_id} ({self.embedder})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'embedder'], name='embedding_user_embedder_idx'),
+        ]
+
+class JournalSnapshot(models.Model):
+    """
+    A journal's detail and list JSON, rendered ahead of time so the read
+    endpoints can send it as is. Maintained by api/snapshots.py.
+    """
+    journal = models.OneToOneField(Journal, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    detail = models.TextField()  # JournalSerializer output
+    summary = models.TextField()  # JournalListSerializer output
+
+    def __str__(self):
+        return f"Snapshot of {self.journal_id}"
 
 class Insight(models.Model):
     advice_messages = models.JSONField(default=list)  # List of advice messages
@@ -51,25 +141,26 @@ class UserStreak(models.Model):
     def __str__(self):
         return f"{self.user.username}'s streak: {self.current_streak}"
 
-    def update_streak(self, journal_date):
-        if not self.last_journal_date:
-            self.current_streak = 1
-        else:
-            # Calculate days between last journal and new journal
-            days_diff = (journal_date - self.last_journal_date).days
-            
-            if days_diff == 1:  # Consecutive day
-                self.current_streak += 1
-            elif days_diff > 1:  # Streak broken
-                self.current_streak = 1
-            # If days_diff == 0, it's the same day, don't update streak
-        
-        # Update longest streak if current streak is higher
-        if self.current_streak > self.longest_streak:
-            self.longest_streak = self.current_streak
-        
-        self.last_journal_date = journal_date
-        self.save()
+class StreakRun(models.Model):
+    """
+    A maximal run of consecutive days with at least one journal. A user's
+    runs never overlap or touch, so streaks are read off the latest and the
+    longest run instead of scanning journals. Maintained by api/streaks.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='streak_runs')
+    start = models.DateField()
+    end = models.DateField()
+    length = models.IntegerField()  # Days from start to end inclusive
+
+    def __str__(self):
+        return f"{self.user.username}: {self.start} to {self.end}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start'], name='streakrun_user_start_idx'),
+            models.Index(fields=['user', 'end'], name='streakrun_user_end_idx'),
+            models.Index(fields=['user', 'length'], name='streakrun_user_length_idx'),
+        ]
 
 @receiver(post_save, sender=User)
 def create_user_streak(sender, instance, created, **kwargs):
@@ -89,11 +180,67 @@ class DailyGreeting(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_greetings')
     greetings = models.JSONField(default=list)  # List of greeting messages
-    date = models.DateField(auto_now_add=True)  # Date when greetings were generated
+    date = models.DateField(default=timezone.localdate)  # Date the greetings are for
     time_period = models.CharField(max_length=10, choices=TIME_PERIODS, default='morning')
+    claimed_at = models.DateTimeField(default=timezone.now)  # When generation started; an empty row whose claim lapsed may be taken over
 
     def __str__(self):
         return f"Daily greetings for {self.user.username} on {self.date} ({self.time_period})"
 
     class Meta:
         unique_together = ['user', 'date', 'time_period']  # One set of greetings per user per day per time period
+
+
+class EmotionJob(models.Model):
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    journal = models.ForeignKey(Journal, on_delete=models.CASCADE, related_name='emotion_jobs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='emotion_jobs')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    run_after = models.DateTimeField(default=timezone.now)  # Failed attempts are retried after a backoff
+
+    def __str__(self):
+        return f"Emotion job {self.id} for journal {self.journal_id} ({self.status})"
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]  # Workers poll for the oldest pending job that is due
+
+
+class MoodRollup(models.Model):
+    """Running totals of journal mood values per user and day/week/month, maintained by api.analytics."""
+    PERIODS = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mood_rollups')
+    period = models.CharField(max_length=5, choices=PERIODS)
+    period_start = models.DateField()
+    entry_count = models.IntegerField(default=0)
+    sumHappiness = models.FloatField(default=0.0)
+    sumFear = models.FloatField(default=0.0)
+    sumSadness = models.FloatField(default=0.0)
+    sumDisgust = models.FloatField(default=0.0)
+    sumAnger = models.FloatField(default=0.0)
+    happyCount = models.IntegerField(default=0)
+    fearCount = models.IntegerField(default=0)
+    sadCount = models.IntegerField(default=0)
+    disgustCount = models.IntegerField(default=0)
+    angerCount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.period} mood rollup from {self.period_start}"
+
+    class Meta:
+        unique_together = ['user', 'period', 'period_start']
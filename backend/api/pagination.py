@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class JournalCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-id', '-date')
+
+
+class JournalSearchPagination(PageNumberPagination):
+    """Search results are ordered by rank, which a cursor can't page through."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,101 @@
+import codecs
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from gemini_wrapper import jsonlib
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets clients ask for `text/event-stream` on streaming actions. The actions
+    return their own StreamingHttpResponse; this renderer only formats the
+    responses DRF builds itself, such as authentication errors and 404s.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event('error', data).encode(self.charset)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson. The bytes are the same as JSONRenderer's with the
+    default COMPACT_JSON and UNICODE_JSON settings; with other settings, for
+    indented output (the browsable API) or without orjson, JSONRenderer does
+    the work. Unlike JSONRenderer, NaN and infinity come out as null instead
+    of raising.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (jsonlib.orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = jsonlib.dumps(data, default=self.encoder_class().default)
+        # Escaped like JSONRenderer does, as these two break JavaScript string literals
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser on orjson, or JSONParser itself without it."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if jsonlib.orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            if codecs.lookup(encoding).name != 'utf-8':
+                body = body.decode(encoding)
+            return jsonlib.loads(body)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+_END = object()
+
+
+async def _pull(events):
+    """
+    Async iterator over a sync iterable that fetches each item in a thread as
+    it is needed. Given a sync iterator, Django's ASGI handler would collect
+    the whole body before sending any of it. The thread is the request's own
+    (thread_sensitive), so the iterator's database connection stays put.
+    """
+    iterator = iter(events)
+    try:
+        while (item := await sync_to_async(next)(iterator, _END)) is not _END:
+            yield item
+    finally:
+        # Runs the generator's cleanup when the client disconnects, like WSGI's close()
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+def event_stream(events, request=None):
+    """
+    Stream an iterable of sse_event() strings to the client without
+    buffering. Pass the request so that under ASGI the events are sent
+    through an async iterator.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        events = _pull(events)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies from holding events back
+    return response
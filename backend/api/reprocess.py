@@ -0,0 +1,163 @@
+"""
+Bulk (re)processing of journals.
+
+Journals are packed several to a Gemini request, batches run on a bounded
+thread pool, and each finished batch is written with bulk_create/bulk_update
+in one transaction. Batches are committed in id order, so the highest id of
+the last committed batch is a safe checkpoint to resume from. A journal
+Gemini can't analyze stops the run before its batch is saved, so an outage
+never overwrites stored analyses with the defaults.
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from django.db import transaction
+from gemini_wrapper.client import GeminiUnavailable
+from gemini_wrapper.gemini_utils import analysis_fell_back, get_batch_journal_analysis, analyze_journal_combined
+from .models import Journal, MoodStats, Insight, content_fingerprint
+from .emotions import mood_stats_from_emotions
+from .analytics import apply_mood_changes, mood_values
+from .conditional import bump_user_version
+from .snapshots import store_snapshots
+
+MAX_BATCH_CHARS = 30000  # Keep packed prompts well inside the model's input window
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f).get('last_id', 0)
+
+
+def write_checkpoint(path, last_id):
+    if not path:
+        return
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id}, f)
+    os.replace(tmp_path, path)
+
+
+def iter_batches(journals, batch_size):
+    """Group journals into batches limited by count and total text size."""
+    batch, size = [], 0
+    for journal in journals:
+        if batch and (len(batch) >= batch_size or size + len(journal.content) > MAX_BATCH_CHARS):
+            yield batch
+            batch, size = [], 0
+        batch.append(journal)
+        size += len(journal.content)
+    if batch:
+        yield batch
+
+
+def analyze_batch(journals):
+    """
+    Analyze a batch in one request; entries the batch response missed are
+    retried one by one. Raises GeminiUnavailable if one of them only got the
+    default analysis.
+    """
+    results = get_batch_journal_analysis({str(journal.id): journal.content for journal in journals})
+    analyses = {}
+    for journal in journals:
+        emotions, advice_list = results.get(str(journal.id)) or analyze_journal_combined(journal.content)
+        if analysis_fell_back(emotions, advice_list):
+            raise GeminiUnavailable(f"Gemini could not analyze journal {journal.id}")
+        analyses[journal.id] = (mood_stats_from_emotions(emotions), list(advice_list))
+    return analyses
+
+
+def save_batch(journals, analyses):
+    """
+    Write a batch of analyses with a constant number of queries.
+
+    The rows are locked and read again first: the analysis ran outside the
+    transaction, and the rollup deltas must start from the date and mood the
+    journal has now, not the ones it had when the batch was read.
+    """
+    analyzed = {journal.id: journal.content for journal in journals}
+
+    with transaction.atomic():
+        journals = list(
+            Journal.objects.select_for_update(of=('self',))
+            .select_related('insights')
+            .filter(id__in=analyzed)  # Journals deleted meanwhile drop out here
+            .order_by('id')
+        )
+        new_insights, updated_insights, rollup_changes = [], [], []
+
+        for journal in journals:
+            mood_stats, advice_list = analyses[journal.id]
+            previous = mood_values(journal.moodStats)
+            journal.moodStats = MoodStats(**mood_stats)
+
+            if journal.insights:
+                journal.insights.advice_messages = advice_list
+                updated_insights.append(journal.insights)
+            else:
+                journal.insights = Insight(advice_messages=advice_list, user_id=journal.user_id)
+                new_insights.append(journal.insights)
+
+            # Fingerprint what was analyzed; content edited since stays unprocessed
+            journal.lastProcessedHash = content_fingerprint(analyzed[journal.id])
+            rollup_changes.append((journal.user_id, journal.date, previous, journal.date, mood_values(journal.moodStats)))
+
+        Insight.objects.bulk_create(new_insights)
+        Insight.objects.bulk_update(updated_insights, ['advice_messages'])
+        for journal in journals:
+            # Re-assign so the FK ids pick up primary keys set by bulk_create
+            journal.insights = journal.insights
+        Journal.objects.bulk_update(journals, ['mood', 'dominant_mood', 'insights', 'lastProcessedHash'])
+        apply_mood_changes(rollup_changes)
+        store_snapshots(journals)
+        bump_user_version(*(journal.user_id for journal in journals))
+
+
+def reprocess_journals(queryset, batch_size=10, workers=4, force=False, checkpoint=None, on_batch=None):
+    """
+    Analyze and save every journal in `queryset` with an id above the checkpoint.
+
+    Unless `force` is set, journals whose content was already processed are
+    skipped. `on_batch(count, last_id)` is called after each committed batch.
+    Returns the number of journals processed. GeminiUnavailable from a batch
+    is raised once the batches before it are committed; that batch and the
+    rest are left as they were, and so is the checkpoint.
+    """
+    start_after = read_checkpoint(checkpoint)
+    journals = (
+        queryset.filter(id__gt=start_after)
+        .select_related('insights')
+        .order_by('id')
+    )
+    if not force:
+        journals = (journal for journal in journals.iterator(chunk_size=500)
+                    if journal.lastProcessedHash != content_fingerprint(journal.content))
+    else:
+        journals = journals.iterator(chunk_size=500)
+
+    processed = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reprocess') as pool:
+        def commit_oldest():
+            batch, future = pending.popleft()
+            save_batch(batch, future.result())
+            write_checkpoint(checkpoint, batch[-1].id)
+            if on_batch:
+                on_batch(len(batch), batch[-1].id)
+            return len(batch)
+
+        try:
+            for batch in iter_batches(journals, batch_size):
+                pending.append((batch, pool.submit(analyze_batch, batch)))
+                # Keep a bounded window of batches in flight, committing strictly in order
+                if len(pending) >= workers * 2:
+                    processed += commit_oldest()
+            while pending:
+                processed += commit_oldest()
+        except BaseException:
+            # Don't start the batches still queued; their results would be discarded
+            pool.shutdown(cancel_futures=True)
+            raise
+    return processed
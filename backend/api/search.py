@@ -0,0 +1,133 @@
+"""
+Full-text search over journal titles and bodies.
+
+The index is maintained by the database itself, so every save, bulk_update
+and delete is searchable straight away without application code:
+
+- PostgreSQL: a generated `search_vector` tsvector column on api_journal
+  (title weighted above content) with a GIN index, ranked with ts_rank.
+- SQLite: an external-content FTS5 table kept in sync by triggers, ranked
+  with bm25.
+
+Migration 0009 installs whichever applies, from its own frozen copy of the
+DDL below. Other databases fall back to an unranked icontains scan.
+"""
+import re
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+TERM_RE = re.compile(r'\w+')
+
+POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE api_journal ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS journal_search_idx ON api_journal USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS journal_search_idx",
+    "ALTER TABLE api_journal DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS api_journal_fts_insert AFTER INSERT ON api_journal BEGIN
+        INSERT INTO api_journal_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_journal_fts_delete AFTER DELETE ON api_journal BEGIN
+        INSERT INTO api_journal_fts(api_journal_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_journal_fts_update AFTER UPDATE OF title, content ON api_journal BEGIN
+        INSERT INTO api_journal_fts(api_journal_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO api_journal_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+]
+SQLITE_TRIGGER_NAMES = ('api_journal_fts_insert', 'api_journal_fts_delete', 'api_journal_fts_update')
+SQLITE_UNINSTALL = [f"DROP TRIGGER IF EXISTS {name}" for name in SQLITE_TRIGGER_NAMES] + ["DROP TABLE IF EXISTS api_journal_fts"]
+
+
+def install_search_index(connection):
+    """Create the search index for the connection's database and fill it from existing journals."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS api_journal_fts USING fts5("
+                "title, content, content='api_journal', content_rowid='id', tokenize='porter unicode61')"
+            )
+            for sql in SQLITE_TRIGGERS:
+                cursor.execute(sql)
+            cursor.execute("INSERT INTO api_journal_fts(api_journal_fts) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def repair_search_index(connection):
+    """
+    SQLite drops a table's triggers when a migration rebuilds the table, which
+    would silently freeze the FTS index. Reinstall and refill it if any
+    trigger is missing. Runs after every migrate.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if 'api_journal' not in tables or 'api_journal_fts' not in tables:
+            return  # Not migrated that far yet
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_journal'")
+        if set(SQLITE_TRIGGER_NAMES) <= {row[0] for row in cursor.fetchall()}:
+            return
+    install_search_index(connection)
+
+
+def search_terms(query):
+    return TERM_RE.findall(query or '')
+
+
+def search_journals(queryset, query):
+    """
+    Restrict a Journal queryset to entries matching every word of `query`,
+    annotated with `rank` (higher is more relevant).
+    """
+    vendor = connections[queryset.db].vendor
+    terms = search_terms(query)
+    if vendor == 'postgresql':
+        tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+        text = ' '.join(terms)
+        return queryset.filter(
+            RawSQL(f"api_journal.search_vector @@ {tsquery}", [text], output_field=BooleanField())
+        ).annotate(rank=RawSQL(f"ts_rank(api_journal.search_vector, {tsquery})", [text], output_field=FloatField()))
+
+    if vendor == 'sqlite':
+        # Join the FTS table so the MATCH runs once. The unary + hides the rowid
+        # constraint from FTS5, otherwise SQLite probes the index once per
+        # journal. bm25 is lower for better matches; titles count 2.5 times
+        # as much as content. Quoting each word keeps FTS5 operators literal.
+        match = ' '.join(f'"{term}"' for term in terms)
+        return queryset.extra(
+            tables=['api_journal_fts'],
+            where=['+api_journal_fts.rowid = api_journal.id', 'api_journal_fts MATCH %s'],
+            params=[match],
+            select={'rank': '-bm25(api_journal_fts, 2.5, 1.0)'},
+        )
+
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(content__icontains=term))
+    return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
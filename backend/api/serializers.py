@@ -1,11 +1,36 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import Journal, MoodStat, Insight, UserStreak, UserProfile, DailyGreeting
+from .models import Journal, Insight, UserStreak, UserProfile, DailyGreeting, EmotionJob
+
+def _split_param(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+class DynamicFieldsMixin:
+    """
+    Lets the request shape the output:
+    ?fields=a,b keeps only the listed fields and
+    ?expand=x,y adds fields declared in Meta.expandable_fields.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expand = _split_param(request.query_params.get('expand')) & set(expandable)
+        for name in expand:
+            self.fields[name] = expandable[name](read_only=True)
+
+        fields = _split_param(request.query_params.get('fields'))
+        if fields:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
 
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ['has_seen_welcome']
+        fields = ['has_seen_welcome', 'timezone']
 
 class UserStreakSerializer(serializers.ModelSerializer):
     class Meta:
@@ -51,17 +76,22 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class MoodStatSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = MoodStat
-        fields = ['id', 'percentHappiness', 'percentFear', 'percentSadness', 'percentDisgust', 'percentAnger', 'dominantMood']
+class MoodStatSerializer(serializers.Serializer):
+    """Journal.moodStats (a MoodStats unpacked from the journal's mood columns) under its original field names."""
+    id = serializers.IntegerField(read_only=True)  # The journal's id
+    percentHappiness = serializers.FloatField()
+    percentFear = serializers.FloatField()
+    percentSadness = serializers.FloatField()
+    percentDisgust = serializers.FloatField()
+    percentAnger = serializers.FloatField()
+    dominantMood = serializers.CharField()
 
 class InsightSerializer(serializers.ModelSerializer):
     class Meta:
         model = Insight
         fields = ['id', 'advice_messages', 'user']
 
-class JournalSerializer(serializers.ModelSerializer):
+class JournalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     title = serializers.CharField(allow_blank=True)
     content = serializers.CharField(allow_blank=True)
     moodStats = MoodStatSerializer(read_only=True)
@@ -76,7 +106,39 @@ class JournalSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Either title or content must be provided.")
         return data
 
+SNIPPET_LENGTH = 150  # Characters of content in list responses
+
+class JournalListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Compact representation for list views; the full body is only served by the detail endpoint."""
+    dominantMood = serializers.CharField(source='moodStats.dominantMood', default=None, read_only=True)
+    snippet = serializers.CharField(read_only=True)  # Annotated by JournalViewSet.get_queryset
+
+    class Meta:
+        model = Journal
+        fields = ['id', 'title', 'date', 'dominantMood', 'snippet']
+        expandable_fields = {
+            'moodStats': MoodStatSerializer,
+            'insights': InsightSerializer,
+        }
+
+class JournalSearchSerializer(JournalListSerializer):
+    rank = serializers.FloatField(read_only=True)  # Annotated by search_journals
+
+    class Meta(JournalListSerializer.Meta):
+        fields = JournalListSerializer.Meta.fields + ['rank']
+
+class JournalSimilarSerializer(JournalListSerializer):
+    similarity = serializers.FloatField(read_only=True)  # Cosine similarity set by JournalViewSet.similar
+
+    class Meta(JournalListSerializer.Meta):
+        fields = JournalListSerializer.Meta.fields + ['similarity']
+
 class DailyGreetingSerializer(serializers.ModelSerializer):
     class Meta:
         model = DailyGreeting
         fields = ['id', 'greetings', 'date', 'time_period']
+
+class EmotionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EmotionJob
+        fields = ['id', 'journal', 'status', 'attempts', 'error', 'created_at', 'started_at', 'finished_at', 'run_after']
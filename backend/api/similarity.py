@@ -0,0 +1,120 @@
+"""
+"You felt like this before": a user's past entries most similar to a journal.
+
+Each journal's embedding is stored as raw float32 bytes in JournalEmbedding.
+A query loads the user's vectors into one (n, d) matrix and takes the top k
+of a single matrix-vector product, which stays in the low milliseconds for
+tens of thousands of entries per user (see `benchmark similar`).
+
+Vectors are written off the read path: on save when the embedder runs
+locally, by the emotion worker otherwise, and by `manage.py embed_journals`
+for journals that predate either. A query only reads them, and never calls
+a remote embedder.
+"""
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from gemini_wrapper.embeddings import get_embedder
+from .models import Journal, JournalEmbedding
+
+
+def embedding_text(journal):
+    return f"{journal.title}\n{journal.content}"
+
+
+def refresh_embeddings(user, embedder=None, batch_size=64):
+    """Embed the user's journals that have no vector from `embedder` yet. Returns how many were embedded."""
+    embedder = embedder or get_embedder()
+    missing = Journal.objects.filter(user=user).filter(
+        Q(embedding__isnull=True) | ~Q(embedding__embedder=embedder.name)
+    ).only('id', 'title', 'content').order_by('id')
+
+    embedded = 0
+    batch = []
+    for journal in missing.iterator(chunk_size=batch_size):
+        batch.append(journal)
+        if len(batch) == batch_size:
+            embedded += embed_journals(batch, embedder)
+            batch = []
+    if batch:
+        embedded += embed_journals(batch, embedder)
+    return embedded
+
+
+def embed_journals(journals, embedder=None):
+    """Embed and store vectors for a batch of journals. Returns how many were stored."""
+    embedder = embedder or get_embedder()
+    vectors = embedder.embed([embedding_text(journal) for journal in journals])
+    try:
+        with transaction.atomic():
+            JournalEmbedding.objects.bulk_create(
+                [
+                    JournalEmbedding(journal=journal, user_id=journal.user_id, embedder=embedder.name, vector=vector.tobytes())
+                    for journal, vector in zip(journals, vectors)
+                ],
+                update_conflicts=True,
+                unique_fields=['journal'],
+                update_fields=['embedder', 'vector'],
+            )
+    except IntegrityError:
+        return 0  # A journal was deleted while it was being embedded
+    return len(journals)
+
+
+def ensure_embedding(journal, embedder=None):
+    """Embed a journal unless it already has a vector from the embedder."""
+    embedder = embedder or get_embedder()
+    if not JournalEmbedding.objects.filter(journal=journal, embedder=embedder.name).exists():
+        embed_journals([journal], embedder)
+
+
+def embed_on_save(journal):
+    """Embed a journal once it is committed if that needs no network call; remote embedders are left to the worker."""
+    embedder = get_embedder()
+    if not embedder.remote:
+        transaction.on_commit(lambda: embed_journals([journal], embedder))
+
+
+def load_vectors(embeddings, dimensions):
+    """(journal ids, (n, dimensions) float32 matrix) for a JournalEmbedding queryset."""
+    rows = list(embeddings.values_list('journal_id', 'vector'))
+    if not rows:
+        return np.array([], dtype=np.int64), np.empty((0, dimensions), dtype=np.float32)
+    ids, vectors = zip(*rows)
+    matrix = np.frombuffer(b''.join(bytes(vector) for vector in vectors), dtype=np.float32).reshape(len(rows), dimensions)
+    return np.array(ids, dtype=np.int64), matrix
+
+
+def top_k(matrix, query, k):
+    """Row indexes of the k highest cosine similarities, best first, with their scores."""
+    scores = matrix @ query
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=np.int64), scores[:0]
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return best, scores[best]
+
+
+def similar_journals(journal, k=5, embedder=None):
+    """
+    The k entries of the journal's owner dated on or before it that read most
+    like it, as [(journal id, similarity)] best first. Nothing is written:
+    entries without a stored vector yet are left out, and the journal itself
+    is embedded in memory if it has none. With a remote embedder that would
+    be a network call, so None is returned instead for the caller to queue it.
+    """
+    embedder = embedder or get_embedder()
+    vectors = JournalEmbedding.objects.filter(user_id=journal.user_id, embedder=embedder.name)
+    stored = vectors.filter(journal=journal).values_list('vector', flat=True).first()
+    if stored is None:
+        if embedder.remote:
+            return None
+        query = embedder.embed([embedding_text(journal)])[0]
+    else:
+        query = np.frombuffer(bytes(stored), dtype=np.float32)
+    ids, matrix = load_vectors(
+        vectors.filter(journal__date__lte=journal.date).exclude(journal=journal), embedder.dimensions
+    )
+    best, scores = top_k(matrix, query, k)
+    return [(int(ids[index]), float(score)) for index, score in zip(best, scores)]
@@ -0,0 +1,69 @@
+"""
+Pre-rendered JSON for the journal detail and list endpoints.
+
+JournalSnapshot holds each journal's JournalSerializer and
+JournalListSerializer output as the exact text the JSON renderer produces,
+so `retrieve` and `list` send it as it is instead of loading the journal and
+its insight and serializing them field by field. Saving a journal renders its
+snapshot again. Saving its Insight on its own drops the snapshot, and a
+missing one is rendered on the next read. Writes that skip model signals
+(bulk_update) call store_snapshots themselves.
+"""
+import json
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from .models import Insight, Journal, JournalSnapshot
+from .renderers import FastJSONRenderer
+from .serializers import SNIPPET_LENGTH, JournalListSerializer, JournalSerializer
+
+
+def render(data):
+    return FastJSONRenderer().render(data).decode('utf-8')
+
+
+def render_snapshot(journal):
+    journal.snippet = journal.content[:SNIPPET_LENGTH]
+    return JournalSnapshot(
+        journal=journal,
+        detail=render(JournalSerializer(journal).data),
+        summary=render(JournalListSerializer(journal).data),
+    )
+
+
+def store_snapshots(journals):
+    """Render and save snapshots for journals with their insights loaded. Returns them by journal id."""
+    snapshots = [render_snapshot(journal) for journal in journals]
+    JournalSnapshot.objects.bulk_create(
+        snapshots, update_conflicts=True, unique_fields=['journal'], update_fields=['detail', 'summary']
+    )
+    return {snapshot.journal_id: snapshot for snapshot in snapshots}
+
+
+def build_snapshots(journal_ids):
+    """Snapshots for journals that have none yet, by journal id."""
+    return store_snapshots(Journal.objects.filter(pk__in=journal_ids).select_related('insights'))
+
+
+def json_response(text):
+    return HttpResponse(text, content_type='application/json')
+
+
+def page_response(paginator, summaries):
+    """The body CursorPagination.get_paginated_response would render, around summaries already in JSON."""
+    return json_response(
+        f'{{"next":{json.dumps(paginator.get_next_link())},'
+        f'"previous":{json.dumps(paginator.get_previous_link())},'
+        f'"results":[{",".join(summaries)}]}}'
+    )
+
+
+@receiver(post_save, sender=Journal)
+def refresh_journal_snapshot(sender, instance, **kwargs):
+    store_snapshots([instance])
+
+
+@receiver(post_save, sender=Insight)
+def drop_insight_snapshot(sender, instance, created, **kwargs):
+    if not created:
+        JournalSnapshot.objects.filter(journal__insights=instance).delete()
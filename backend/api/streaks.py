@@ -0,0 +1,140 @@
+"""
+Incremental journal streaks.
+
+A user's distinct journal dates are stored as StreakRun intervals. Adding or
+removing a day touches at most the runs either side of it, found through the
+(user, start) and (user, end) indexes, and UserStreak is refreshed from the
+latest run and the longest run (the (user, length) index), so every journal
+create, date edit or delete costs a few indexed lookups however long the
+history is. Back-dated entries are just days added in the past.
+"""
+from datetime import timedelta
+from django.db import transaction
+from .models import Journal, StreakRun, UserStreak
+
+ONE_DAY = timedelta(days=1)
+
+
+def lock_streak(user_id):
+    """
+    Lock the user's UserStreak row for the rest of the transaction. Take it
+    before deleting or re-dating a journal so concurrent writers see each
+    other's changes when deciding whether a day is still covered.
+    """
+    UserStreak.objects.get_or_create(user_id=user_id)
+    return UserStreak.objects.select_for_update().get(user_id=user_id)
+
+
+def journal_date_changed(user_id, journal_id, old_date=None, new_date=None):
+    """
+    Update streaks after a journal was created (old_date None), deleted
+    (new_date None) or moved to another date. Call it after the journal
+    row itself has been written.
+    """
+    if old_date == new_date:
+        return
+    with transaction.atomic():
+        streak = lock_streak(user_id)
+        if old_date is not None and not Journal.objects.filter(user_id=user_id, date=old_date).exclude(pk=journal_id).exists():
+            _remove_day(user_id, old_date)
+        if new_date is not None:
+            _add_day(user_id, new_date)
+        _refresh(streak)
+
+
+def _save_run(run):
+    run.length = (run.end - run.start).days + 1
+    run.save()
+
+
+def _add_day(user_id, day):
+    runs = StreakRun.objects.filter(user_id=user_id)
+    if runs.filter(start__lte=day, end__gte=day).exists():
+        return  # Another journal already covers the day
+    before = runs.filter(end=day - ONE_DAY).first()
+    after = runs.filter(start=day + ONE_DAY).first()
+    if before and after:
+        # The day joins two runs
+        before.end = after.end
+        after.delete()
+        _save_run(before)
+    elif before:
+        before.end = day
+        _save_run(before)
+    elif after:
+        after.start = day
+        _save_run(after)
+    else:
+        StreakRun.objects.create(user_id=user_id, start=day, end=day, length=1)
+
+
+def _remove_day(user_id, day):
+    run = StreakRun.objects.filter(user_id=user_id, start__lte=day).order_by('-start').first()
+    if run is None or run.end < day:
+        return
+    if run.start == run.end:
+        run.delete()
+    elif day == run.start:
+        run.start = day + ONE_DAY
+        _save_run(run)
+    elif day == run.end:
+        run.end = day - ONE_DAY
+        _save_run(run)
+    else:
+        # The day splits the run in two
+        StreakRun.objects.create(user_id=user_id, start=day + ONE_DAY, end=run.end, length=(run.end - day).days)
+        run.end = day - ONE_DAY
+        _save_run(run)
+
+
+def _refresh(streak):
+    runs = StreakRun.objects.filter(user_id=streak.user_id)
+    latest = runs.order_by('-end').first()
+    streak.current_streak = latest.length if latest else 0
+    streak.longest_streak = runs.order_by('-length').values_list('length', flat=True).first() or 0
+    streak.last_journal_date = latest.end if latest else None
+    streak.save(update_fields=['current_streak', 'longest_streak', 'last_journal_date'])
+
+
+def runs_from_dates(dates):
+    """(start, end) of each run of consecutive days in ascending distinct dates."""
+    runs = []
+    for day in dates:
+        if runs and runs[-1][1] == day - ONE_DAY:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def reference_streaks(dates):
+    """
+    (current, longest, last date) computed directly from a set of dates, as
+    the reference the incremental engine is checked against.
+    """
+    days = set(dates)
+    if not days:
+        return 0, 0, None
+
+    def run_ending_at(day):
+        length = 0
+        while day - timedelta(days=length) in days:
+            length += 1
+        return length
+
+    last = max(days)
+    return run_ending_at(last), max(run_ending_at(day) for day in days), last
+
+
+def rebuild_streak(user):
+    """Recompute a user's runs and streak from their journals."""
+    dates = Journal.objects.filter(user=user).order_by('date').values_list('date', flat=True).distinct()
+    with transaction.atomic():
+        streak = lock_streak(user.id)
+        StreakRun.objects.filter(user=user).delete()
+        StreakRun.objects.bulk_create([
+            StreakRun(user=user, start=start, end=end, length=(end - start).days + 1)
+            for start, end in runs_from_dates(list(dates))
+        ])
+        _refresh(streak)
+    return streak
@@ -1,3 +1,1509 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+import pytz
+from unittest.mock import patch
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import async_views
+from .models import Journal, JournalEmbedding, JournalSnapshot, EmotionJob, MoodStats, Insight, MoodRollup, DailyGreeting, StreakRun, UserStreak
+from .jobs import enqueue_reprocessing, run_pending_jobs
+from .analytics import rebuild_rollups
+from .trends import compute_trends
+from .reprocess import analyze_batch, reprocess_journals, save_batch
+from .emotions import is_processed, mood_stats_from_emotions, save_advice, save_analysis
+from .serializers import JournalSerializer
+from .conditional import NotModifiedMiddleware, conditional, current_etag, quarter_hour, user_version
+from .renderers import FastJSONRenderer
+from .metrics import DB_QUERIES, REQUEST_SECONDS, RequestMetricsMiddleware
+from .similarity import refresh_embeddings, similar_journals, top_k
+from .streaks import journal_date_changed, lock_streak, rebuild_streak, reference_streaks
+from .greetings import GREETING_LEASE_SLACK, _in_flight, _single_flight, active_users, claim_lease, current_slot, greeting_for, next_slot, prewarm_greetings, upcoming_slots
+import numpy as np
+from gemini_wrapper import gemini_utils, jsonlib
+from gemini_wrapper.calendar_service import DEFAULT_TIMEZONE, greeting_moment, holiday_table
+from gemini_wrapper.cache import LRUCacheBackend, LLMCache, llm_cache, make_key
+from gemini_wrapper.client import CALL_SECONDS, RETRIES, GeminiClient, CircuitBreaker, CircuitOpenError, EmptyResponse, GeminiUnavailable, TokenBucket
+from gemini_wrapper.gemini_utils import FALLBACKS, PARSE_FAILURES
+from gemini_wrapper.metrics import Counter, Histogram, Registry
+from gemini_wrapper.fake_client import FakeGeminiClient, FakeResponse, FAKE_ADVICE, FAKE_EMOTIONS, default_responder
+from gemini_wrapper.embeddings import GeminiEmbedder, HashingEmbedder
+from gemini_wrapper.streaming import iter_json_array
+from google.genai.errors import ClientError, ServerError
 
-# Create your tests here.
+EMOTIONS = {'happy': 0.7, 'sad': 0.1, 'fear': 0.1, 'disgust': 0.05, 'anger': 0.05}
+ADVICE = ['one', 'two', 'three', 'four', 'five']
+
+
+def use_fake(fake, **kwargs):
+    """Route gemini_utils through a fake client wrapped in a GeminiClient with no backoff delay."""
+    kwargs.setdefault('base_delay', 0)
+    return patch.object(gemini_utils, 'client', GeminiClient(raw=fake, **kwargs))
+
+
+class EmotionJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.journal = Journal.objects.create(user=self.user, title='Day', date='2025-06-01', content='A good day')
+
+    def test_reprocessing_is_queued_for_the_worker(self):
+        with use_fake(FakeGeminiClient()):
+            self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+            run_pending_jobs()
+        other = Journal.objects.create(user=self.user, title='Night', date='2025-06-02', content='A long night')
+        self.client.post(f'/api/journals/{other.id}/process_emotions/')
+
+        self.assertEqual(enqueue_reprocessing(Journal.objects.all()), 1)
+        self.assertEqual(EmotionJob.objects.filter(status='pending').count(), 2)
+        self.journal.refresh_from_db()
+        self.assertFalse(is_processed(self.journal))
+        with use_fake(FakeGeminiClient()):
+            self.assertEqual(run_pending_jobs(), 2)
+        self.assertTrue(all(is_processed(journal) for journal in Journal.objects.all()))
+
+    def test_process_emotions_enqueues_and_worker_completes(self):
+        response = self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+        self.assertEqual(response.data['status'], 'pending')
+
+        # A second request while the job is queued reuses it
+        again = self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+        self.assertEqual(again.data['id'], job_id)
+
+        with patch('api.emotions.analyze_journal', return_value=(EMOTIONS, ADVICE)):
+            self.assertEqual(run_pending_jobs(), 1)
+
+        job = self.client.get(f'/api/emotion-jobs/{job_id}/')
+        self.assertEqual(job.data['status'], 'done')
+
+        journal = self.client.get(f'/api/journals/{self.journal.id}/')
+        self.assertEqual(journal.json()['moodStats']['dominantMood'], 'happy')
+        self.assertEqual(journal.json()['insights']['advice_messages'], ADVICE)
+
+        # Unchanged content is answered directly without a new job
+        done = self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+        self.assertEqual(done.status_code, 200)
+        self.assertEqual(EmotionJob.objects.count(), 1)
+
+    def test_failed_job_is_retried_with_backoff_then_marked_failed(self):
+        self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+        now = timezone.now()
+        delays = []
+        with patch('api.emotions.analyze_journal', side_effect=RuntimeError('boom')), patch('api.jobs.random.uniform', return_value=1.0):
+            for _ in range(3):
+                with patch('api.jobs.timezone.now', return_value=now):
+                    self.assertEqual(run_pending_jobs(), 1)
+                    self.assertEqual(run_pending_jobs(), 0)  # Not due again yet
+                job = EmotionJob.objects.get()
+                if job.status == 'pending':
+                    delays.append(job.run_after - now)
+                    now = job.run_after
+        self.assertEqual(delays, [timedelta(seconds=30), timedelta(seconds=60)])
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(job.error, 'boom')
+
+    def test_gemini_outage_fails_the_attempt_instead_of_saving_defaults(self):
+        self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+        fake = FakeGeminiClient(failure_rate=1)
+        with use_fake(fake, max_retries=0), self.assertLogs('api.jobs', 'ERROR'):
+            run_pending_jobs()
+        job = EmotionJob.objects.get()
+        self.assertEqual(job.status, 'pending')
+        self.assertGreater(job.run_after, timezone.now())
+        self.journal.refresh_from_db()
+        self.assertIsNone(self.journal.moodStats)
+        self.assertIsNone(self.journal.insights)
+        self.assertFalse(is_processed(self.journal))
+        self.assertFalse(MoodRollup.objects.filter(user=self.user, entry_count__gt=0).exists())
+
+    def test_edit_racing_the_worker_keeps_its_analysis(self):
+        def worker_finishes_first(user_id):
+            save_analysis(self.journal, self.journal.content, mood_stats_from_emotions(EMOTIONS), ADVICE)
+            lock_streak(user_id)
+
+        with patch('api.views.lock_streak', side_effect=worker_finishes_first):
+            response = self.client.put(f'/api/journals/{self.journal.id}/', {'title': 'Day', 'date': '2025-06-02', 'content': 'A good day'})
+        self.assertEqual(response.status_code, 200)
+        self.journal.refresh_from_db()
+        self.assertEqual(self.journal.moodStats.dominantMood, 'happy')
+        self.assertEqual(self.journal.insights.advice_messages, ADVICE)
+        self.assertTrue(is_processed(self.journal))
+        self.assertEqual(
+            list(MoodRollup.objects.filter(user=self.user, period='day', entry_count__gt=0).values_list('period_start', flat=True)),
+            [date(2025, 6, 2)],
+        )
+
+    def test_jobs_are_private(self):
+        self.client.post(f'/api/journals/{self.journal.id}/process_emotions/')
+        job = EmotionJob.objects.get()
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='bob', password='pw'))
+        self.assertEqual(other.get(f'/api/emotion-jobs/{job.id}/').status_code, 404)
+
+
+
+class JournalListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for day in range(1, 6):
+            Journal.objects.create(user=self.user, title=f'Day {day}', date=f'2025-06-0{day}', content='x' * 500)
+        journal = Journal.objects.get(title='Day 5')
+        journal.moodStats = MoodStats(80, 5, 5, 5, 5, dominantMood='happy')
+        journal.save()
+
+    def test_list_is_paginated_and_compact(self):
+        response = self.client.get('/api/journals/?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['results']
+        self.assertEqual([j['title'] for j in first], ['Day 5', 'Day 4'])
+        self.assertEqual(set(first[0]), {'id', 'title', 'date', 'dominantMood', 'snippet'})
+        self.assertEqual(first[0]['dominantMood'], 'happy')
+        self.assertIsNone(first[1]['dominantMood'])
+        self.assertEqual(len(first[0]['snippet']), 150)
+
+        titles = [j['title'] for j in first]
+        next_url = response.json()['next']
+        while next_url:
+            page = self.client.get(next_url).json()
+            titles += [j['title'] for j in page['results']]
+            next_url = page['next']
+        self.assertEqual(titles, ['Day 5', 'Day 4', 'Day 3', 'Day 2', 'Day 1'])
+
+    def test_list_filters(self):
+        def titles(query):
+            response = self.client.get(f'/api/journals/?{query}')
+            self.assertEqual(response.status_code, 200)
+            return [j['title'] for j in response.json()['results']]
+
+        self.assertEqual(titles('start=2025-06-02&end=2025-06-03'), ['Day 3', 'Day 2'])
+        self.assertEqual(titles('mood=happy'), ['Day 5'])
+        self.assertEqual(titles('mood=happy&fields=id,title'), ['Day 5'])
+        self.assertEqual(titles('mood=calm'), [])
+        self.assertEqual(self.client.get('/api/journals/?start=june').status_code, 400)
+
+    def test_fields_and_expand(self):
+        response = self.client.get('/api/journals/?fields=id,title&expand=moodStats')
+        entry = response.data['results'][0]
+        self.assertEqual(set(entry), {'id', 'title', 'moodStats'})
+        self.assertEqual(entry['moodStats']['dominantMood'], 'happy')
+
+        journal = Journal.objects.get(title='Day 1')
+        detail = self.client.get(f'/api/journals/{journal.id}/?fields=content')
+        self.assertEqual(detail.data, {'content': 'x' * 500})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class JournalSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.journal = Journal.objects.create(user=self.user, title='Day', date='2025-06-01', content='Walked to the “café”')
+
+    def rendered(self, journal_id):
+        journal = Journal.objects.select_related('insights').get(pk=journal_id)
+        return JSONRenderer().render(JournalSerializer(journal).data)
+
+    def test_responses_match_the_serializers(self):
+        save_analysis(self.journal, self.journal.content, mood_stats_from_emotions(EMOTIONS), ADVICE)
+        with self.assertNumQueries(1):
+            detail = self.client.get(f'/api/journals/{self.journal.id}/')
+        self.assertEqual(detail['Content-Type'], 'application/json')
+        self.assertEqual(detail.content, self.rendered(self.journal.id))
+
+        Journal.objects.create(user=self.user, title='Newer', date='2025-06-02', content='x')
+        with self.assertNumQueries(1):
+            listed = self.client.get('/api/journals/?page_size=1').json()
+        serialized = self.client.get('/api/journals/?page_size=1&fields=id,title,date,dominantMood,snippet').data
+        self.assertEqual(listed['results'], serialized['results'])
+        self.assertIsNone(listed['previous'])
+        second = self.client.get(listed['next']).json()
+        self.assertEqual(second['results'][0]['dominantMood'], 'happy')
+        self.assertIsNotNone(second['previous'])
+        self.assertEqual(self.client.get('/api/journals/99999/').status_code, 404)
+
+    def test_writes_refresh_the_snapshot(self):
+        self.client.patch(f'/api/journals/{self.journal.id}/', {'title': 'Renamed'})
+        self.assertEqual(self.client.get(f'/api/journals/{self.journal.id}/').json()['title'], 'Renamed')
+
+        save_analysis(self.journal, self.journal.content, mood_stats_from_emotions(EMOTIONS), ADVICE)
+        save_advice(self.journal, ['Just this'])  # Saves only the Insight, so the snapshot is dropped
+        self.assertFalse(JournalSnapshot.objects.filter(journal=self.journal).exists())
+        detail = self.client.get(f'/api/journals/{self.journal.id}/')
+        self.assertEqual(detail.json()['insights']['advice_messages'], ['Just this'])
+        self.assertEqual(detail.content, self.rendered(self.journal.id))
+
+        with use_fake(FakeGeminiClient(lambda prompt: json.dumps([
+            {'id': str(self.journal.id), 'emotions': {'happy': 0.1, 'sad': 0.6, 'fear': 0.1, 'disgust': 0.1, 'anger': 0.1}, 'advice': ADVICE}
+        ]))):
+            reprocess_journals(Journal.objects.all(), force=True)
+        self.assertEqual(self.client.get(f'/api/journals/{self.journal.id}/').json()['moodStats']['dominantMood'], 'sad')
+
+    def test_missing_snapshots_are_built_on_read(self):
+        Journal.objects.bulk_create([
+            Journal(user=self.user, title=f'Imported {day}', date=f'2025-07-0{day}', content='x') for day in range(1, 4)
+        ])
+        self.assertEqual(JournalSnapshot.objects.count(), 1)
+        titles = [entry['title'] for entry in self.client.get('/api/journals/').json()['results']]
+        self.assertEqual(titles, ['Imported 3', 'Imported 2', 'Imported 1', 'Day'])
+        self.assertEqual(JournalSnapshot.objects.count(), 4)
+
+        JournalSnapshot.objects.all().delete()
+        self.assertEqual(self.client.get(f'/api/journals/{self.journal.id}/').content, self.rendered(self.journal.id))
+
+
+class MoodStorageTests(TestCase):
+    def test_pack_round_trip(self):
+        stats = MoodStats(33.333, 66.667, 0, 0, 0, dominantMood='fear')
+        packed, code = stats.pack()
+        self.assertEqual(len(packed), MoodStats.PACKING.size)
+        self.assertEqual(code, 1)
+        self.assertEqual(MoodStats.unpack(memoryview(packed), code), MoodStats(33.33, 66.67, 0.0, 0.0, 0.0, dominantMood='fear'))
+        self.assertEqual(MoodStats(50, 50, 0, 0, 0).pack()[1], -1)
+        self.assertEqual(MoodStats.unpack(*MoodStats(50, 50, 0, 0, 0).pack()).dominantMood, '')
+
+    def test_api_keeps_moodstat_field_names(self):
+        user = User.objects.create_user(username='alice', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+        journal = Journal.objects.create(user=user, title='Day', date='2025-06-01', content='x')
+        self.assertIsNone(client.get(f'/api/journals/{journal.id}/').json()['moodStats'])
+
+        save_analysis(journal, journal.content, mood_stats_from_emotions(EMOTIONS), ADVICE)
+        expected = {
+            'id': journal.id, 'percentHappiness': 70.0, 'percentFear': 10.0, 'percentSadness': 10.0,
+            'percentDisgust': 5.0, 'percentAnger': 5.0, 'dominantMood': 'happy',
+        }
+        self.assertEqual(client.get(f'/api/journals/{journal.id}/').json()['moodStats'], expected)
+
+        # /moodstats/ stays as a read-only view of the same data
+        Journal.objects.create(user=user, title='Unprocessed', date='2025-06-02', content='y')
+        self.assertEqual(client.get('/api/moodstats/').json(), [expected])
+        self.assertEqual(client.get(f'/api/moodstats/{journal.id}/').json(), expected)
+        self.assertEqual(client.delete(f'/api/moodstats/{journal.id}/').status_code, 405)
+
+
+class MoodStorageMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('api', target)])
+        return executor.loader.project_state([('api', target)]).apps
+
+    def tearDown(self):
+        call_command('migrate', verbosity=0)
+
+    def test_moodstat_rows_move_onto_journals(self):
+        apps = self.migrate('0011_journalsnapshot')
+        User = apps.get_model('auth', 'User')
+        Journal = apps.get_model('api', 'Journal')
+        MoodStat = apps.get_model('api', 'MoodStat')
+        user = User.objects.create(username='alice')
+        stat = MoodStat.objects.create(
+            percentHappiness=12.5, percentFear=0, percentSadness=80, percentDisgust=7.5, percentAnger=0, dominantMood='sad'
+        )
+        analyzed = Journal.objects.create(user=user, title='Day', date='2025-06-01', content='x', moodStats=stat)
+        unanalyzed = Journal.objects.create(user=user, title='Night', date='2025-06-01', content='y')
+
+        apps = self.migrate('0013_delete_moodstat')
+        Journal = apps.get_model('api', 'Journal')
+        packed = Journal.objects.get(pk=analyzed.pk)
+        self.assertEqual(MoodStats.unpack(packed.mood, packed.dominant_mood), MoodStats(12.5, 0, 80, 7.5, 0, dominantMood='sad'))
+        self.assertIsNone(Journal.objects.get(pk=unanalyzed.pk).mood)
+
+
+class JournalSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.hike = Journal.objects.create(user=self.user, title='Mountain hike', date='2025-06-01', content='Long walk up the hill with friends.')
+        self.work = Journal.objects.create(user=self.user, title='Work', date='2025-06-02', content='Deadline stress, then a short hike after work.')
+        Journal.objects.create(user=self.user, title='Reading', date='2025-06-03', content='Finished a novel.')
+        other = User.objects.create_user(username='bob', password='pw')
+        Journal.objects.create(user=other, title='Hike', date='2025-06-01', content='hiking')
+
+    def search(self, query):
+        response = self.client.get(f'/api/journals/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [entry['title'] for entry in response.data['results']]
+
+    def test_ranked_and_filtered(self):
+        # Stemmed matches, title hits ranked first, other users' journals excluded
+        self.assertEqual(self.search('q=hiking'), ['Mountain hike', 'Work'])
+        self.assertEqual(self.search('q=hike friends'), ['Mountain hike'])
+        self.assertEqual(self.search('q=hike&start=2025-06-02'), ['Work'])
+        self.assertEqual(self.search('q=hike&page_size=1'), ['Mountain hike'])
+
+        self.work.moodStats = MoodStats(5, 5, 80, 5, 5, dominantMood='sad')
+        self.work.save()
+        self.assertEqual(self.search('q=hike&mood=sad'), ['Work'])
+        self.assertEqual(self.search('q=hike&mood=calm'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.client.put(f'/api/journals/{self.work.id}/', {'title': 'Work', 'date': '2025-06-02', 'content': 'Quiet day.'})
+        self.assertEqual(self.search('q=hike'), ['Mountain hike'])
+        self.client.delete(f'/api/journals/{self.hike.id}/')
+        self.assertEqual(self.search('q=hike'), [])
+        self.assertEqual(self.search('q="quiet"*'), ['Work'])
+
+    def test_requires_query(self):
+        self.assertEqual(self.client.get('/api/journals/search/?q=%20!').status_code, 400)
+        self.assertEqual(self.client.get('/api/journals/search/?q=hike&end=june').status_code, 400)
+
+
+class SimilarJournalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.beach = Journal.objects.create(user=self.user, title='Beach', date='2025-06-01', content='Swimming at the beach with my sister, sunny and calm.')
+        Journal.objects.create(user=self.user, title='Exam', date='2025-06-02', content='Studied all night for the physics exam, anxious.')
+        Journal.objects.create(user=self.user, title='Later beach', date='2025-07-01', content='Swimming at the beach again.')
+        self.today = Journal.objects.create(user=self.user, title='Sea', date='2025-06-10', content='Went swimming at the beach, calm and sunny.')
+
+    def test_returns_most_similar_earlier_entries(self):
+        # Nothing embedded yet: the entry itself is embedded in memory and nothing is written
+        response = self.client.get(f'/api/journals/{self.today.id}/similar/?k=2')
+        self.assertEqual(response.data, [])
+        self.assertFalse(JournalEmbedding.objects.exists())
+
+        call_command('embed_journals', stdout=StringIO())
+        self.assertEqual(JournalEmbedding.objects.filter(user=self.user).count(), 4)
+        response = self.client.get(f'/api/journals/{self.today.id}/similar/?k=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['title'] for entry in response.data], ['Beach', 'Exam'])
+        self.assertGreater(response.data[0]['similarity'], response.data[1]['similarity'])
+        before = response.data[0]['similarity']
+
+        # Editing the text replaces the stale vector once the edit is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'/api/journals/{self.beach.id}/', {'title': 'Study', 'date': '2025-06-01', 'content': 'Physics exam night.'})
+        self.assertEqual(JournalEmbedding.objects.filter(user=self.user).count(), 4)
+        response = self.client.get(f'/api/journals/{self.today.id}/similar/?k=2')
+        study = next(entry for entry in response.data if entry['title'] == 'Study')
+        self.assertLess(study['similarity'], before / 2)
+        self.assertEqual(self.client.get(f'/api/journals/{self.today.id}/similar/?k=0').status_code, 400)
+
+    def test_embedders(self):
+        vectors = HashingEmbedder(64).embed(['calm beach day', 'calm beach day', ''])
+        self.assertEqual(vectors.shape, (3, 64))
+        self.assertAlmostEqual(float(vectors[0] @ vectors[1]), 1.0, places=5)
+        self.assertFalse(vectors[2].any())
+
+        fake = FakeGeminiClient()
+        embedder = GeminiEmbedder(GeminiClient(raw=fake), dimensions=16)
+        self.assertEqual(refresh_embeddings(self.user, embedder), 4)
+        self.assertEqual(len(fake.calls), 1)  # All four journals in one batch
+        matches = similar_journals(self.today, k=3, embedder=embedder)
+        self.assertEqual(len(matches), 2)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(JournalEmbedding.objects.filter(embedder=embedder.name).count(), 4)
+
+    def test_worker_embeds_processed_journals(self):
+        with use_fake(FakeGeminiClient()):
+            self.client.post(f'/api/journals/{self.today.id}/process_emotions/')
+            run_pending_jobs()
+        self.assertTrue(JournalEmbedding.objects.filter(journal=self.today).exists())
+
+    def test_remote_embedder_is_not_called_on_the_read_path(self):
+        fake = FakeGeminiClient(failure_rate=1)
+        embedder = GeminiEmbedder(GeminiClient(raw=fake, max_retries=0), dimensions=16)
+        with patch('api.similarity.get_embedder', return_value=embedder):
+            response = self.client.get(f'/api/journals/{self.today.id}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+        self.assertEqual(fake.calls, [])
+        self.assertEqual(EmotionJob.objects.get().journal_id, self.today.id)
+
+    def test_top_k(self):
+        matrix = np.eye(4, dtype=np.float32)
+        best, scores = top_k(matrix, np.array([0.1, 0.9, 0.0, 0.5], dtype=np.float32), 2)
+        self.assertEqual(best.tolist(), [1, 3])
+        self.assertEqual(len(top_k(matrix[:0], matrix[0], 3)[0]), 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.journal = Journal.objects.create(user=self.user, title='Day', date='2025-06-01', content='A good day')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        return first['ETag']
+
+    def test_unchanged_reads_are_not_modified(self):
+        for url in ['/api/users/me/', '/api/journals/', f'/api/journals/{self.journal.id}/']:
+            self.revalidate(url)
+
+    def test_version_lost_to_an_unreadable_race_is_still_set(self):
+        # Another request added the version, but this one can't read it back yet
+        with patch('api.conditional.cache.add', return_value=False):
+            self.assertIsNotNone(user_version(self.user.id + 1))
+
+    def test_writes_change_the_etag(self):
+        etag = self.revalidate('/api/journals/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/journals/', {'title': 'New', 'date': '2025-06-02', 'content': 'x'})
+        response = self.client.get('/api/journals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        # The streak changed too, so /me/ is fresh as well
+        me = self.revalidate('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/users/set_timezone/', {'timezone': 'Asia/Tokyo'})
+        self.assertEqual(self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=me).status_code, 200)
+
+    def test_today_and_tokens(self):
+        with use_fake(FakeGeminiClient()), self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/api/daily-greetings/today/')
+        # Generating the greeting was a write, so revalidate against the saved greeting
+        response = self.client.get('/api/daily-greetings/today/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/daily-greetings/today/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with patch('api.conditional.time.time', return_value=time.time() + 900):
+            self.assertEqual(self.client.get('/api/daily-greetings/today/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        # An ETag is no use without a valid token for its user
+        etag = self.client.get('/api/users/me/')['ETag']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer nonsense')
+        self.assertEqual(self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag).status_code, 401)
+
+
+    async def test_middleware_runs_natively_under_asgi(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = NotModifiedMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertTrue(iscoroutinefunction(middleware.process_view))
+
+        view = conditional()(lambda request: None)
+        etag, _ = await sync_to_async(current_etag)(self.user.id)
+        token = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        request = AsyncRequestFactory().get('/', headers={'Authorization': token, 'If-None-Match': etag})
+        response = await middleware.process_view(request, view, (), {})
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GeneratedGreetingETagTests(TransactionTestCase):
+    """Generating today's greeting bumps the version, so its ETag has to be read afterwards."""
+
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.auth = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+
+    def test_sync_view(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.auth)
+        with use_fake(FakeGeminiClient()):
+            first = client.get('/api/daily-greetings/today/')
+        self.assertEqual(client.get('/api/daily-greetings/today/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    async def test_async_view(self):
+        request = AsyncRequestFactory().get('/api/daily-greetings/today/', headers={'Authorization': self.auth})
+        with use_fake(FakeGeminiClient()):
+            response = await async_views.daily_greeting_today(request)
+        etag, _ = await sync_to_async(current_etag)(self.user.id, quarter_hour)
+        self.assertEqual(response['ETag'], etag)
+
+
+# Count ORM queries only; the conditional GET versions live in the cache
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class QueryCountTests(TestCase):
+    """Query counts must not grow with the number of journals."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for day in range(1, 21):
+            insight = Insight.objects.create(user=self.user, advice_messages=ADVICE)
+            self.journal = Journal.objects.create(
+                user=self.user, title=f'Day {day}', date=f'2025-06-{day:02d}', content='text',
+                moodStats=MoodStats(80, 5, 5, 5, 5, dominantMood='happy'), insights=insight,
+            )
+
+    def test_journal_list(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/journals/?expand=moodStats,insights')
+
+    def test_journal_detail(self):
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/journals/{self.journal.id}/')
+
+    def test_users_me(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/me/')
+        self.assertIn('current_streak', response.data['streak'])
+
+    def test_user_list(self):
+        User.objects.create_user(username='bob', password='pw')
+        with self.assertNumQueries(1):
+            self.client.get('/api/users/')
+
+    def test_insights_are_scoped_to_user(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='bob', password='pw'))
+        self.assertEqual(other.get('/api/insights/').data, [])
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/insights/')
+        self.assertEqual(len(response.data), 20)
+
+
+class MoodAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def process(self, journal, emotions):
+        self.client.post(f'/api/journals/{journal.id}/process_emotions/')
+        with patch('api.emotions.analyze_journal', return_value=(emotions, ADVICE)):
+            run_pending_jobs()
+
+    def snapshot(self):
+        return sorted(MoodRollup.objects.filter(user=self.user, entry_count__gt=0).values_list(
+            'period', 'period_start', 'entry_count', 'sumHappiness', 'sumSadness', 'happyCount', 'sadCount'
+        ))
+
+    def test_rollups_follow_processing_edits_and_deletes(self):
+        monday = Journal.objects.create(user=self.user, title='Mon', date='2025-06-02', content='good')
+        tuesday = Journal.objects.create(user=self.user, title='Tue', date='2025-06-03', content='bad')
+        self.process(monday, EMOTIONS)
+        self.process(tuesday, {'happy': 0.1, 'sad': 0.6, 'fear': 0.1, 'disgust': 0.1, 'anger': 0.1})
+
+        week = self.client.get('/api/analytics/moods/?period=week').data
+        self.assertEqual(len(week), 1)
+        self.assertEqual(str(week[0]['periodStart']), '2025-06-02')
+        self.assertEqual(week[0]['entryCount'], 2)
+        self.assertAlmostEqual(week[0]['averages']['percentHappiness'], 40.0)
+        self.assertEqual(week[0]['dominantMoodCounts'], {'happy': 1, 'fear': 0, 'sad': 1, 'disgust': 0, 'anger': 0})
+
+        # Reprocessing replaces the entry's contribution instead of adding to it
+        self.client.put(f'/api/journals/{tuesday.id}/', {'title': 'Tue', 'date': '2025-06-03', 'content': 'better'})
+        self.process(tuesday, EMOTIONS)
+        week = self.client.get('/api/analytics/moods/?period=week').data
+        self.assertEqual(week[0]['entryCount'], 2)
+        self.assertEqual(week[0]['dominantMoodCounts']['happy'], 2)
+
+        # Moving an entry to another month and deleting one are reflected too
+        self.client.put(f'/api/journals/{tuesday.id}/', {'title': 'Tue', 'date': '2025-07-01', 'content': 'better'})
+        months = self.client.get('/api/analytics/moods/?period=month').data
+        self.assertEqual([m['entryCount'] for m in months], [1, 1])
+        self.client.delete(f'/api/journals/{monday.id}/')
+        days = self.client.get('/api/analytics/moods/?period=day&start=2025-06-01&end=2025-06-30').data
+        self.assertEqual(days, [])
+
+        incremental = self.snapshot()
+        rebuild_rollups(self.user)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_rejects_unknown_period(self):
+        self.assertEqual(self.client.get('/api/analytics/moods/?period=year').status_code, 400)
+
+
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def streak(self):
+        streak = UserStreak.objects.get(user=self.user)
+        return streak.current_streak, streak.longest_streak, streak.last_journal_date
+
+    def expected(self):
+        return reference_streaks(Journal.objects.filter(user=self.user).values_list('date', flat=True))
+
+    def test_back_dated_edited_and_deleted_entries(self):
+        for day in ['2025-06-01', '2025-06-02', '2025-06-04']:
+            self.client.post('/api/journals/', {'title': day, 'date': day, 'content': 'x'})
+        self.assertEqual(self.streak(), (1, 2, date(2025, 6, 4)))
+
+        # Filling the gap afterwards joins both runs
+        gap = self.client.post('/api/journals/', {'title': 'gap', 'date': '2025-06-03', 'content': 'x'}).data
+        self.assertEqual(self.streak(), (4, 4, date(2025, 6, 4)))
+
+        self.client.put(f"/api/journals/{gap['id']}/", {'title': 'gap', 'date': '2025-05-20', 'content': 'x'})
+        self.assertEqual(self.streak(), (1, 2, date(2025, 6, 4)))
+        self.client.delete(f"/api/journals/{gap['id']}/")
+        self.assertEqual(self.streak(), self.expected())
+
+    def test_random_operations_match_reference(self):
+        # Seeded random create/move/delete sequences checked against the brute-force reference
+        rng = random.Random(17)
+        start = date(2025, 1, 1)
+        for _ in range(300):
+            journals = list(Journal.objects.filter(user=self.user))
+            op = rng.random()
+            if not journals or op < 0.45:
+                journal = Journal.objects.create(
+                    user=self.user, title='t', content='x', date=start + timedelta(days=rng.randrange(40)))
+                journal_date_changed(self.user.id, journal.pk, new_date=journal.date)
+            elif op < 0.75:
+                journal = rng.choice(journals)
+                old_date = journal.date
+                journal.date = start + timedelta(days=rng.randrange(40))
+                journal.save()
+                journal_date_changed(self.user.id, journal.pk, old_date, journal.date)
+            else:
+                journal = rng.choice(journals)
+                journal_id = journal.pk
+                journal.delete()
+                journal_date_changed(self.user.id, journal_id, old_date=journal.date)
+            self.assertEqual(self.streak(), self.expected())
+
+        # Runs never overlap or touch and agree with a full rebuild
+        runs = list(StreakRun.objects.filter(user=self.user).order_by('start').values_list('start', 'end', 'length'))
+        for (_, end, _), (next_start, _, _) in zip(runs, runs[1:]):
+            self.assertGreater((next_start - end).days, 1)
+        rebuild_streak(self.user)
+        self.assertEqual(runs, list(StreakRun.objects.filter(user=self.user).order_by('start').values_list('start', 'end', 'length')))
+
+    def test_recompute_command_repairs_streaks(self):
+        Journal.objects.create(user=self.user, title='t', content='x', date='2025-06-01')
+        Journal.objects.create(user=self.user, title='t', content='x', date='2025-06-02')
+        out = StringIO()
+        call_command('recompute_streaks', '--check', stdout=out)
+        self.assertIn('1 user(s) with a wrong streak', out.getvalue())
+        call_command('recompute_streaks', stdout=StringIO())
+        self.assertEqual(self.streak(), (2, 2, date(2025, 6, 2)))
+
+
+class MoodTrendTests(TestCase):
+    def test_compute_trends_matches_hand_computed_values(self):
+        dates = np.array(['2025-06-02', '2025-06-02', '2025-06-03', '2025-06-04', '2025-06-09'], dtype='datetime64[D]')
+        happiness = [10.0, 30.0, 50.0, 70.0, 90.0]
+        values = np.column_stack([happiness] + [[0.0] * 5] * 4)
+        dominant = np.array([1, 0, 0, 0, 2], dtype=np.int8)  # fear, happy, happy, happy, sad
+
+        trends = compute_trends(dates, values, dominant, window=2)
+
+        self.assertEqual(trends['dayCount'], 4)
+        self.assertEqual(trends['daily']['dates'], ['2025-06-02', '2025-06-03', '2025-06-04', '2025-06-09'])
+        self.assertEqual(trends['daily']['movingAverage']['percentHappiness'], [20.0, 35.0, 60.0, 80.0])
+        self.assertEqual(trends['daily']['volatility']['percentHappiness'], [0.0, 15.0, 10.0, 10.0])
+        self.assertEqual([w['weekStart'] for w in trends['weekly']], ['2025-06-02', '2025-06-09'])
+        self.assertAlmostEqual(trends['weekly'][0]['averages']['percentHappiness'], 46.67)
+        self.assertAlmostEqual(trends['weekly'][1]['delta']['percentHappiness'], 43.33)
+        self.assertIsNone(trends['weekly'][0]['delta']['percentHappiness'])
+        self.assertEqual(trends['dominantStreaks']['longest']['happy'], 3)
+        self.assertEqual(trends['dominantStreaks']['current'], {'mood': 'sad', 'length': 1, 'since': '2025-06-09'})
+
+    def test_endpoint(self):
+        user = User.objects.create_user(username='alice', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/api/analytics/trends/').data['entryCount'], 0)
+        Journal.objects.create(
+            user=user, title='Day', date='2025-06-01', content='x', moodStats=MoodStats(80, 5, 5, 5, 5, dominantMood='happy')
+        )
+        response = client.get('/api/analytics/trends/?window=3')
+        self.assertEqual(response.data['dominantStreaks']['current']['mood'], 'happy')
+        self.assertEqual(client.get('/api/analytics/trends/?window=0').status_code, 400)
+
+class AnalyzeJournalTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+
+    def test_calls_run_concurrently(self):
+        fake = FakeGeminiClient(latency=0.3)
+        with use_fake(fake):
+            started = time.monotonic()
+            emotions, advice = gemini_utils.analyze_journal_split('I passed my exam')
+            elapsed = time.monotonic() - started
+        self.assertEqual(len(fake.calls), 2)
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(emotions, FAKE_EMOTIONS)
+        self.assertEqual(advice, FAKE_ADVICE)
+
+    def test_each_call_falls_back_independently(self):
+        def responder(prompt):
+            if 'sentiment classifier' in prompt:
+                time.sleep(0.5)
+            return default_responder(prompt)
+
+        with use_fake(FakeGeminiClient(responder)):
+            emotions, advice = gemini_utils.analyze_journal_split('I passed my exam', timeout=0.2)
+        self.assertEqual(emotions, gemini_utils.DEFAULT_EMOTION_PROBS)
+        self.assertEqual(advice, FAKE_ADVICE)
+
+    def test_combined_mode_uses_one_call(self):
+        fake = FakeGeminiClient()
+        with use_fake(fake):
+            emotions, advice = gemini_utils.analyze_journal_combined('I passed my exam')
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(emotions, FAKE_EMOTIONS)
+        self.assertEqual(advice, FAKE_ADVICE)
+
+    def test_combined_mode_repairs_truncated_output_and_falls_back_per_part(self):
+        def responder(prompt):
+            if '"emotions"' in prompt:
+                return '{"emotions": {"happy": 3, "sad": 1}, "advice": ['
+            return default_responder(prompt)
+
+        fake = FakeGeminiClient(responder)
+        with use_fake(fake):
+            emotions, advice = gemini_utils.analyze_journal_combined('I passed my exam')
+        self.assertEqual(len(fake.calls), 2)
+        self.assertAlmostEqual(emotions['happy'], 0.75)
+        self.assertEqual(emotions['anger'], 0.0)
+        self.assertEqual(advice, FAKE_ADVICE)
+
+
+class ReprocessJournalsTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.journals = [
+            Journal.objects.create(user=self.user, title=f'Day {i}', date='2025-06-01', content=f'Entry number {i}')
+            for i in range(5)
+        ]
+
+    def test_batches_share_requests_and_update_rollups(self):
+        fake = FakeGeminiClient()
+        with use_fake(fake):
+            self.assertEqual(reprocess_journals(Journal.objects.all(), batch_size=2, workers=2), 5)
+        self.assertEqual(len(fake.calls), 3)
+        self.assertEqual(Journal.objects.filter(mood__isnull=False).count(), 5)
+        self.assertEqual(Insight.objects.count(), 5)
+        for journal in Journal.objects.select_related('insights'):
+            self.assertTrue(is_processed(journal))
+            self.assertEqual(journal.moodStats.dominantMood, 'happy')
+            self.assertEqual(journal.insights.advice_messages, FAKE_ADVICE)
+        day = MoodRollup.objects.get(user=self.user, period='day')
+        self.assertEqual(day.entry_count, 5)
+        self.assertEqual(day.happyCount, 5)
+
+        # Already processed journals are skipped, forced ones update in place
+        with use_fake(fake):
+            self.assertEqual(reprocess_journals(Journal.objects.all()), 0)
+            self.assertEqual(reprocess_journals(Journal.objects.all(), batch_size=5, force=True), 5)
+        self.assertEqual(Journal.objects.filter(mood__isnull=False).count(), 5)
+        self.assertEqual(MoodRollup.objects.get(user=self.user, period='day').entry_count, 5)
+
+    def test_entries_missing_from_batch_are_retried_alone(self):
+        def responder(prompt):
+            if '<entry id="' in prompt:
+                return '[]'
+            return default_responder(prompt)
+
+        fake = FakeGeminiClient(responder)
+        with use_fake(fake):
+            reprocess_journals(Journal.objects.filter(id__in=[j.id for j in self.journals[:2]]), batch_size=2)
+        self.assertEqual(len(fake.calls), 3)
+        self.assertEqual(Journal.objects.filter(mood__isnull=False).count(), 2)
+
+    def test_save_batch_rereads_rows_changed_during_analysis(self):
+        stale = list(Journal.objects.select_related('insights').filter(id__in=[j.id for j in self.journals[:2]]))
+        with use_fake(FakeGeminiClient()):
+            reprocess_journals(Journal.objects.all())
+            analyses = analyze_batch(stale)
+        # Re-dated and deleted while the batch was being analyzed
+        Journal.objects.filter(id=stale[0].id).update(date='2025-06-02')
+        Journal.objects.filter(id=stale[1].id).delete()
+        rebuild_rollups(self.user)
+
+        save_batch(stale, analyses)
+        self.assertEqual(MoodRollup.objects.get(user=self.user, period='day', period_start='2025-06-01').entry_count, 3)
+        self.assertEqual(MoodRollup.objects.get(user=self.user, period='day', period_start='2025-06-02').entry_count, 1)
+        self.assertEqual(Journal.objects.count(), 4)
+
+    def test_checkpoint_resumes_after_last_committed_batch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, 'checkpoint.json')
+            with open(checkpoint, 'w') as f:
+                json.dump({'last_id': self.journals[2].id}, f)
+            with use_fake(FakeGeminiClient()):
+                self.assertEqual(reprocess_journals(Journal.objects.all(), checkpoint=checkpoint), 2)
+            with open(checkpoint) as f:
+                self.assertEqual(json.load(f)['last_id'], self.journals[-1].id)
+        self.assertEqual(Journal.objects.filter(mood__isnull=False).count(), 2)
+
+
+    def test_gemini_outage_stops_the_run_without_saving_defaults(self):
+        for journal in self.journals:
+            save_analysis(journal, journal.content, mood_stats_from_emotions(EMOTIONS), ADVICE)
+
+        def responder(prompt):
+            if 'Entry number 2' in prompt:
+                raise ServerError(503, {'error': {'message': 'overloaded'}})
+            return default_responder(prompt)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, 'checkpoint.json')
+            args = ['reprocess_journals', '--force', '--batch-size', '2', '--workers', '1', '--checkpoint', checkpoint]
+            with use_fake(FakeGeminiClient(responder), max_retries=0), self.assertLogs('gemini_wrapper', 'WARNING'):
+                with self.assertRaisesRegex(CommandError, 'Stopped after 2 journal'):
+                    call_command(*args, stdout=StringIO())
+            with open(checkpoint) as f:
+                self.assertEqual(json.load(f)['last_id'], self.journals[1].id)
+
+        journals = Journal.objects.select_related('insights').order_by('id')
+        self.assertEqual([journal.moodStats.percentHappiness for journal in journals], [60.0, 60.0, 70.0, 70.0, 70.0])
+        self.assertEqual(journals[2].insights.advice_messages, ADVICE)
+        self.assertTrue(all(is_processed(journal) for journal in journals))
+        day = MoodRollup.objects.get(user=self.user, period='day')
+        self.assertEqual((day.entry_count, day.happyCount), (5, 5))
+
+class GreetingPrewarmTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.idle = User.objects.create_user(username='bob', password='pw')
+        self.now = timezone.now()
+        Journal.objects.create(user=self.user, title='Day', date=current_slot(self.now)[0], content='A good day')
+
+    def test_next_slot_rolls_over_days(self):
+        manila = pytz.timezone(DEFAULT_TIMEZONE)
+        evening = manila.localize(datetime(2025, 6, 1, 21, 45))
+        self.assertEqual(next_slot(evening)[:2], (date(2025, 6, 1), 'midnight'))
+        late = manila.localize(datetime(2025, 6, 1, 23, 0))
+        self.assertEqual(next_slot(late)[:2], (date(2025, 6, 2), 'midnight'))
+        self.assertEqual(next_slot(manila.localize(datetime(2025, 6, 2, 1, 0)))[:2], (date(2025, 6, 2), 'dawn'))
+        self.assertEqual([slot[1] for slot in upcoming_slots(evening)], ['evening', 'midnight'])
+        self.assertEqual([slot[1] for slot in upcoming_slots(evening, lead=timedelta(minutes=5))], ['evening'])
+
+    def test_prewarmed_greetings_are_served_without_gemini(self):
+        fake = FakeGeminiClient()
+        users = active_users(self.now - timedelta(days=7))
+        with use_fake(fake):
+            self.assertEqual(prewarm_greetings(users, current_slot(self.now)), 1)
+            self.assertEqual(prewarm_greetings(users, current_slot(self.now)), 0)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertIn('A good day', fake.calls[0][1])
+        self.assertFalse(DailyGreeting.objects.filter(user=self.idle).exists())
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with use_fake(fake):
+            response = client.get('/api/daily-greetings/today/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['greetings'], FAKE_ADVICE)
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_missing_greetings_are_generated_live(self):
+        fake = FakeGeminiClient()
+        client = APIClient()
+        client.force_authenticate(self.idle)
+        with use_fake(fake):
+            response = client.get('/api/daily-greetings/today/')
+            client.get('/api/daily-greetings/today/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(DailyGreeting.objects.filter(user=self.idle).count(), 1)
+
+
+    def test_user_timezone_sets_the_period(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post('/api/users/set_timezone/', {'timezone': 'Mars/Olympus'}).status_code, 400)
+        self.assertEqual(client.post('/api/users/set_timezone/', {'timezone': 'America/New_York'}).status_code, 200)
+
+        at = pytz.utc.localize(datetime(2025, 6, 2, 3, 0))  # 11:00 in Manila, 23:00 the day before in New York
+        with use_fake(FakeGeminiClient()):
+            greeting = greeting_for(User.objects.get(pk=self.user.pk), now=at)
+        self.assertEqual((greeting.date, greeting.time_period), (date(2025, 6, 1), 'midnight'))
+
+
+class CalendarServiceTests(TestCase):
+    def test_greeting_moment(self):
+        moment = greeting_moment(pytz.utc.localize(datetime(2025, 12, 25, 1, 0)))
+        self.assertEqual(moment.date, date(2025, 12, 25))
+        self.assertEqual(moment.time_period, 'morning')
+        self.assertEqual(moment.day_of_week, 'Thursday')
+        self.assertTrue(moment.is_holiday)
+        self.assertFalse(greeting_moment(pytz.utc.localize(datetime(2025, 12, 23, 1, 0))).is_holiday)
+        self.assertIs(holiday_table(2025), holiday_table(2025))
+
+    def test_unknown_timezone_falls_back_to_default(self):
+        at = pytz.utc.localize(datetime(2025, 6, 1, 0, 0))
+        self.assertEqual(greeting_moment(at, 'Nowhere/Land'), greeting_moment(at, DEFAULT_TIMEZONE))
+
+class GreetingSingleFlightTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+
+    def test_concurrent_callers_share_one_call(self):
+        calls, results = [], []
+
+        def generate():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'greeting'
+
+        threads = [threading.Thread(target=lambda: results.append(_single_flight('key', generate))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['greeting'] * 4)
+
+    def test_waits_for_placeholder_claimed_elsewhere(self):
+        slot_date, period, _ = current_slot()
+        placeholder = DailyGreeting.objects.create(user=self.user, date=slot_date, time_period=period, greetings=[])
+
+        def other_process_finishes(seconds):
+            DailyGreeting.objects.filter(pk=placeholder.pk).update(greetings=ADVICE)
+
+        fake = FakeGeminiClient()
+        with use_fake(fake), patch('api.greetings.time.sleep', side_effect=other_process_finishes):
+            greeting = greeting_for(self.user)
+        self.assertEqual(greeting.greetings, ADVICE)
+        self.assertEqual(len(fake.calls), 0)
+
+    def test_abandoned_placeholder_is_taken_over(self):
+        slot_date, period, _ = current_slot()
+        claimed_at = timezone.now() - timedelta(minutes=5)
+        DailyGreeting.objects.create(user=self.user, date=slot_date, time_period=period, greetings=[], claimed_at=claimed_at)
+        fake = FakeGeminiClient()
+        with use_fake(fake):
+            greeting = greeting_for(self.user)
+        self.assertEqual(greeting.greetings, FAKE_ADVICE)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(DailyGreeting.objects.count(), 1)
+
+    def test_lease_follows_the_gemini_deadline(self):
+        with use_fake(FakeGeminiClient(), deadline=10):
+            self.assertEqual(claim_lease(), timedelta(seconds=10 + GREETING_LEASE_SLACK))
+
+    def test_waiter_that_times_out_gets_fallback_greetings(self):
+        slot_date, period, _ = current_slot()
+        key = (self.user.id, slot_date, period)
+        _in_flight[key] = Future()  # Another thread's generation that never finishes
+        fake = FakeGeminiClient()
+        try:
+            with use_fake(fake), patch('api.greetings.claim_lease', return_value=timedelta(seconds=0.05)):
+                greeting = greeting_for(self.user)
+        finally:
+            del _in_flight[key]
+        self.assertEqual(len(greeting.greetings), 5)
+        self.assertEqual(len(fake.calls), 0)
+        self.assertFalse(DailyGreeting.objects.exists())
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+
+    def test_repeated_text_is_served_from_cache(self):
+        fake = FakeGeminiClient()
+        with use_fake(fake):
+            first = gemini_utils.get_thought_advice('Long day at work')
+            second = gemini_utils.get_thought_advice('  Long day   at work ')
+        self.assertEqual(first, second)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(llm_cache.stats()['hits'], 1)
+        self.assertEqual(llm_cache.stats()['misses'], 1)
+
+    def test_fallbacks_are_not_cached(self):
+        fake = FakeGeminiClient(lambda prompt: 'not json')
+        with use_fake(fake):
+            self.assertIs(gemini_utils.get_thought_advice('Long day at work'), gemini_utils.DEFAULT_ADVICE)
+            gemini_utils.get_thought_advice('Long day at work')
+        self.assertEqual(len(fake.calls), 2)
+
+    def test_key_depends_on_prompt_version_and_model(self):
+        key = make_key('advice', 1, 'model-a', ['text'])
+        self.assertNotEqual(key, make_key('advice', 2, 'model-a', ['text']))
+        self.assertNotEqual(key, make_key('advice', 1, 'model-b', ['text']))
+
+    def test_lru_backend_expires_and_evicts(self):
+        now = [0.0]
+        cache = LLMCache(LRUCacheBackend(max_entries=2, clock=lambda: now[0]), ttl=10)
+        compute = lambda: ['value']
+        for key in ('a', 'b', 'a', 'c'):
+            cache.get_or_compute(key, compute, lambda result: True)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 3, 'size': 2})
+        cache.get_or_compute('b', compute, lambda result: True)  # 'b' was least recently used
+        self.assertEqual(cache.misses, 4)
+
+        now[0] = 11
+        cache.get_or_compute('b', compute, lambda result: True)  # still cached but past its TTL
+        self.assertEqual(cache.misses, 5)
+
+
+class GeminiClientTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+
+    def failing_then_ok(self, failures):
+        remaining = [failures]
+
+        def responder(prompt):
+            if remaining[0]:
+                remaining[0] -= 1
+                raise ServerError(503, {'error': {'message': 'overloaded'}})
+            return default_responder(prompt)
+        return FakeGeminiClient(responder)
+
+    def test_retries_server_errors(self):
+        fake = self.failing_then_ok(2)
+        with use_fake(fake):
+            self.assertEqual(gemini_utils.get_thought_advice('Rainy day'), FAKE_ADVICE)
+        self.assertEqual(len(fake.calls), 3)
+
+    def test_gives_up_and_falls_back(self):
+        fake = self.failing_then_ok(10)
+        with use_fake(fake, max_retries=2):
+            self.assertIs(gemini_utils.get_thought_advice('Rainy day'), gemini_utils.DEFAULT_ADVICE)
+        self.assertEqual(len(fake.calls), 3)
+
+    def test_client_errors_are_not_retried(self):
+        def responder(prompt):
+            raise ClientError(400, {'error': {'message': 'bad request'}})
+        fake = FakeGeminiClient(responder)
+        with use_fake(fake):
+            self.assertIs(gemini_utils.get_emotion_probabilities('Rainy day'), gemini_utils.DEFAULT_EMOTION_PROBS)
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_circuit_breaker_fails_fast_then_recovers(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=3, reset_timeout=30, clock=lambda: now[0])
+        fake = self.failing_then_ok(3)
+        client = GeminiClient(raw=fake, max_retries=5, base_delay=0, breaker=breaker)
+
+        with self.assertRaises(CircuitOpenError):
+            client.generate('model', 'sentiment classifier')
+        self.assertEqual(len(fake.calls), 3)
+        self.assertEqual(breaker.state, 'open')
+
+        with self.assertRaises(CircuitOpenError):
+            client.generate('model', 'sentiment classifier')
+        self.assertEqual(len(fake.calls), 3)
+
+        now[0] = 31
+        self.assertEqual(breaker.state, 'half_open')
+        client.generate('model', 'sentiment classifier')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_attempts_share_one_deadline(self):
+        fake = self.failing_then_ok(10)
+        timeouts = []
+        generate_content = fake.models.generate_content
+
+        def recording(model, contents, config=None):
+            timeouts.append(config.http_options.timeout if config and config.http_options else None)
+            return generate_content(model, contents, config)
+        fake.models.generate_content = recording
+
+        client = GeminiClient(raw=fake, timeout=30, deadline=20, max_retries=4)
+        with patch.object(client, 'backoff', return_value=25), patch('gemini_wrapper.client.time.sleep'):
+            with self.assertRaisesRegex(GeminiUnavailable, 'no time left'):
+                client.generate('model', 'sentiment classifier')
+        self.assertEqual(len(fake.calls), 1)
+        self.assertLessEqual(timeouts[0], 20000)
+
+    def test_empty_response_falls_back(self):
+        fake = FakeGeminiClient(lambda prompt: None)
+        with use_fake(fake):
+            self.assertIs(gemini_utils.get_thought_advice('Rainy day'), gemini_utils.DEFAULT_ADVICE)
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_stream_closed_after_output_counts_as_success(self):
+        breaker = CircuitBreaker(threshold=5)
+        breaker.failures = 2
+        client = GeminiClient(raw=FakeGeminiClient(chunk_size=4), breaker=breaker)
+        labels = {'operation': 'generate_stream', 'model': 'model'}
+        ok = CALL_SECONDS.count(outcome='ok', **labels)
+        stream = client.generate_stream('model', 'prompt')
+        next(stream)
+        stream.close()
+        self.assertEqual(breaker.failures, 0)
+        self.assertEqual(CALL_SECONDS.count(outcome='ok', **labels), ok + 1)
+
+    def half_open_breaker(self, now):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 31
+        self.assertEqual(breaker.state, 'half_open')
+        return breaker
+
+    def test_empty_stream_fails_the_half_open_trial(self):
+        now = [0.0]
+        breaker = self.half_open_breaker(now)
+        client = GeminiClient(raw=FakeGeminiClient(lambda prompt: ''), breaker=breaker)
+        with self.assertRaises(EmptyResponse):
+            list(client.generate_stream('model', 'prompt'))
+        self.assertEqual(breaker.state, 'open')
+
+        now[0] = 62
+        self.assertTrue(breaker.allow())  # The next trial isn't blocked by this one
+
+    async def test_cancelled_call_gives_back_the_half_open_trial(self):
+        now = [0.0]
+        breaker = self.half_open_breaker(now)
+        client = GeminiClient(raw=FakeGeminiClient(latency=5), breaker=breaker)
+        task = asyncio.create_task(client.agenerate('model', 'prompt'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertFalse(breaker.trial_in_flight)
+        self.assertTrue(breaker.allow())
+
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+        self.assertTrue(bucket.acquire(0))
+        self.assertTrue(bucket.acquire(0))
+        self.assertFalse(bucket.acquire(0))
+        now[0] = 0.5
+        self.assertTrue(bucket.acquire(0))
+
+
+def read_events(response):
+    """Parse a streamed text/event-stream response into (event, data, seconds since start) tuples."""
+    started = time.monotonic()
+    events = []
+    for chunk in response.streaming_content:
+        for block in chunk.decode().strip().split('\n\n'):
+            event, data = block.split('\n')
+            events.append((event[len('event: '):], json.loads(data[len('data: '):]), time.monotonic() - started))
+    return events
+
+
+class StreamingTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.journal = Journal.objects.create(user=self.user, title='Day', date='2025-06-01', content='A good day')
+
+    def test_json_array_items_are_parsed_across_chunks(self):
+        text = '```json\n["a, \\"b\\" ]", {"x": [1, 2]}, 3, "last"]\n```'
+        for size in (1, 3, 100):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(iter_json_array(chunks)), ['a, "b" ]', {'x': [1, 2]}, 3, 'last'])
+
+    def test_advice_is_streamed_before_generation_finishes_and_saved(self):
+        fake = FakeGeminiClient(chunk_size=8, chunk_latency=0.02)
+        with use_fake(fake):
+            response = self.client.get(f'/api/journals/{self.journal.id}/stream_advice/', HTTP_ACCEPT='text/event-stream')
+            events = read_events(response)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual([event for event, _, _ in events], ['advice'] * 5 + ['done'])
+        self.assertEqual([data['text'] for _, data, _ in events[:5]], FAKE_ADVICE)
+        self.assertLess(events[0][2], events[-1][2] / 2)
+        self.journal.refresh_from_db()
+        self.assertEqual(self.journal.insights.advice_messages, FAKE_ADVICE)
+        self.assertEqual(events[-1][1]['id'], self.journal.insights.id)
+
+    def test_broken_stream_is_completed_from_fallback(self):
+        fake = FakeGeminiClient(lambda prompt: '["First one", "Second one", {"oops": 1}]')
+        with use_fake(fake):
+            advice = list(gemini_utils.stream_thought_advice('Rainy day'))
+        self.assertEqual(advice, ['First one', 'Second one'] + gemini_utils.DEFAULT_ADVICE[2:])
+
+    def test_greetings_stream_is_saved_and_replayed(self):
+        fake = FakeGeminiClient()
+        with use_fake(fake):
+            first = read_events(self.client.get('/api/daily-greetings/stream/', HTTP_ACCEPT='text/event-stream'))
+            second = read_events(self.client.get('/api/daily-greetings/stream/', HTTP_ACCEPT='text/event-stream'))
+        self.assertEqual([data['text'] for event, data, _ in first if event == 'greeting'], FAKE_ADVICE)
+        self.assertEqual([event for event, _, _ in second], ['greeting'] * 5 + ['done'])
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(DailyGreeting.objects.get().greetings, FAKE_ADVICE)
+
+    def test_stream_retries_only_before_first_chunk(self):
+        attempts = []
+
+        def responder(prompt):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ServerError(503, {'error': {'message': 'overloaded'}})
+            return '["one", "two"]'
+
+        client = GeminiClient(raw=FakeGeminiClient(responder), base_delay=0)
+        self.assertEqual(''.join(client.generate_stream('model', 'prompt')), '["one", "two"]')
+        self.assertEqual(len(attempts), 2)
+
+        def broken_stream(model, contents, config=None):
+            yield FakeResponse('["one", ')
+            raise ServerError(503, {'error': {'message': 'dropped'}})
+
+        fake = FakeGeminiClient()
+        fake.models.generate_content_stream = broken_stream
+        client = GeminiClient(raw=fake, base_delay=0)
+        chunks = []
+        with self.assertRaises(GeminiUnavailable):
+            for chunk in client.generate_stream('model', 'prompt'):
+                chunks.append(chunk)
+        self.assertEqual(chunks, ['["one", '])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.journal = Journal.objects.create(user=self.user, title='Day', date='2025-06-01', content='A good day')
+        self.auth = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.factory = AsyncRequestFactory()
+
+    async def test_today_requires_a_token(self):
+        response = await async_views.daily_greeting_today(self.factory.get('/api/daily-greetings/today/'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_concurrent_today_requests_share_one_call(self):
+        fake = FakeGeminiClient(latency=0.1)
+        with use_fake(fake):
+            responses = await asyncio.gather(*[
+                async_views.daily_greeting_today(self.factory.get('/api/daily-greetings/today/', headers={'Authorization': self.auth}))
+                for _ in range(5)
+            ])
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertEqual(json.loads(responses[0].content)['greetings'], FAKE_ADVICE)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(await DailyGreeting.objects.acount(), 1)
+
+    async def test_process_emotions_queues_a_job(self):
+        request = self.factory.post(f'/api/journals/{self.journal.id}/process_emotions/', headers={'Authorization': self.auth})
+        response = await async_views.process_emotions(request, pk=self.journal.id)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(json.loads(response.content)['status'], 'pending')
+        self.assertEqual(await EmotionJob.objects.acount(), 1)
+
+        other = await sync_to_async(User.objects.create_user)(username='bob', password='pw')
+        request = self.factory.post('/', headers={'Authorization': f'Bearer {RefreshToken.for_user(other).access_token}'})
+        self.assertEqual((await async_views.process_emotions(request, pk=self.journal.id)).status_code, 404)
+
+    async def test_agenerate_retries_without_blocking(self):
+        def responder(prompt):
+            if len(fake.calls) <= 2:
+                raise ServerError(503, {'error': {'message': 'overloaded'}})
+            return default_responder(prompt)
+
+        fake = FakeGeminiClient(responder)
+        client = GeminiClient(raw=fake, base_delay=0)
+        self.assertEqual(json.loads(await client.agenerate('model', 'sentiment classifier')), FAKE_EMOTIONS)
+        self.assertEqual(len(fake.calls), 3)
+
+    @override_settings(DEBUG=True)
+    def test_no_middleware_is_adapted_to_a_thread(self):
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_stream_is_sent_as_it_is_generated(self):
+        fake = FakeGeminiClient(chunk_size=8, chunk_latency=0.02)
+        with use_fake(fake):
+            response = await AsyncClient().get(
+                f'/api/journals/{self.journal.id}/stream_advice/', headers={'Authorization': self.auth, 'Accept': 'text/event-stream'}
+            )
+            self.assertTrue(response.is_async)
+            started = time.monotonic()
+            arrivals = [time.monotonic() - started async for _ in response.streaming_content]
+        self.assertEqual(len(arrivals), 6)
+        self.assertLess(arrivals[0], arrivals[-1] / 2)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        llm_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_render_format(self):
+        registry = Registry()
+        calls = Counter('calls', 'Calls made', ['kind'], registry=registry)
+        seconds = Histogram('seconds', 'Time taken', buckets=(0.1, 1.0), registry=registry)
+        calls.inc(kind='a "quoted" kind')
+        seconds.observe(0.5)
+        seconds.observe(2)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP calls Calls made',
+            '# TYPE calls counter',
+            'calls_total{kind="a \\"quoted\\" kind"} 1',
+            '# HELP seconds Time taken',
+            '# TYPE seconds histogram',
+            'seconds_bucket{le="0.1"} 0',
+            'seconds_bucket{le="1.0"} 1',
+            'seconds_bucket{le="+Inf"} 2',
+            'seconds_sum 2.5',
+            'seconds_count 2',
+        ])
+
+    def test_gemini_calls_record_outcome_and_retries(self):
+        def responder(prompt):
+            if len(fake.calls) <= 1:
+                raise ServerError(503, {'error': {'message': 'overloaded'}})
+            return default_responder(prompt)
+
+        fake = FakeGeminiClient(responder)
+        labels = {'operation': 'generate', 'model': 'model-x'}
+        retries = RETRIES.value(**labels)
+        ok = CALL_SECONDS.count(outcome='ok', **labels)
+        with self.assertLogs('gemini_wrapper', 'WARNING'):
+            GeminiClient(raw=fake, base_delay=0).generate('model-x', 'sentiment classifier')
+        self.assertEqual(RETRIES.value(**labels), retries + 1)
+        self.assertEqual(CALL_SECONDS.count(outcome='ok', **labels), ok + 1)
+
+        unavailable = CALL_SECONDS.count(outcome='unavailable', **labels)
+        fake = FakeGeminiClient(lambda prompt: (_ for _ in ()).throw(ServerError(503, {'error': {'message': 'down'}})))
+        with self.assertLogs('gemini_wrapper', 'WARNING'), self.assertRaises(GeminiUnavailable):
+            GeminiClient(raw=fake, base_delay=0, max_retries=1).generate('model-x', 'sentiment classifier')
+        self.assertEqual(CALL_SECONDS.count(outcome='unavailable', **labels), unavailable + 1)
+
+    def test_parse_failures_are_counted_without_logging_content(self):
+        failures = PARSE_FAILURES.value(prompt='advice')
+        fallbacks = FALLBACKS.value(prompt='advice')
+        with use_fake(FakeGeminiClient(lambda prompt: 'private words, not json')), self.assertLogs('gemini_wrapper') as logs:
+            gemini_utils.get_thought_advice('My private entry')
+        self.assertEqual(PARSE_FAILURES.value(prompt='advice'), failures + 1)
+        self.assertEqual(FALLBACKS.value(prompt='advice'), fallbacks + 1)
+        self.assertNotIn('private', '\n'.join(logs.output))
+
+    def test_requests_are_timed_and_served_at_metrics(self):
+        labels = {'method': 'GET', 'view': 'journal-list'}
+        requests, queries = REQUEST_SECONDS.count(status=200, **labels), DB_QUERIES.count(**labels)
+        self.assertEqual(self.client.get('/api/journals/').status_code, 200)
+        self.assertEqual(REQUEST_SECONDS.count(status=200, **labels), requests + 1)
+        self.assertEqual(DB_QUERIES.count(**labels), queries + 1)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('http_request_seconds_bucket{method="GET",view="journal-list",status="200",le="+Inf"}', body)
+        self.assertIn('# TYPE gemini_call_seconds histogram', body)
+
+        # Never public in production
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    async def test_async_requests_count_queries_on_any_thread(self):
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        async def view(request):
+            await sync_to_async(query)()
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with patch.object(DB_QUERIES, 'observe') as observe:
+            await middleware(AsyncRequestFactory().get('/'))
+        self.assertEqual(observe.call_args.args[0], 2)
+
+
+class BenchmarkTests(TestCase):
+    def test_fake_failures_are_seeded(self):
+        def outcomes(seed):
+            fake = FakeGeminiClient(failure_rate=0.5, seed=seed)
+            results = []
+            for _ in range(20):
+                try:
+                    fake.models.generate_content('model', 'prompt')
+                    results.append(True)
+                except ServerError:
+                    results.append(False)
+            return results
+
+        self.assertEqual(outcomes(1), outcomes(1))
+        self.assertIn(False, outcomes(1))
+        self.assertIn(True, outcomes(1))
+
+    def test_endpoints_scenario_saves_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            args = ['benchmark', 'endpoints', '--users', '2', '--journals', '5', '--repeat', '3', '--latency', '0', '--jobs', '4']
+            with self.assertLogs('gemini_wrapper', 'WARNING'):
+                call_command(*args, '--failure-rate', '0.5', '--json', path, stdout=StringIO())
+            with open(path) as f:
+                saved = json.load(f)
+            out = StringIO()
+            call_command(*args, '--compare', path, stdout=out)
+
+        results = saved['results']['endpoints']
+        self.assertEqual(saved['options']['users'], 2)
+        self.assertEqual(results['journals']['requests'], 6)
+        self.assertLessEqual(results['journals']['p50_ms'], results['journals']['p99_ms'])
+        self.assertEqual(results['journals (304)']['max_queries'], 1)
+        self.assertEqual(results['emotion jobs']['jobs'], 4)
+        self.assertGreater(results['emotion jobs']['gemini_calls'], 4)  # Failed calls were retried
+        self.assertIn('vs baseline: p50_ms=', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='benchmark-').exists())
+
+
+class FastJSONTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'Café “quotes” \u2028 line separator',
+            'when': datetime(2025, 6, 1, 8, 30, 15, 123456, tzinfo=pytz.utc),
+            'day': date(2025, 6, 1),
+            'amount': Decimal('1.50'),
+            'tags': {'calm'},
+            'nested': [{'n': 1, 'ok': True, 'none': None, 'ratio': 0.1}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = FastJSONRenderer().render(data, 'application/json; indent=4')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=4'))
+        self.assertIn(b'\n    ', indented)
+        with patch.object(jsonlib, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+            self.assertEqual(jsonlib.loads('{"a": [1, 2]}'), {'a': [1, 2]})
+            self.assertEqual(jsonlib.dumps({'a': 'é'}), '{"a":"é"}'.encode())
+
+    def test_parser(self):
+        response = self.client.post(
+            '/api/journals/', {'title': 'Café', 'date': '2025-06-01', 'content': 'Calm'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Journal.objects.get().title, 'Café')
+        response = self.client.post('/api/journals/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    def test_loads_raises_json_decode_error(self):
+        for backend in (jsonlib.orjson, None):
+            with patch.object(jsonlib, 'orjson', backend), self.assertRaises(json.JSONDecodeError):
+                jsonlib.loads('{"emotions": ')
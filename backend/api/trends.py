@@ -0,0 +1,146 @@
+"""
+Mood trend computations over a user's whole mood history.
+
+The history is pulled as columns with `values_list` and every statistic is
+computed with NumPy array operations, so no model instance is created per
+row and cost grows linearly with a small constant.
+"""
+import numpy as np
+from .models import Journal, MOOD_FIELDS, MOODS, NO_MOOD
+
+
+def load_mood_history(user):
+    """
+    Fetch a user's processed journals as arrays ordered by date.
+
+    Returns (dates, values, dominant): datetime64[D] dates, an (n, 5) float
+    array in MOOD_FIELDS order and int8 dominant mood codes.
+    """
+    rows = Journal.objects.filter(user=user, mood__isnull=False).order_by('date', 'id').values_list(
+        'date', 'mood', 'dominant_mood'
+    )
+    rows = list(rows)
+    if not rows:
+        return np.array([], dtype='datetime64[D]'), np.empty((0, len(MOOD_FIELDS))), np.array([], dtype=np.int8)
+
+    dates, packed, dominant = zip(*rows)
+    dates = np.array(dates, dtype='datetime64[D]')
+    # The packed vectors are fixed-width, so the whole history decodes in one frombuffer
+    basis_points = np.frombuffer(b''.join(map(bytes, packed)), dtype='<u2').reshape(-1, len(MOOD_FIELDS))
+    values = basis_points / 100
+    dominant = np.array(dominant, dtype=np.int8)
+    return dates, values, dominant
+
+
+def daily_means(dates, values, dominant):
+    """
+    Collapse several entries on the same day into their mean. A day's
+    dominant mood is the one of its last entry.
+    """
+    days, starts, counts = np.unique(dates, return_index=True, return_counts=True)
+    means = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+    return days, means, dominant[starts + counts - 1]
+
+
+def rolling(values, window):
+    """
+    Trailing moving average and standard deviation over `window` rows.
+    The first window-1 rows use the rows available so far.
+    """
+    n = len(values)
+    padded = np.vstack([np.zeros((1, values.shape[1])), values])
+    csum = np.cumsum(padded, axis=0)
+    csq = np.cumsum(padded ** 2, axis=0)
+    idx = np.arange(1, n + 1)
+    lo = np.maximum(idx - window, 0)
+    size = (idx - lo)[:, None]
+    mean = (csum[idx] - csum[lo]) / size
+    var = (csq[idx] - csq[lo]) / size - mean ** 2
+    return mean, np.sqrt(np.clip(var, 0.0, None))
+
+
+def dominant_streaks(days, dominant):
+    """
+    Runs of the same dominant mood on consecutive calendar days.
+
+    Returns the current run and the longest run per mood.
+    """
+    longest = {mood: 0 for mood in MOODS}
+    day_numbers = days.astype(np.int64)
+    breaks = np.ones(len(days), dtype=bool)
+    breaks[1:] = (dominant[1:] != dominant[:-1]) | (np.diff(day_numbers) != 1)
+    run_starts = np.flatnonzero(breaks)
+    run_lengths = np.diff(np.append(run_starts, len(days)))
+    run_moods = dominant[run_starts]
+
+    for code, mood in enumerate(MOODS):
+        lengths = run_lengths[run_moods == code]
+        longest[mood] = int(lengths.max()) if len(lengths) else 0
+
+    last_mood = int(run_moods[-1])
+    current = None
+    if last_mood != NO_MOOD:
+        current = {'mood': MOODS[last_mood], 'length': int(run_lengths[-1]), 'since': str(days[run_starts[-1]])}
+    return {'current': current, 'longest': longest}
+
+
+def weekly_deltas(days, values):
+    """Mean per ISO week (Monday start) and the change from the previous recorded week."""
+    day_numbers = days.astype(np.int64)
+    # 1970-01-01 was a Thursday, so shift by 3 to make weeks start on Monday
+    week_starts = (day_numbers - (day_numbers + 3) % 7).astype('datetime64[D]')
+    weeks, starts, counts = np.unique(week_starts, return_index=True, return_counts=True)
+    means = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+    deltas = np.vstack([np.full((1, values.shape[1]), np.nan), np.diff(means, axis=0)])
+    return weeks, means, deltas
+
+
+def compute_trends(dates, values, dominant, window=7, tail=90):
+    """
+    Moving averages, volatility, dominant-mood streaks and week-over-week
+    deltas. Statistics use the whole history; only the last `tail` days and
+    weeks are included in the output.
+    """
+    if len(dates) == 0:
+        return {
+            'entryCount': 0,
+            'dayCount': 0,
+            'window': window,
+            'daily': {'dates': [], 'movingAverage': {}, 'volatility': {}},
+            'weekly': [],
+            'dominantStreaks': {'current': None, 'longest': {mood: 0 for mood in MOODS}},
+        }
+
+    days, day_values, day_dominant = daily_means(dates, values, dominant)
+    moving_average, volatility = rolling(day_values, window)
+    weeks, weekly_means, deltas = weekly_deltas(days, day_values)
+
+    def columns(array):
+        return {field: np.round(array[-tail:, i], 2).tolist() for i, field in enumerate(MOOD_FIELDS)}
+
+    return {
+        'entryCount': int(len(dates)),
+        'dayCount': int(len(days)),
+        'window': window,
+        'daily': {
+            'dates': [str(day) for day in days[-tail:]],
+            'movingAverage': columns(moving_average),
+            'volatility': columns(volatility),
+        },
+        'weekly': [
+            {
+                'weekStart': str(week),
+                'averages': {field: round(float(mean[i]), 2) for i, field in enumerate(MOOD_FIELDS)},
+                'delta': {
+                    field: (None if np.isnan(delta[i]) else round(float(delta[i]), 2))
+                    for i, field in enumerate(MOOD_FIELDS)
+                },
+            }
+            for week, mean, delta in zip(weeks[-tail:], weekly_means[-tail:], deltas[-tail:])
+        ],
+        'dominantStreaks': dominant_streaks(days, day_dominant),
+    }
+
+
+def user_trends(user, window=7, tail=90):
+    return compute_trends(*load_mood_history(user), window=window, tail=tail)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, JournalViewSet, MoodStatViewSet, InsightViewSet, DailyGreetingViewSet
+from . import async_views
+from .views import UserViewSet, JournalViewSet, MoodStatViewSet, InsightViewSet, DailyGreetingViewSet, EmotionJobViewSet, MoodAnalyticsViewSet, MoodTrendViewSet
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -8,8 +10,18 @@ router.register(r'journals', JournalViewSet, basename='journal')
 router.register(r'moodstats', MoodStatViewSet, basename='moodstats')
 router.register(r'insights', InsightViewSet, basename='insights')
 router.register(r'daily-greetings', DailyGreetingViewSet, basename='daily-greeting')
+router.register(r'emotion-jobs', EmotionJobViewSet, basename='emotion-job')
+router.register(r'analytics/moods', MoodAnalyticsViewSet, basename='mood-analytics')
+router.register(r'analytics/trends', MoodTrendViewSet, basename='mood-trends')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('journals/<int:pk>/process_emotions/', JournalViewSet.as_view({'post': 'process_emotions'}), name='journal-process-emotions'),
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_VIEWS:
+    # Ahead of the router so the async versions take these URLs over
+    urlpatterns = [
+        path('journals/<int:pk>/process_emotions/', async_views.process_emotions),
+        path('daily-greetings/today/', async_views.daily_greeting_today),
+    ] + urlpatterns
@@ -1,23 +1,40 @@
 from django.shortcuts import render
 from django.contrib.auth.models import User
-from .models import Journal, MoodStat, Insight, UserStreak, UserProfile, DailyGreeting
+from .models import Journal, JournalEmbedding, Insight, UserStreak, UserProfile, DailyGreeting, EmotionJob, MoodRollup, MOOD_CODES
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from .serializers import UserSerializer, JournalSerializer, MoodStatSerializer, InsightSerializer, DailyGreetingSerializer
+from .serializers import SNIPPET_LENGTH, UserSerializer, JournalSerializer, JournalListSerializer, JournalSearchSerializer, JournalSimilarSerializer, MoodStatSerializer, InsightSerializer, DailyGreetingSerializer, EmotionJobSerializer
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from gemini_wrapper.gemini_utils import get_emotion_probabilities, get_thought_advice, get_daily_greeting_advice
-from django.utils import timezone
+from .emotions import is_processed, save_advice
+from .jobs import enqueue_emotion_job
+from .pagination import JournalCursorPagination, JournalSearchPagination
+from .analytics import apply_mood_change, mood_values, rollup_summary
+from .trends import user_trends
+from .greetings import greeting_for, stream_greeting_for
+from .streaks import journal_date_changed, lock_streak
+from .search import search_journals, search_terms
+from .similarity import embed_on_save, embedding_text, similar_journals
+from .renderers import EventStreamRenderer, FastJSONRenderer, event_stream, sse_event
+from .conditional import ConditionalGetMixin, current_etag, quarter_hour
+from .snapshots import build_snapshots, json_response, page_response
+from gemini_wrapper.gemini_utils import stream_thought_advice
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Substr
+from datetime import date
+import pytz
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 
 # Create your views here.
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+class UserViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = User.objects.select_related('streak', 'profile')
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
+    conditional_actions = {'me': None}
 
     def get_permissions(self):
-        if self.action in ['me', 'delete_account', 'update', 'mark_welcome_seen']:
+        if self.action in ['me', 'delete_account', 'update', 'mark_welcome_seen', 'set_timezone']:
             return [IsAuthenticated()]
         return super().get_permissions()
 
@@ -29,7 +46,9 @@ class UserViewSet(viewsets.ModelViewSet):
                 serializer.save()
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        serializer = self.get_serializer(request.user)
+        # request.user comes from the auth backend without its related rows
+        user = self.get_queryset().get(pk=request.user.pk)
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
     @action(detail=False, methods=['delete'])
@@ -57,188 +76,331 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class JournalViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def set_timezone(self, request):
+        tz_name = request.data.get('timezone')
+        if tz_name not in pytz.all_timezones_set:
+            return Response(
+                {"error": "timezone must be an IANA timezone name such as Asia/Manila"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        UserProfile.objects.update_or_create(user=request.user, defaults={'timezone': tz_name})
+        return Response({'timezone': tz_name})
+
+class JournalViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = JournalSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = JournalCursorPagination
+    conditional_actions = {'list': None, 'retrieve': None}
 
     def get_queryset(self):
-        return Journal.objects.filter(user=self.request.user).order_by('-id', '-date')
+        queryset = Journal.objects.filter(user=self.request.user).order_by('-id', '-date')
+        if self.action not in ('list', 'search'):
+            return queryset.select_related('insights')
+        return self.compact(queryset)
+
+    def compact(self, queryset):
+        """Prepare a queryset for JournalListSerializer and its subclasses."""
+        # Only a prefix of the body is needed, so don't pull full content from the DB
+        queryset = queryset.defer('content').annotate(
+            snippet=Substr('content', 1, SNIPPET_LENGTH)
+        )
+        if 'insights' in self.request.query_params.get('expand', ''):
+            queryset = queryset.select_related('insights')
+        return queryset
+
+    def serves_snapshots(self):
+        """Whether the response has the default JSON shape that JournalSnapshot holds."""
+        params = self.request.query_params
+        return self.request.accepted_renderer.format == 'json' and not params.get('fields') and not params.get('expand')
+
+    def narrow(self, queryset):
+        """Apply ?start= and ?end= (YYYY-MM-DD) and ?mood= (dominant mood). Raises ValueError for a malformed date."""
+        params = self.request.query_params
+        if params.get('start'):
+            queryset = queryset.filter(date__gte=date.fromisoformat(params['start']))
+        if params.get('end'):
+            queryset = queryset.filter(date__lte=date.fromisoformat(params['end']))
+        if params.get('mood'):
+            mood = params['mood']
+            queryset = queryset.filter(dominant_mood=MOOD_CODES[mood]) if mood in MOOD_CODES else queryset.none()
+        return queryset
+
+    def invalid_dates(self):
+        return Response(
+            {"error": "start and end must be dates in YYYY-MM-DD format"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def list(self, request, *args, **kwargs):
+        """The user's journals, newest first; ?start=, ?end= and ?mood= narrow them as in search."""
+        snapshots = self.serves_snapshots()
+        if snapshots:
+            queryset = Journal.objects.filter(user=request.user).order_by('-id', '-date').only('id', 'date').annotate(
+                summary=F('snapshot__summary')
+            )
+        else:
+            queryset = self.get_queryset()
+        try:
+            queryset = self.narrow(queryset)
+        except ValueError:
+            return self.invalid_dates()
 
+        page = self.paginate_queryset(queryset)
+        if not snapshots:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        missing = [journal.pk for journal in page if journal.summary is None]
+        built = build_snapshots(missing) if missing else {}
+        return page_response(self.paginator, [journal.summary or built[journal.pk].summary for journal in page])
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.serves_snapshots():
+            return super().retrieve(request, *args, **kwargs)
+        journal_id, detail = get_object_or_404(
+            Journal.objects.filter(user=request.user).values_list('pk', 'snapshot__detail'), pk=kwargs['pk']
+        )
+        if detail is None:
+            detail = build_snapshots([journal_id])[journal_id].detail
+        return json_response(detail)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return JournalListSerializer
+        if self.action == 'search':
+            return JournalSearchSerializer
+        if self.action == 'similar':
+            return JournalSimilarSerializer
+        return super().get_serializer_class()
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """The user's earlier entries that read most like this one; ?k= sets how many (1-20, default 5)."""
+        try:
+            k = int(request.query_params.get('k', 5))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= 20:
+            return Response(
+                {"error": "k must be a whole number from 1 to 20"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        instance = self.get_object()
+        matches = similar_journals(instance, k)
+        if matches is None:
+            # Not embedded yet; the emotion worker embeds it, analyzing it first if needed
+            enqueue_emotion_job(instance)
+            return Response([])
+        journals = self.compact(Journal.objects.filter(user=request.user)).in_bulk([journal_id for journal_id, score in matches])
+        results = []
+        for journal_id, score in matches:
+            journal = journals.get(journal_id)
+            if journal is None:
+                continue  # Deleted since its vector was read
+            journal.similarity = score
+            results.append(journal)
+        return Response(self.get_serializer(results, many=True).data)
+
+    @action(detail=False, pagination_class=JournalSearchPagination)
+    def search(self, request):
+        """Ranked full-text search over title and content.
+
+        ?q= is required; ?start= and ?end= (YYYY-MM-DD) and ?mood= (dominant
+        mood) narrow the results.
+        """
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            return Response(
+                {"error": "q must contain at least one word"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            queryset = self.narrow(self.get_queryset())
+        except ValueError:
+            return self.invalid_dates()
+
+        queryset = search_journals(queryset, query).order_by('-rank', '-date', '-id')
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @transaction.atomic
     def perform_create(self, serializer):
         journal = serializer.save(user=self.request.user)
-        # Get or create user's streak
-        user_streak, created = UserStreak.objects.get_or_create(user=self.request.user)
-        user_streak.update_streak(journal.date)
+        journal_date_changed(journal.user_id, journal.pk, new_date=journal.date)
+        embed_on_save(journal)
 
-    def _process_journal_content(self, content: str):
-        """Process journal content to get emotions and advice"""
-        try:
-            emotions = get_emotion_probabilities(content)
-            advice_list = get_thought_advice(content)
-            
-            # Convert emotion probabilities to percentages
-            max_val = max(emotions.values())
-            top_emotions = [k for k, v in emotions.items() if v == max_val]
-            
-            mood_stats = {
-                'percentHappiness': emotions['happy'] * 100,
-                'percentFear': emotions['fear'] * 100,
-                'percentSadness': emotions['sad'] * 100,
-                'percentDisgust': emotions['disgust'] * 100,
-                'percentAnger': emotions['anger'] * 100,
-                'dominantMood': top_emotions[0] if len(top_emotions) == 1 else ''
-            }
-            
-            # Create insight from advice
-            insight = {
-                'insightContent': '\n'.join(advice_list)
-            }
-            
-            return mood_stats, insight
-        except Exception as e:
-            print(f"Error in _process_journal_content: {str(e)}")
-            print(f"Content: {content}")
-            print(f"Emotions: {emotions if 'emotions' in locals() else 'Not created'}")
-            raise
+    @transaction.atomic
+    def perform_update(self, serializer):
+        lock_streak(serializer.instance.user_id)
+        # The emotion worker may have saved an analysis since the journal was loaded;
+        # reload it under a row lock so the save below doesn't write the old one back
+        serializer.instance.refresh_from_db(from_queryset=Journal.objects.select_for_update())
+        old_date = serializer.instance.date
+        old_text = embedding_text(serializer.instance)
+        journal = serializer.save()
+        journal_date_changed(journal.user_id, journal.pk, old_date, journal.date)
+        if embedding_text(journal) != old_text:
+            JournalEmbedding.objects.filter(journal=journal).delete()
+            embed_on_save(journal)
+        if journal.date != old_date and journal.moodStats:
+            # Move the entry's mood into the rollups for its new date
+            values = mood_values(journal.moodStats)
+            apply_mood_change(journal.user_id, old_date, values, journal.date, values)
 
     @transaction.atomic
+    def perform_destroy(self, instance):
+        apply_mood_change(instance.user_id, instance.date, mood_values(instance.moodStats))
+        lock_streak(instance.user_id)
+        journal_id = instance.pk
+        instance.delete()
+        journal_date_changed(instance.user_id, journal_id, old_date=instance.date)
+
     def process_emotions(self, request, *args, **kwargs):
-        """Process emotions and generate insights for a journal entry"""
-        try:
-            instance = self.get_object()
-            current_content = instance.content
-            
-            print(f"Processing emotions for journal {instance.id}")
-            print(f"Content: {current_content}")
-            
-            # Store last processed content in Journal model
-            if hasattr(instance, 'lastProcessedContent') and instance.lastProcessedContent == current_content:
-                print("Content already processed, skipping")
-                serializer = self.get_serializer(instance)
-                return Response(serializer.data)
-            
-            # Process the journal content
-            print("Processing journal content...")
-            mood_stats, insight = self._process_journal_content(instance.content)
-            print(f"Mood stats: {mood_stats}")
-            print(f"Insight: {insight}")
-            
-            # Create or update MoodStat
-            try:
-                if instance.moodStats:
-                    print("Updating existing MoodStat")
-                    for key, value in mood_stats.items():
-                        setattr(instance.moodStats, key, value)
-                    instance.moodStats.save()
-                else:
-                    print("Creating new MoodStat")
-                    instance.moodStats = MoodStat.objects.create(**mood_stats)
-            except Exception as e:
-                print(f"Error with MoodStat: {str(e)}")
-                raise
-            
-            # Create or update Insight
-            try:
-                if instance.insights:
-                    print("Updating existing Insight")
-                    instance.insights.advice_messages = insight['insightContent'].split('\n')
-                    instance.insights.save()
-                else:
-                    print("Creating new Insight")
-                    instance.insights = Insight.objects.create(
-                        advice_messages=insight['insightContent'].split('\n'),
-                        user=request.user
-                    )
-            except Exception as e:
-                print(f"Error with Insight: {str(e)}")
-                raise
-            
-            instance.lastProcessedContent = current_content
-            instance.save()
-            print("Successfully processed emotions")
-            
+        """Queue emotion processing for a journal entry.
+
+        Returns the journal if its current content was already processed,
+        otherwise 202 with the job to poll at /emotion-jobs/{id}/.
+        """
+        instance = self.get_object()
+        if is_processed(instance):
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
-        except Exception as e:
-            print(f"Error processing emotions: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return Response(
-                {"error": f"Failed to process emotions: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
 
-class MoodStatViewSet(viewsets.ModelViewSet):
-    queryset = MoodStat.objects.all()
-    serializer_class = MoodStatSerializer 
+        job, created = enqueue_emotion_job(instance)
+        return Response(EmotionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], renderer_classes=[FastJSONRenderer, EventStreamRenderer])
+    def stream_advice(self, request, pk=None):
+        """Generate advice for the entry as Server-Sent Events.
+
+        Sends an `advice` event ({index, text}) as soon as each message is
+        generated, then `done` with the saved insight.
+        """
+        journal = self.get_object()
+        content = journal.content
+
+        def events():
+            advice_list = []
+            for index, advice in enumerate(stream_thought_advice(content)):
+                advice_list.append(advice)
+                yield sse_event('advice', {'index': index, 'text': advice})
+            yield sse_event('done', InsightSerializer(save_advice(journal, advice_list)).data)
+
+        return event_stream(events(), request)
+
+class MoodStatViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only compatibility endpoint from when moods had their own table:
+    the moodStats of the user's processed journals, under the journal ids.
+    """
+    serializer_class = MoodStatSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Journal.objects.filter(user=self.request.user, mood__isnull=False).only('mood', 'dominant_mood').order_by('-id')
+
+    def get_serializer(self, instance=None, *args, **kwargs):
+        if kwargs.get('many'):
+            instance = [journal.moodStats for journal in instance]
+        elif instance is not None:
+            instance = instance.moodStats
+        return super().get_serializer(instance, *args, **kwargs)
+
 class InsightViewSet(viewsets.ModelViewSet):
-    queryset = Insight.objects.all()
     serializer_class = InsightSerializer
     permission_classes = [IsAuthenticated]
 
-class DailyGreetingViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return Insight.objects.filter(user=self.request.user).order_by('-id')
+
+class MoodAnalyticsViewSet(viewsets.ViewSet):
+    """Average mood percentages and dominant-mood counts per day, week or month."""
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        period = request.query_params.get('period', 'week')
+        if period not in dict(MoodRollup.PERIODS):
+            return Response(
+                {"error": "period must be one of: day, week, month"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rollups = MoodRollup.objects.filter(user=request.user, period=period, entry_count__gt=0)
+        try:
+            if request.query_params.get('start'):
+                rollups = rollups.filter(period_start__gte=date.fromisoformat(request.query_params['start']))
+            if request.query_params.get('end'):
+                rollups = rollups.filter(period_start__lte=date.fromisoformat(request.query_params['end']))
+        except ValueError:
+            return Response(
+                {"error": "start and end must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response([rollup_summary(rollup) for rollup in rollups.order_by('period_start')])
+
+class MoodTrendViewSet(viewsets.ViewSet):
+    """Moving averages, volatility, dominant-mood streaks and week-over-week deltas."""
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        try:
+            window = int(request.query_params.get('window', 7))
+            days = int(request.query_params.get('days', 90))
+        except ValueError:
+            return Response(
+                {"error": "window and days must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= window <= 365 or not 1 <= days <= 3660:
+            return Response(
+                {"error": "window must be 1-365 and days 1-3660"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(user_trends(request.user, window=window, tail=days))
+
+class EmotionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = EmotionJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return EmotionJob.objects.filter(user=self.request.user).order_by('-created_at')
+
+class DailyGreetingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = DailyGreetingSerializer
     permission_classes = [IsAuthenticated]
+    conditional_actions = {'today': quarter_hour}  # The greeting also changes with the time period
 
     def get_queryset(self):
-        return DailyGreeting.objects.filter(user=self.request.user).order_by('-date')
-
-    def get_time_period(self):
-        """Get the current time period based on hour"""
-        hour = timezone.now().hour
-        if 5 <= hour < 8:
-            return 'dawn'
-        elif 8 <= hour < 12:
-            return 'morning'
-        elif 12 <= hour < 14:
-            return 'noon'
-        elif 14 <= hour < 17:
-            return 'afternoon'
-        elif 17 <= hour < 22:
-            return 'evening'
-        else:  # 22-4
-            return 'midnight'
+        # Empty rows are placeholders for greetings still being generated
+        return DailyGreeting.objects.filter(user=self.request.user).exclude(greetings=[]).order_by('-date')
 
     @action(detail=False, methods=['get'])
     def today(self, request):
-        """Get or create today's greetings for the user"""
-        today = timezone.now().date()
-        current_period = self.get_time_period()
-        
-        # Try to get today's greetings
+        """Get today's greetings for the current time period, normally prewarmed by prewarm_greetings"""
         try:
-            daily_greeting = DailyGreeting.objects.get(
-                user=request.user, 
-                date=today,
-                time_period=current_period
+            daily_greeting = greeting_for(request.user)
+        except Exception as e:
+            return Response(
+                {"error": f"Failed to generate daily greetings: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            serializer = self.get_serializer(daily_greeting)
-            return Response(serializer.data)
-        except DailyGreeting.DoesNotExist:
-            # If no greetings exist for this period, create new ones
-            try:
-                # Get today's journal entries
-                today_entries = Journal.objects.filter(
-                    user=request.user,
-                    date=today
-                ).values_list('content', flat=True)
-                
-                # Generate new greetings
-                greetings = get_daily_greeting_advice(list(today_entries))
-                
-                # Create new daily greeting
-                daily_greeting = DailyGreeting.objects.create(
-                    user=request.user,
-                    greetings=greetings,
-                    time_period=current_period
-                )
-                
-                serializer = self.get_serializer(daily_greeting)
-                return Response(serializer.data)
-            except Exception as e:
-                return Response(
-                    {"error": f"Failed to generate daily greetings: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
\ No newline at end of file
+        # Generating the greeting bumped the version read in initial()
+        self.conditional_etag = current_etag(request.user.id, quarter_hour)
+        serializer = self.get_serializer(daily_greeting)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], renderer_classes=[FastJSONRenderer, EventStreamRenderer])
+    def stream(self, request):
+        """Today's greetings as Server-Sent Events: a `greeting` event ({index, text}) per message, then `done`"""
+        def events():
+            index = 0
+            for event, payload in stream_greeting_for(request.user):
+                if event == 'greeting':
+                    yield sse_event('greeting', {'index': index, 'text': payload})
+                    index += 1
+                else:
+                    yield sse_event('done', self.get_serializer(payload).data)
+
+        return event_stream(events(), request)
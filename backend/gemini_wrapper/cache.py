@@ -0,0 +1,190 @@
+"""
+Content-addressed cache for Gemini results.
+
+Keys are a SHA-256 of (namespace, prompt template version, model name,
+normalized input), so re-saved or whitespace-only edits of the same text hit
+the cache while a prompt or model change naturally invalidates old entries.
+
+Backends:
+    memory  - in-process LRU with TTL (default)
+    django  - any Django cache alias, e.g. a DatabaseCache table shared by all workers
+    none    - disable caching
+
+Configured with LLM_CACHE_BACKEND, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES and
+LLM_CACHE_ALIAS environment variables.
+"""
+import copy
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and collapse whitespace so trivially different inputs share a key."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    return value
+
+
+def make_key(namespace: str, version: Any, model: str, payload: Any) -> str:
+    material = json.dumps([namespace, version, model, _normalize(payload)], sort_keys=True, default=str)
+    return f"llm:{namespace}:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
+
+
+class LRUCacheBackend:
+    """Thread-safe in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                return MISSING
+            value, expires_at = item
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: Optional[float]):
+        expires_at = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """Stores entries in a Django cache alias; eviction follows that cache's own settings."""
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key: str):
+        return self._cache.get(key, MISSING)
+
+    def set(self, key: str, value, ttl: Optional[float]):
+        self._cache.set(key, value, timeout=ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class LLMCache:
+    def __init__(self, backend=None, ttl: Optional[float] = None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        kind = os.getenv("LLM_CACHE_BACKEND", "memory")
+        ttl = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+        if kind == "django":
+            backend = DjangoCacheBackend(os.getenv("LLM_CACHE_ALIAS", "default"))
+        elif kind == "memory":
+            backend = LRUCacheBackend(int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")))
+        else:
+            backend = None
+        return cls(backend, ttl)
+
+    def get(self, key: str):
+        """The cached value for key, or MISSING."""
+        if self.backend is None:
+            return MISSING
+        value = self.backend.get(key)
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value if value is MISSING else copy.deepcopy(value)
+
+    def set(self, key: str, value):
+        if self.backend is not None:
+            self.backend.set(key, copy.deepcopy(value), self.ttl)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], should_cache: Callable[[Any], bool]):
+        if self.backend is None:
+            return compute()
+
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        value = compute()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        size = len(self.backend) if isinstance(self.backend, LRUCacheBackend) else None
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+llm_cache = LLMCache.from_env()
+
+
+def cached_llm_call(namespace: str, version: Any, model: str, should_cache: Callable[[Any], bool] = lambda result: True):
+    """
+    Cache a Gemini helper's result keyed on its arguments.
+
+    `should_cache` rejects results that shouldn't be reused, such as fallback
+    defaults returned when the API was unavailable.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return llm_cache.get_or_compute(cache_key(*args, **kwargs), lambda: func(*args, **kwargs), should_cache)
+
+        def cache_key(*args, **kwargs):
+            return make_key(namespace, version, model, [args, kwargs])
+
+        wrapper.uncached = func
+        wrapper.cache_key = cache_key  # Lets other code paths (e.g. streaming) share the cached results
+        return wrapper
+    return decorator
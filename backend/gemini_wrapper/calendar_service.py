@@ -0,0 +1,93 @@
+"""
+Time period and holiday lookups for greetings.
+
+Holiday tables are built once per year and timezones resolved once per name,
+so looking up the context for a greeting is a few dict and tuple lookups.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Optional
+import holidays
+import pytz
+
+DEFAULT_TIMEZONE = "Asia/Manila"
+
+# Hour each greeting period starts at, in order through the day
+GREETING_PERIODS = [
+    (5, "dawn"),
+    (8, "morning"),
+    (12, "noon"),
+    (14, "afternoon"),
+    (17, "evening"),
+    (22, "midnight"),
+]
+
+def _period_by_hour():
+    periods = []
+    for hour in range(24):
+        time_period = "midnight"  # 22-4
+        for start, period in GREETING_PERIODS:
+            if hour >= start:
+                time_period = period
+        periods.append(time_period)
+    return tuple(periods)
+
+PERIOD_BY_HOUR = _period_by_hour()
+
+
+@dataclass(frozen=True)
+class GreetingMoment:
+    """Everything a greeting depends on about when it is shown."""
+    local_time: datetime
+    date: date
+    day_of_week: str
+    time_period: str
+    holiday_name: Optional[str]
+
+    @property
+    def is_holiday(self) -> bool:
+        return self.holiday_name is not None
+
+
+def get_time_period(hour: int) -> str:
+    """Greeting period for an hour of the day; 22-4 is midnight."""
+    return PERIOD_BY_HOUR[hour]
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str):
+    """pytz timezone for an IANA name, falling back to DEFAULT_TIMEZONE for unknown names."""
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+@lru_cache(maxsize=16)
+def holiday_table(year: int) -> Dict[date, str]:
+    """Philippine holidays for one year, keyed by date."""
+    return dict(holidays.PH(years=year))
+
+def get_holiday_name(day: date) -> Optional[str]:
+    return holiday_table(day.year).get(day)
+
+def greeting_moment(at: Optional[datetime] = None, timezone: str = DEFAULT_TIMEZONE) -> GreetingMoment:
+    """
+    Resolve the period, weekday and holiday for a moment in a timezone.
+
+    Args:
+        at (datetime): Aware datetime to resolve (default: now)
+        timezone (str): IANA timezone name of the user
+
+    Returns:
+        GreetingMoment: The local time and its greeting context
+    """
+    tz = get_timezone(timezone)
+    local_time = at.astimezone(tz) if at else datetime.now(tz)
+    local_date = local_time.date()
+    return GreetingMoment(
+        local_time=local_time,
+        date=local_date,
+        day_of_week=local_time.strftime("%A"),
+        time_period=PERIOD_BY_HOUR[local_time.hour],
+        holiday_name=get_holiday_name(local_date),
+    )
@@ -0,0 +1,478 @@
+"""
+Shared, resilient wrapper around `genai.Client`.
+
+One GeminiClient is created per process and reused by every helper in
+gemini_utils, so they share one pooled HTTP connection set, one rate limiter
+and one circuit breaker. Each call is retried with exponential backoff and
+full jitter, and all of its attempts share one deadline: an attempt's request
+timeout is cut to the time left, and a retry that couldn't start before the
+deadline isn't made. The breaker opens after repeated upstream
+failures so callers fall back to their defaults immediately instead of piling
+retries onto an overloaded API. `agenerate` does the same on genai's async
+client for ASGI views. Every call is timed and counted in gemini_wrapper.metrics.
+
+Configured with environment variables:
+    GEMINI_TIMEOUT                 per-request timeout in seconds (default 30)
+    GEMINI_DEADLINE                seconds for a whole call, retries included (default 45)
+    GEMINI_MAX_RETRIES             retries after the first attempt (default 4)
+    GEMINI_MAX_CONNECTIONS         HTTP connection pool size (default 20)
+    GEMINI_RATE_LIMIT              requests per second, 0 to disable (default 10)
+    GEMINI_RATE_LIMIT_BACKEND      "memory" (per process) or "django" (shared cache)
+    GEMINI_BREAKER_THRESHOLD       consecutive failures before opening (default 5)
+    GEMINI_BREAKER_RESET           seconds before a trial call is allowed (default 30)
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Iterator, List, Optional
+
+import httpx
+from google import genai
+from google.genai import types
+from google.genai.errors import ClientError, ServerError
+
+from gemini_wrapper.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+CALL_SECONDS = Histogram("gemini_call_seconds", "Gemini calls including retries, by outcome", ["operation", "model", "outcome"])
+PROMPT_CHARS = Histogram(
+    "gemini_prompt_chars", "Characters sent per Gemini call", ["operation", "model"],
+    buckets=(250, 500, 1000, 2500, 5000, 10000, 25000, 50000),
+)
+RETRIES = Counter("gemini_retries", "Gemini attempts retried after an error", ["operation", "model"])
+
+
+class GeminiUnavailable(Exception):
+    """The call could not be completed; callers should use their fallback."""
+
+
+class CircuitOpenError(GeminiUnavailable):
+    pass
+
+
+class EmptyResponse(GeminiUnavailable):
+    """Gemini answered without any text, for example because the output was blocked by safety filters."""
+
+
+class RateLimitExceeded(GeminiUnavailable):
+    pass
+
+
+class TokenBucket:
+    """In-process token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token if available. Returns 0, or the seconds until one will be."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, max_wait: float) -> bool:
+        deadline = self.clock() + max_wait
+        while True:
+            wait = self._take()
+            if wait == 0.0:
+                return True
+            if self.clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, max_wait: float) -> bool:
+        deadline = self.clock() + max_wait
+        while True:
+            wait = self._take()
+            if wait == 0.0:
+                return True
+            if self.clock() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class CacheRateLimiter:
+    """
+    Request budget shared by every worker through a Django cache.
+
+    Uses a per-second fixed-window counter, which only needs the cache's
+    add/incr operations and so works on any backend that all workers share.
+    """
+
+    def __init__(self, rate: float, alias: str = "default", prefix: str = "gemini-rate"):
+        self.rate = rate
+        self.alias = alias
+        self.prefix = prefix
+
+    def acquire(self, max_wait: float) -> bool:
+        from django.core.cache import caches
+        cache = caches[self.alias]
+        deadline = time.time() + max_wait
+        while True:
+            now = time.time()
+            key = f"{self.prefix}:{int(now)}"
+            cache.add(key, 0, timeout=5)
+            try:
+                used = cache.incr(key)
+            except ValueError:  # Expired between add and incr
+                continue
+            if used <= self.rate:
+                return True
+            next_window = int(now) + 1
+            if next_window > deadline:
+                return False
+            time.sleep(next_window - now)
+
+    async def aacquire(self, max_wait: float) -> bool:
+        from django.core.cache import caches
+        cache = caches[self.alias]
+        deadline = time.time() + max_wait
+        while True:
+            now = time.time()
+            key = f"{self.prefix}:{int(now)}"
+            await cache.aadd(key, 0, timeout=5)
+            try:
+                used = await cache.aincr(key)
+            except ValueError:  # Expired between add and incr
+                continue
+            if used <= self.rate:
+                return True
+            next_window = int(now) + 1
+            if next_window > deadline:
+                return False
+            await asyncio.sleep(next_window - now)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open every call is
+    rejected; after `reset_timeout` seconds a single trial call is let through
+    and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back an allowed call that was never made."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ServerError):
+        return True
+    if isinstance(error, ClientError):
+        return error.code == 429  # Quota / rate limited upstream
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _outcome(error_type) -> str:
+    if error_type is None:
+        return "ok"
+    for kind, outcome in ((CircuitOpenError, "circuit_open"), (RateLimitExceeded, "rate_limited"),
+                          (EmptyResponse, "empty"), (GeminiUnavailable, "unavailable"), (GeneratorExit, "cancelled")):
+        if issubclass(error_type, kind):
+            return outcome
+    return "error"
+
+
+class CallSpan:
+    """
+    Times one client call, retries included, and records its prompt size,
+    attempts and outcome. `delivered` marks a stream that already yielded
+    output, so a consumer that stops reading early still counts as ok.
+    """
+
+    def __init__(self, operation: str, model: str, contents, deadline: float):
+        self.operation = operation
+        self.model = model
+        self.attempts = 0
+        self.delivered = False
+        self.deadline = time.monotonic() + deadline
+        size = len(contents) if isinstance(contents, str) else sum(len(text) for text in contents)
+        PROMPT_CHARS.observe(size, operation=operation, model=model)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def __exit__(self, error_type, error, traceback):
+        outcome = "ok" if error_type is GeneratorExit and self.delivered else _outcome(error_type)
+        CALL_SECONDS.observe(time.perf_counter() - self.start, operation=self.operation, model=self.model, outcome=outcome)
+        if self.attempts > 1:
+            RETRIES.inc(self.attempts - 1, operation=self.operation, model=self.model)
+        return False
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        raw=None,
+        timeout: float = 30.0,
+        deadline: float = 45.0,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 16.0,
+        max_connections: int = 20,
+        rate_limiter=None,
+        rate_limit_wait: float = 10.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_key = api_key
+        self.raw = raw  # Underlying genai.Client (or a fake); created on first use when None
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.rate_limit_wait = rate_limit_wait
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, api_key: Optional[str] = None) -> "GeminiClient":
+        rate = float(os.getenv("GEMINI_RATE_LIMIT", "10"))
+        rate_limiter = None
+        if rate > 0:
+            if os.getenv("GEMINI_RATE_LIMIT_BACKEND", "memory") == "django":
+                rate_limiter = CacheRateLimiter(rate)
+            else:
+                rate_limiter = TokenBucket(rate)
+        return cls(
+            api_key=api_key,
+            timeout=float(os.getenv("GEMINI_TIMEOUT", "30")),
+            deadline=float(os.getenv("GEMINI_DEADLINE", "45")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+            max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", "20")),
+            rate_limiter=rate_limiter,
+            breaker=CircuitBreaker(
+                threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+            ),
+        )
+
+    def get_raw(self):
+        if self.raw is None:
+            with self._lock:
+                if self.raw is None:
+                    limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+                    self.raw = genai.Client(
+                        api_key=self.api_key,
+                        http_options=types.HttpOptions(
+                            timeout=int(self.timeout * 1000),  # milliseconds
+                            client_args={"limits": limits},
+                            async_client_args={"limits": limits},
+                        ),
+                    )
+        return self.raw
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry number (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _acquire(self, span: CallSpan):
+        """Pass the breaker and the rate limiter before an attempt."""
+        if not self.breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        if self.rate_limiter and not self.rate_limiter.acquire(min(self.rate_limit_wait, span.remaining())):
+            self.breaker.release()
+            raise RateLimitExceeded("Gemini rate limit reached")
+
+    async def _aacquire(self, span: CallSpan):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        try:
+            acquired = not self.rate_limiter or await self.rate_limiter.aacquire(min(self.rate_limit_wait, span.remaining()))
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        if not acquired:
+            self.breaker.release()
+            raise RateLimitExceeded("Gemini rate limit reached")
+
+    def _attempt_config(self, span: CallSpan, config, config_type):
+        """`config` with the request timeout cut to the time left before the call's deadline."""
+        remaining = span.remaining()
+        if remaining >= self.timeout:
+            return config
+        if config is None:
+            config = config_type()
+        options = (config.http_options or types.HttpOptions()).model_copy(update={"timeout": max(1, int(remaining * 1000))})
+        return config.model_copy(update={"http_options": options})
+
+    def _retry_delay(self, span: CallSpan, error: Exception, attempt: int, can_retry: bool = True) -> float:
+        """Record a failed attempt and return the delay before the next one, or raise if there won't be one."""
+        if not _is_retryable(error):
+            self.breaker.record_success()  # The upstream answered, just not happily
+            raise error
+        self.breaker.record_failure()
+        if attempt == self.max_retries or not can_retry:
+            raise GeminiUnavailable(f"Gemini call failed after {attempt + 1} attempts: {error}") from error
+        delay = self.backoff(attempt)
+        if delay >= span.remaining():
+            raise GeminiUnavailable(
+                f"Gemini call failed after {attempt + 1} attempts, with no time left for another: {error}"
+            ) from error
+        logger.warning("Gemini attempt %d failed (%s); retrying in %.1f seconds", attempt + 1, error, delay)
+        return delay
+
+    def _text(self, response) -> str:
+        """The response text; a response without any is an answer too, but not one callers can use."""
+        self.breaker.record_success()
+        if response.text is None:
+            raise EmptyResponse("Gemini returned no text")
+        return response.text
+
+    def generate(self, model: str, contents: str, config=None) -> str:
+        """
+        Generate content and return the response text.
+
+        Raises GeminiUnavailable when the breaker is open, the rate limit
+        can't be met in time, or retries are exhausted. Other API errors
+        (bad request, auth) are raised as-is.
+        """
+        with CallSpan("generate", model, contents, self.deadline) as span:
+            for attempt in range(self.max_retries + 1):
+                span.attempts += 1
+                self._acquire(span)
+                try:
+                    response = self.get_raw().models.generate_content(
+                        model=model, contents=contents, config=self._attempt_config(span, config, types.GenerateContentConfig)
+                    )
+                except Exception as e:
+                    time.sleep(self._retry_delay(span, e, attempt))
+                else:
+                    return self._text(response)
+
+    def embed(self, model: str, contents: List[str], config=None) -> List[List[float]]:
+        """Embed a batch of texts and return one vector per text. Fails like generate()."""
+        with CallSpan("embed", model, contents, self.deadline) as span:
+            for attempt in range(self.max_retries + 1):
+                span.attempts += 1
+                self._acquire(span)
+                try:
+                    response = self.get_raw().models.embed_content(
+                        model=model, contents=contents, config=self._attempt_config(span, config, types.EmbedContentConfig)
+                    )
+                except Exception as e:
+                    time.sleep(self._retry_delay(span, e, attempt))
+                else:
+                    self.breaker.record_success()
+                    return [embedding.values for embedding in response.embeddings]
+
+    async def agenerate(self, model: str, contents: str, config=None) -> str:
+        """
+        Async form of generate() on the genai async client, for ASGI views.
+        Waiting on Gemini, the rate limit or a backoff doesn't block the event loop.
+        """
+        with CallSpan("agenerate", model, contents, self.deadline) as span:
+            for attempt in range(self.max_retries + 1):
+                span.attempts += 1
+                await self._aacquire(span)
+                try:
+                    response = await self.get_raw().aio.models.generate_content(
+                        model=model, contents=contents, config=self._attempt_config(span, config, types.GenerateContentConfig)
+                    )
+                except asyncio.CancelledError:
+                    # The request went away mid-call; a half-open trial must not stay taken
+                    self.breaker.release()
+                    raise
+                except Exception as e:
+                    await asyncio.sleep(self._retry_delay(span, e, attempt))
+                else:
+                    return self._text(response)
+
+    def generate_stream(self, model: str, contents: str, config=None) -> Iterator[str]:
+        """
+        Generate content and yield the response text as it arrives.
+
+        Failures are retried like generate() until the first chunk has been
+        yielded; after that the caller has already used part of the output,
+        so a failure raises GeminiUnavailable instead. The deadline covers
+        the attempts up to the first chunk.
+        """
+        with CallSpan("generate_stream", model, contents, self.deadline) as span:
+            for attempt in range(self.max_retries + 1):
+                span.attempts += 1
+                self._acquire(span)
+                try:
+                    stream = self.get_raw().models.generate_content_stream(
+                        model=model, contents=contents, config=self._attempt_config(span, config, types.GenerateContentConfig)
+                    )
+                    for chunk in stream:
+                        if chunk.text:
+                            span.delivered = True
+                            yield chunk.text
+                except GeneratorExit:
+                    # The consumer stopped reading. Output it already had means the upstream worked.
+                    if span.delivered:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.release()
+                    raise
+                except Exception as e:
+                    time.sleep(self._retry_delay(span, e, attempt, can_retry=not span.delivered))
+                else:
+                    if not span.delivered:
+                        self.breaker.record_failure()
+                        raise EmptyResponse("Gemini returned no text")
+                    self.breaker.record_success()
+                    return
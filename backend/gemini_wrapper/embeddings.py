@@ -0,0 +1,95 @@
+"""
+Text embeddings behind one small interface.
+
+An embedder has a `name`, stored with every vector so vectors from different
+embedders are never compared, a `dimensions` count, a `remote` flag for
+embedders that call out over the network, and `embed(texts)` returning an (n, dimensions) float32 array of unit-length rows, so cosine
+similarity is a plain dot product.
+
+HashingEmbedder is deterministic and needs no network, so similar-entry
+search works offline and in tests. GeminiEmbedder uses Gemini's embedding
+model through the shared GeminiClient. get_embedder() picks one from the
+EMBEDDER environment variable ("hashing", the default, or "gemini").
+"""
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+from google.genai import types
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+STOP_WORDS = frozenset("""
+a an and are as at be been but by did do for from had has have i i'm im in is it it's its just me my of on or so
+that the then there this to today too up very was we were what when with you
+""".split())
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length, leaving all-zero rows as they are."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+@lru_cache(maxsize=65536)
+def _slot(feature: str, dimensions: int):
+    """Index and sign of a hashed feature; shared by every HashingEmbedder of the same size."""
+    digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+    return digest % dimensions, 1.0 if digest >> 63 else -1.0
+
+
+class HashingEmbedder:
+    """
+    Signed feature hashing of words and word pairs with sublinear term
+    frequency (1 + log tf). Stop words are dropped in place of corpus-wide
+    IDF, which a per-entry embedding can't know.
+    """
+    remote = False
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def features(self, text: str) -> List[str]:
+        words = [word for word in TOKEN_RE.findall(text.lower()) if word not in STOP_WORDS]
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self.features(text):
+                counts[feature] = counts.get(feature, 0) + 1
+            for feature, count in counts.items():
+                index, sign = _slot(feature, self.dimensions)
+                vectors[row, index] += sign * (1 + np.log(count))
+        return normalize(vectors)
+
+
+class GeminiEmbedder:
+    """Gemini's text embedding model, batched to the API's limit per request."""
+    BATCH_SIZE = 100
+    remote = True
+
+    def __init__(self, client, model: str = "text-embedding-004", dimensions: int = 768):
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.name = f"gemini-{model}-{dimensions}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        config = types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY", output_dimensionality=self.dimensions)
+        vectors = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            vectors += self.client.embed(self.model, list(texts[start:start + self.BATCH_SIZE]), config)
+        return normalize(np.array(vectors, dtype=np.float32).reshape(len(texts), self.dimensions))
+
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    if os.getenv("EMBEDDER", "hashing") == "gemini":
+        from gemini_wrapper import gemini_utils
+        return GeminiEmbedder(gemini_utils.client)
+    return HashingEmbedder()
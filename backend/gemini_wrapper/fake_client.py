@@ -0,0 +1,166 @@
+"""
+Offline stand-in for `genai.Client`.
+
+Only the surface gemini_utils uses is implemented: `client.models.generate_content`
+returning an object with a `.text` attribute, its async twin
+`client.aio.models.generate_content`, `generate_content_stream` yielding
+such objects a few characters at a time, and `embed_content` returning
+deterministic pseudo-random vectors. A seeded failure rate makes a share of
+calls raise a 503 the way an overloaded API does. Swap it in with
+`gemini_utils.client = FakeGeminiClient()` or `unittest.mock.patch`.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import threading
+from typing import Callable, Optional
+
+from google.genai.errors import ServerError
+
+FAKE_EMOTIONS = {"happy": 0.6, "sad": 0.1, "fear": 0.1, "disgust": 0.1, "anger": 0.1}
+FAKE_ADVICE = [
+    "You are doing better than you think.",
+    "Take a short walk and notice something nice.",
+    "Drink some water and rest your eyes.",
+    "Write down one thing you are grateful for.",
+    "Reach out to a friend today.",
+]
+
+
+def default_responder(prompt: str) -> str:
+    """Answer each prompt kind with a valid canned payload."""
+    if '<entry id="' in prompt:
+        ids = re.findall(r'<entry id="([^"]+)">', prompt)
+        return json.dumps([{"id": entry_id, "emotions": FAKE_EMOTIONS, "advice": FAKE_ADVICE} for entry_id in ids])
+    if '"emotions"' in prompt:
+        return json.dumps({"emotions": FAKE_EMOTIONS, "advice": FAKE_ADVICE})
+    if "sentiment classifier" in prompt:
+        return json.dumps(FAKE_EMOTIONS)
+    return json.dumps(FAKE_ADVICE)
+
+
+def _fake_vector(text: str, dimensions: int):
+    """Values in [-1, 1) derived from the text's hash, so equal texts get equal vectors."""
+    digest = b""
+    while len(digest) < dimensions:
+        digest += hashlib.sha256(text.encode("utf-8") + len(digest).to_bytes(4, "big")).digest()
+    return [byte / 128 - 1 for byte in digest[:dimensions]]
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeEmbedResponse:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+
+class FakeModels:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: str, config=None):
+        return self._owner._respond(model, contents)
+
+    def generate_content_stream(self, model: str, contents: str, config=None):
+        return self._owner._stream(model, contents)
+
+    def embed_content(self, model: str, contents, config=None):
+        return self._owner._embed(model, contents, config)
+
+
+class FakeAsyncModels:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+
+    async def generate_content(self, model: str, contents: str, config=None):
+        return await self._owner._arespond(model, contents)
+
+
+class FakeAio:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self.models = FakeAsyncModels(owner)
+
+
+class FakeGeminiClient:
+    """
+    Args:
+        responder: Maps a prompt to the raw response text. May raise to simulate errors.
+        latency: Seconds each call sleeps before answering.
+        chunk_size: Characters per chunk when streaming.
+        chunk_latency: Seconds between streamed chunks.
+        failure_rate: Share of calls that fail with a 503 after their latency.
+        seed: Seed for choosing the failing calls, so runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Callable[[str], str]] = None,
+        latency: float = 0.0,
+        chunk_size: int = 16,
+        chunk_latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.failure_rate = failure_rate
+        self.calls = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.models = FakeModels(self)
+        self.aio = FakeAio(self)
+
+    def _record(self, model: str, contents) -> bool:
+        """Log the call and decide whether it fails."""
+        with self._lock:
+            self.calls.append((model, contents))
+            return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    def _fail(self):
+        raise ServerError(503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+
+    def _respond(self, model: str, contents: str):
+        fails = self._record(model, contents)
+        if self.latency:
+            time.sleep(self.latency)
+        if fails:
+            self._fail()
+        return FakeResponse(self.responder(contents))
+
+    async def _arespond(self, model: str, contents: str):
+        fails = self._record(model, contents)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if fails:
+            self._fail()
+        return FakeResponse(self.responder(contents))
+
+    def _embed(self, model: str, contents, config=None):
+        fails = self._record(model, contents)
+        if self.latency:
+            time.sleep(self.latency)
+        if fails:
+            self._fail()
+        dimensions = getattr(config, "output_dimensionality", None) or 8
+        texts = [contents] if isinstance(contents, str) else contents
+        return FakeEmbedResponse([FakeEmbedding(_fake_vector(text, dimensions)) for text in texts])
+
+    def _stream(self, model: str, contents: str):
+        text = self._respond(model, contents).text
+        for i in range(0, len(text), self.chunk_size):
+            if i and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield FakeResponse(text[i:i + self.chunk_size])
@@ -1,18 +1,44 @@
-from google import genai
-from google.genai.errors import ServerError
+from google.genai import types
 import os
 from dotenv import load_dotenv
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait
 import json
-import time
+import logging
 import re
 from datetime import datetime
-import holidays
-import pytz
+from asgiref.sync import sync_to_async
+from gemini_wrapper import jsonlib
+from gemini_wrapper.cache import MISSING, cached_llm_call, llm_cache
+from gemini_wrapper.calendar_service import DEFAULT_TIMEZONE, greeting_moment
+from gemini_wrapper.client import GeminiClient, GeminiUnavailable
+from gemini_wrapper.metrics import Counter
+from gemini_wrapper.streaming import iter_json_array
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = "gemini-2.5-flash-preview-05-20"
+client = GeminiClient.from_env(GEMINI_API_KEY)
+logger = logging.getLogger(__name__)
+
+# Labelled by prompt kind. Output is never logged, since it echoes journal content.
+PARSE_FAILURES = Counter("gemini_parse_failures", "Gemini responses that weren't the expected JSON", ["prompt"])
+FALLBACKS = Counter("gemini_fallbacks", "Default answers used in place of Gemini's", ["prompt"])
+
+# Bump a prompt's version whenever its template changes so cached results for it are ignored.
+PROMPT_VERSIONS = {
+    "emotions": 1,
+    "advice": 1,
+    "analysis": 1,
+    "greetings": 1,
+}
+
+# Shared deadline for a full journal analysis and the pool its calls run on.
+# The pool is bounded so calls stuck in retries can't pile up threads.
+ANALYSIS_TIMEOUT = float(os.getenv("GEMINI_ANALYSIS_TIMEOUT", "45"))
+# "combined" asks for emotions and advice in one request, "split" sends two prompts.
+ANALYSIS_MODE = os.getenv("GEMINI_ANALYSIS_MODE", "combined")
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")), thread_name_prefix="gemini")
 
 
 DEFAULT_EMOTION_PROBS = {
@@ -31,6 +57,82 @@ DEFAULT_ADVICE = [
     "Be kind to yourself during this time."
 ]
 
+def _parse_failed(prompt: str, raw_output: str):
+    PARSE_FAILURES.inc(prompt=prompt)
+    logger.warning("Unusable %s response from Gemini (%d characters)", prompt, len(raw_output))
+
+def _fallback(prompt: str, value):
+    """Count a default answer used in place of Gemini's and return it."""
+    FALLBACKS.inc(prompt=prompt)
+    return value
+
+def _generate(prompt: str, config=None) -> Optional[str]:
+    """
+    Send a prompt through the shared client and return the response text with
+    any Markdown code fence removed, or None if Gemini couldn't be reached.
+    """
+    try:
+        text = client.generate(GEMINI_MODEL, prompt, config)
+    except GeminiUnavailable as e:
+        logger.warning("Gemini unavailable: %s", e)
+        return None
+    except Exception:
+        logger.exception("Unexpected Gemini error")
+        return None
+    return _strip_fence(text)
+
+async def _agenerate(prompt: str, config=None) -> Optional[str]:
+    """Async form of _generate for ASGI views."""
+    try:
+        text = await client.agenerate(GEMINI_MODEL, prompt, config)
+    except GeminiUnavailable as e:
+        logger.warning("Gemini unavailable: %s", e)
+        return None
+    except Exception:
+        logger.exception("Unexpected Gemini error")
+        return None
+    return _strip_fence(text)
+
+def _strip_fence(text: str) -> str:
+    if "```" not in text:
+        return text.strip()  # JSON-mode responses have no fence, so skip the regex
+    return re.sub(r"^```json|```$", "", text.strip(), flags=re.MULTILINE).strip()
+
+def _stream_messages(key: str, prompt: str, fallback: List[str]) -> Iterator[str]:
+    """
+    Stream a prompt that answers with a JSON array of 5 strings, yielding each
+    string as soon as Gemini has finished writing it.
+
+    A cached answer under `key` is replayed instead of calling Gemini, and a
+    complete answer is cached. If the stream fails or goes off format part-way,
+    the remaining messages are taken from `fallback`.
+    """
+    cached = llm_cache.get(key)
+    if cached is not MISSING:
+        yield from cached
+        return
+
+    messages = []
+    try:
+        for item in iter_json_array(client.generate_stream(GEMINI_MODEL, prompt)):
+            if not isinstance(item, str):
+                _parse_failed("stream", str(item))
+                break
+            messages.append(item)
+            yield item
+            if len(messages) == len(fallback):
+                break
+    except GeminiUnavailable as e:
+        logger.warning("Gemini unavailable: %s", e)
+    except Exception:
+        logger.exception("Unexpected Gemini error")
+
+    if len(messages) == len(fallback):
+        llm_cache.set(key, messages)
+    else:
+        yield from _fallback("stream", fallback[len(messages):])
+
+@cached_llm_call("emotions", PROMPT_VERSIONS["emotions"], GEMINI_MODEL, lambda result: result is not DEFAULT_EMOTION_PROBS)
 def get_emotion_probabilities(text: str) -> Dict[str, float]:
     """
     Analyze text and return probabilities for different emotions using Gemini API.
@@ -62,48 +164,22 @@ Only return a valid JSON object with the following structure:
 Here is the input text: "{text}"
 """
 
-    for attempt in range(5):
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-preview-05-20",
-                contents=mood_prompt
-            )
-            raw_output = re.sub(r"^```json|```$", "", response.text.strip(), flags=re.MULTILINE).strip()
-            emotion_probs = json.loads(raw_output)
-            
-            # print("Raw output:", emotion_probs)
-
-            if all(k in emotion_probs for k in DEFAULT_EMOTION_PROBS.keys()):
-                # print("Successfully parsed JSON:", emotion_probs)
-                return {k: float(emotion_probs.get(k, 0.0)) for k in DEFAULT_EMOTION_PROBS}
-            else:
-                # print("Incomplete response keys:", emotion_probs)   
-                return DEFAULT_EMOTION_PROBS
-
-        except ServerError as e:
-            print(f"[Attempt {attempt + 1}] Gemini API is overloaded. Retrying in 5 seconds...")
-            time.sleep(5)
-        except json.JSONDecodeError:
-            print("Failed to parse JSON:", response.text)
-            return DEFAULT_EMOTION_PROBS
-        except Exception as e:
-            print("Unexpected error:", e)
-            return DEFAULT_EMOTION_PROBS
-
-    print("Failed after multiple retries.")
-    return DEFAULT_EMOTION_PROBS
-
-def get_thought_advice(text: str) -> List[str]:
-    """
-    Generate supportive advice based on the user's input text using Gemini API.
-
-    Args:
-        text (str): The input text to analyze
-
-    Returns:
-        List[str]: List of 5 supportive advice messages
-    """
-    advice_prompt = f"""
+    raw_output = _generate(mood_prompt)
+    if raw_output is None:
+        return _fallback("emotions", DEFAULT_EMOTION_PROBS)
+    try:
+        emotion_probs = jsonlib.loads(raw_output)
+    except json.JSONDecodeError:
+        _parse_failed("emotions", raw_output)
+        return _fallback("emotions", DEFAULT_EMOTION_PROBS)
+
+    if isinstance(emotion_probs, dict) and all(k in emotion_probs for k in DEFAULT_EMOTION_PROBS.keys()):
+        return {k: float(emotion_probs.get(k, 0.0)) for k in DEFAULT_EMOTION_PROBS}
+    _parse_failed("emotions", raw_output)
+    return _fallback("emotions", DEFAULT_EMOTION_PROBS)
+
+def _advice_prompt(text: str) -> str:
+    return f"""
 You are a helpful and emotionally aware marshmallow pet who is a friend of the user. Based on the following user input, generate 5 short, supportive advice messages that are encouraging and contextually appropriate.
 
 Advice should be relevant to the user's emotional tone and situation, and may include general well-being tips like self-care, emotional validation, or gentle reminders.
@@ -125,38 +201,320 @@ Only return output in this format:
 ]
 """
 
-    for attempt in range(5):
+@cached_llm_call("advice", PROMPT_VERSIONS["advice"], GEMINI_MODEL, lambda result: result is not DEFAULT_ADVICE)
+def get_thought_advice(text: str) -> List[str]:
+    """
+    Generate supportive advice based on the user's input text using Gemini API.
+
+    Args:
+        text (str): The input text to analyze
+
+    Returns:
+        List[str]: List of 5 supportive advice messages
+    """
+    advice_prompt = _advice_prompt(text)
+
+    raw_output = _generate(advice_prompt)
+    if raw_output is None:
+        return _fallback("advice", DEFAULT_ADVICE)
+    try:
+        advice_list = jsonlib.loads(raw_output)
+    except json.JSONDecodeError:
+        _parse_failed("advice", raw_output)
+        return _fallback("advice", DEFAULT_ADVICE)
+
+    if isinstance(advice_list, list) and len(advice_list) == 5:
+        return advice_list
+    _parse_failed("advice", raw_output)
+    return _fallback("advice", DEFAULT_ADVICE)
+
+def stream_thought_advice(text: str) -> Iterator[str]:
+    """
+    Streaming form of get_thought_advice that yields each advice message as soon as it is generated.
+
+    Args:
+        text (str): The input text to analyze
+
+    Returns:
+        Iterator[str]: The 5 supportive advice messages, one at a time
+    """
+    return _stream_messages(get_thought_advice.cache_key(text), _advice_prompt(text), DEFAULT_ADVICE)
+
+def analyze_journal(text: str, timeout: float = ANALYSIS_TIMEOUT) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Get emotion probabilities and advice for a journal entry using the configured ANALYSIS_MODE.
+
+    Args:
+        text (str): The input text to analyze
+        timeout (float): Seconds to wait for the split path's calls
+
+    Returns:
+        Tuple[Dict[str, float], List[str]]: Emotion probabilities and advice messages
+    """
+    if ANALYSIS_MODE == "combined":
+        return analyze_journal_combined(text, timeout)
+    return analyze_journal_split(text, timeout)
+
+def analysis_fell_back(emotions: Dict[str, float], advice_list: List[str]) -> bool:
+    """Whether either part of an analysis is the default used when Gemini couldn't provide it."""
+    return emotions is DEFAULT_EMOTION_PROBS or advice_list is DEFAULT_ADVICE
+
+def analyze_journal_split(text: str, timeout: float = ANALYSIS_TIMEOUT) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Run the emotion and advice prompts for the same text in parallel.
+
+    Both calls share one deadline. A call that fails or is still running when
+    the deadline passes falls back to its default without affecting the other.
+
+    Args:
+        text (str): The input text to analyze
+        timeout (float): Seconds to wait for both calls
+
+    Returns:
+        Tuple[Dict[str, float], List[str]]: Emotion probabilities and advice messages
+    """
+    emotion_future = executor.submit(get_emotion_probabilities, text)
+    advice_future = executor.submit(get_thought_advice, text)
+    done, _ = wait([emotion_future, advice_future], timeout=timeout)
+
+    def result_or(future, fallback, label):
+        if future not in done:
+            future.cancel()
+            logger.warning("%s call timed out after %s seconds", label, timeout)
+            return _fallback(label.lower(), fallback)
+        try:
+            return future.result()
+        except Exception:
+            logger.exception("%s call failed", label)
+            return _fallback(label.lower(), fallback)
+
+    emotions = result_or(emotion_future, DEFAULT_EMOTION_PROBS, "Emotion")
+    advice_list = result_or(advice_future, DEFAULT_ADVICE, "Advice")
+    return emotions, advice_list
+
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "emotions": {
+            "type": "OBJECT",
+            "properties": {k: {"type": "NUMBER"} for k in DEFAULT_EMOTION_PROBS},
+            "required": list(DEFAULT_EMOTION_PROBS),
+        },
+        "advice": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"},
+            "minItems": 5,
+            "maxItems": 5,
+        },
+    },
+    "required": ["emotions", "advice"],
+}
+
+def _close_truncated_json(raw: str) -> str:
+    """Close any strings, arrays and objects left open by a cut-off response."""
+    stack = []
+    in_string = False
+    escaped = False
+    for ch in raw:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    repaired = raw + ('"' if in_string else "")
+    repaired = re.sub(r"[,:]\s*$", "", repaired.rstrip())
+    return repaired + "".join(reversed(stack))
+
+def _load_partial_json(raw: str):
+    """Parse JSON, dropping trailing incomplete elements of a truncated response if needed."""
+    try:
+        return jsonlib.loads(raw)
+    except json.JSONDecodeError as e:
+        error = e
+
+    candidate = raw
+    while candidate:
         try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-preview-05-20",
-                contents=advice_prompt
-            )
-            raw_output = re.sub(r"^```json|```$", "", response.text.strip(), flags=re.MULTILINE).strip()
-            advice_list = json.loads(raw_output)
-            
-            # print("Raw output:", advice_list)
-
-            if isinstance(advice_list, list) and len(advice_list) == 5:
-                # print("Successfully parsed JSON:", advice_list)
-                return advice_list
-            else:
-                print("Invalid response format")
-                return DEFAULT_ADVICE
-
-        except ServerError as e:
-            print(f"[Attempt {attempt + 1}] Gemini API is overloaded. Retrying in 5 seconds...")
-            time.sleep(5)
+            return jsonlib.loads(_close_truncated_json(candidate))
         except json.JSONDecodeError:
-            print("Failed to parse JSON:", response.text)
-            return DEFAULT_ADVICE
-        except Exception as e:
-            print("Unexpected error:", e)
-            return DEFAULT_ADVICE
+            pass
+        cut = candidate.rfind(",")
+        if cut == -1:
+            break
+        candidate = candidate[:cut]
+    raise error
+
+def _parse_analysis(raw: str) -> Tuple[Optional[Dict[str, float]], Optional[List[str]]]:
+    """
+    Validate a combined analysis response, repairing what can be repaired.
 
-    print("Failed after multiple retries.")
-    return DEFAULT_ADVICE
+    Missing emotions count as 0 and the rest are renormalized to sum to 1.
+    Advice lists with 1-4 usable strings are padded from DEFAULT_ADVICE and
+    longer lists are truncated. A part that can't be salvaged is returned as None.
+    """
+    return _validate_analysis(_load_partial_json(_strip_fence(raw)))
+
+def _validate_analysis(data) -> Tuple[Optional[Dict[str, float]], Optional[List[str]]]:
+    """Validate one parsed {"emotions": ..., "advice": ...} object; see _parse_analysis."""
+    if not isinstance(data, dict):
+        return None, None
+
+    emotions = None
+    raw_emotions = data.get("emotions")
+    if isinstance(raw_emotions, dict):
+        values = {}
+        for k in DEFAULT_EMOTION_PROBS:
+            try:
+                values[k] = max(0.0, float(raw_emotions.get(k, 0.0)))
+            except (TypeError, ValueError):
+                values[k] = 0.0
+        total = sum(values.values())
+        if total > 0:
+            emotions = values if abs(total - 1.0) < 1e-6 else {k: v / total for k, v in values.items()}
+
+    advice = None
+    raw_advice = data.get("advice")
+    if isinstance(raw_advice, list):
+        items = [a.strip() for a in raw_advice if isinstance(a, str) and a.strip()]
+        if items:
+            advice = (items + [a for a in DEFAULT_ADVICE if a not in items])[:5]
+
+    return emotions, advice
+
+@cached_llm_call("analysis", PROMPT_VERSIONS["analysis"], GEMINI_MODEL, lambda result: None not in result)
+def get_journal_analysis(text: str) -> Tuple[Optional[Dict[str, float]], Optional[List[str]]]:
+    """
+    Ask Gemini for the emotion distribution and advice messages in a single request.
 
-def get_daily_greeting_advice(journal_entries: List[str], timezone: str = "Asia/Manila") -> List[str]:
+    Args:
+        text (str): The input text to analyze
+
+    Returns:
+        Tuple[Optional[Dict[str, float]], Optional[List[str]]]: Emotion probabilities and
+        advice messages; either part is None if the response couldn't be used
+    """
+    analysis_prompt = f"""
+You are a sentiment classifier and a helpful, emotionally aware marshmallow pet who is a friend of the user. Read the user's input text and do two things.
+
+1. Classify it into the moods happy, sad, fear, disgust, and anger. Give each a probability from 0 to 1. The probabilities must sum to 1 and exactly one mood must have the highest value (except if input is gibberish).
+2. Generate 5 short, supportive advice messages that are encouraging and contextually appropriate. Advice may include general well-being tips like self-care, emotional validation, or gentle reminders. Do not reply to the input or reference it directly; use it only as context.
+
+Only return a valid JSON object with the following structure:
+
+{{
+    "emotions": {{"happy": <float>, "sad": <float>, "fear": <float>, "disgust": <float>, "anger": <float>}},
+    "advice": ["advice 1", "advice 2", "advice 3", "advice 4", "advice 5"]
+}}
+
+Here is the input text: "{text}"
+"""
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=ANALYSIS_SCHEMA,
+    )
+
+    raw_output = _generate(analysis_prompt, config)
+    if raw_output is None:
+        return None, None
+    try:
+        return _parse_analysis(raw_output)
+    except json.JSONDecodeError:
+        _parse_failed("analysis", raw_output)
+        return None, None
+
+def analyze_journal_combined(text: str, timeout: float = ANALYSIS_TIMEOUT) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Analyze a journal with one combined request, falling back to the
+    dedicated prompts for whichever part of the response was unusable.
+    """
+    emotions, advice_list = get_journal_analysis(text)
+    if emotions is None and advice_list is None:
+        return analyze_journal_split(text, timeout)
+    if emotions is None:
+        emotions = get_emotion_probabilities(text)
+    if advice_list is None:
+        advice_list = get_thought_advice(text)
+    return emotions, advice_list
+
+BATCH_ANALYSIS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "STRING"},
+            **ANALYSIS_SCHEMA["properties"],
+        },
+        "required": ["id", "emotions", "advice"],
+    },
+}
+
+def get_batch_journal_analysis(entries: Dict[str, str]) -> Dict[str, Tuple[Dict[str, float], List[str]]]:
+    """
+    Analyze several journal entries with a single Gemini request.
+
+    Args:
+        entries (Dict[str, str]): Journal texts keyed by an id that is echoed back
+
+    Returns:
+        Dict[str, Tuple[Dict[str, float], List[str]]]: Emotion probabilities and advice
+        per id. Entries missing from or unusable in the response are omitted so the
+        caller can retry them individually.
+    """
+    blocks = "\n".join(f'<entry id="{entry_id}">\n{text}\n</entry>' for entry_id, text in entries.items())
+    batch_prompt = f"""
+You are a sentiment classifier and a helpful, emotionally aware marshmallow pet who is a friend of the user. Below are several separate journal entries, each wrapped in an <entry> tag with an id. Treat every entry on its own and do two things for each.
+
+1. Classify it into the moods happy, sad, fear, disgust, and anger. Give each a probability from 0 to 1. The probabilities must sum to 1 and exactly one mood must have the highest value (except if input is gibberish).
+2. Generate 5 short, supportive advice messages that are encouraging and contextually appropriate. Advice may include general well-being tips like self-care, emotional validation, or gentle reminders. Do not reply to the entry or reference it directly; use it only as context.
+
+Only return a JSON array with one object per entry, in this structure:
+
+[
+    {{
+        "id": "<entry id>",
+        "emotions": {{"happy": <float>, "sad": <float>, "fear": <float>, "disgust": <float>, "anger": <float>}},
+        "advice": ["advice 1", "advice 2", "advice 3", "advice 4", "advice 5"]
+    }}
+]
+
+Entries:
+{blocks}
+"""
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=BATCH_ANALYSIS_SCHEMA,
+    )
+
+    raw_output = _generate(batch_prompt, config)
+    if raw_output is None:
+        return {}
+    try:
+        items = _load_partial_json(raw_output)
+    except json.JSONDecodeError:
+        _parse_failed("batch_analysis", raw_output)
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict) or str(item.get("id")) not in entries:
+            continue
+        emotions, advice_list = _validate_analysis(item)
+        if emotions is not None and advice_list is not None:
+            results[str(item["id"])] = (emotions, advice_list)
+    return results
+
+def get_daily_greeting_advice(journal_entries: List[str], timezone: str = DEFAULT_TIMEZONE, at: Optional[datetime] = None) -> List[str]:
     """
     Generate a list of 5 personalized greetings and advice based on all journal entries for the day,
     current time, and any holidays.
@@ -164,37 +522,86 @@ def get_daily_greeting_advice(journal_entries: List[str], timezone: str = "Asia/
     Args:
         journal_entries (List[str]): List of journal entries for the current day
         timezone (str): Timezone for time-based greetings (default: Asia/Manila)
+        at (datetime): Moment the greetings are for, so they can be generated ahead of time (default: now)
 
     Returns:
         List[str]: List of 5 personalized greeting and advice messages
     """
-    # Get current time and date in Philippine timezone
-    ph_tz = pytz.timezone(timezone)
-    current_time = datetime.now(ph_tz)
-    hour = current_time.hour
-    current_date = current_time.date()
-    day_of_week = current_time.strftime("%A")  # Get full day name (Monday, Tuesday, etc.)
-    is_holiday = current_date in holidays.PH()
-    holiday_name = holidays.PH().get(current_date) if is_holiday else None
-
-    # Determine time period
-    if 5 <= hour < 8:
-        time_period = "dawn"
-    elif 8 <= hour < 12:
-        time_period = "morning"
-    elif 12 <= hour < 14:
-        time_period = "noon"
-    elif 14 <= hour < 17:
-        time_period = "afternoon"
-    elif 17 <= hour < 22:
-        time_period = "evening"
-    else:  # 22-4
-        time_period = "midnight"
+    moment = greeting_moment(at, timezone)
+    time_period = moment.time_period
+    day_of_week = moment.day_of_week
 
     # Combine all journal entries
     combined_entries = "\n".join(journal_entries) if journal_entries else "No entries for today"
 
-    greeting_prompt = f"""
+    greetings = _generate_daily_greetings(combined_entries, time_period, day_of_week, moment.is_holiday, moment.holiday_name)
+    if greetings is None:
+        return _fallback("greetings", _fallback_greetings(time_period, day_of_week))
+    return greetings
+
+async def aget_daily_greeting_advice(journal_entries: List[str], timezone: str = DEFAULT_TIMEZONE, at: Optional[datetime] = None) -> List[str]:
+    """
+    Async form of get_daily_greeting_advice for ASGI views. Shares its cache.
+
+    Args:
+        journal_entries (List[str]): List of journal entries for the current day
+        timezone (str): Timezone for time-based greetings (default: Asia/Manila)
+        at (datetime): Moment the greetings are for (default: now)
+
+    Returns:
+        List[str]: List of 5 personalized greeting and advice messages
+    """
+    moment = greeting_moment(at, timezone)
+    combined_entries = "\n".join(journal_entries) if journal_entries else "No entries for today"
+    context = (combined_entries, moment.time_period, moment.day_of_week, moment.is_holiday, moment.holiday_name)
+
+    key = _generate_daily_greetings.cache_key(*context)
+    greetings = await sync_to_async(llm_cache.get)(key)
+    if greetings is MISSING:
+        greetings = _parse_greetings(await _agenerate(_greeting_prompt(*context)))
+        if _should_cache_greetings(greetings):
+            await sync_to_async(llm_cache.set)(key, greetings)
+    if greetings is None:
+        return _fallback("greetings", _fallback_greetings(moment.time_period, moment.day_of_week))
+    return greetings
+
+def fallback_daily_greetings(timezone: str = DEFAULT_TIMEZONE, at: Optional[datetime] = None) -> List[str]:
+    """
+    The greetings used in place of Gemini's, for callers that can't wait for a generation to finish.
+
+    Args:
+        timezone (str): Timezone for time-based greetings (default: Asia/Manila)
+        at (datetime): Moment the greetings are for (default: now)
+
+    Returns:
+        List[str]: List of 5 greeting messages for the time period
+    """
+    moment = greeting_moment(at, timezone)
+    return _fallback("greetings", _fallback_greetings(moment.time_period, moment.day_of_week))
+
+def stream_daily_greeting_advice(journal_entries: List[str], timezone: str = DEFAULT_TIMEZONE, at: Optional[datetime] = None) -> Iterator[str]:
+    """
+    Streaming form of get_daily_greeting_advice that yields each greeting as soon as it is generated.
+
+    Args:
+        journal_entries (List[str]): List of journal entries for the current day
+        timezone (str): Timezone for time-based greetings (default: Asia/Manila)
+        at (datetime): Moment the greetings are for (default: now)
+
+    Returns:
+        Iterator[str]: The 5 greeting messages, one at a time
+    """
+    moment = greeting_moment(at, timezone)
+    combined_entries = "\n".join(journal_entries) if journal_entries else "No entries for today"
+    context = (combined_entries, moment.time_period, moment.day_of_week, moment.is_holiday, moment.holiday_name)
+    return _stream_messages(
+        _generate_daily_greetings.cache_key(*context),
+        _greeting_prompt(*context),
+        _fallback_greetings(moment.time_period, moment.day_of_week),
+    )
+
+def _greeting_prompt(combined_entries: str, time_period: str, day_of_week: str, is_holiday: bool, holiday_name: Optional[str]) -> str:
+    return f"""
 You are a friendly and empathetic marshmallow pet who is a friend of the user. Generate 5 different personalized greetings and advice based on the following context:
 
 Current time period: {time_period}
@@ -221,80 +628,82 @@ Keep each greeting concise and short (1-2 sentences) and friendly. Do not make i
 Return only a JSON array of 5 strings, no other text or formatting.
 """
 
-    for attempt in range(5):
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-preview-05-20",
-                contents=greeting_prompt
-            )
-            raw_output = re.sub(r"^```json|```$", "", response.text.strip(), flags=re.MULTILINE).strip()
-            greetings = json.loads(raw_output)
-            
-            if isinstance(greetings, list) and len(greetings) == 5:
-                return greetings
-            else:
-                # Fallback greetings with time-period specific messages
-                if time_period == "dawn":
-                    return [
-                        f"Good dawn! The world is just waking up, and so are you. Let's start this day with positive energy!",
-                        f"Early bird catches the worm! Your journal entries show your readiness for the day ahead.",
-                        f"Rise and shine! I'm here to support you through this beautiful dawn.",
-                        f"Hello early bird! I can feel your determination. Let's make this day amazing!",
-                        f"Good dawn on this beautiful day! Your enthusiasm is contagious."
-                    ]
-                elif time_period == "morning":
-                    return [
-                        f"Good morning! I hope you're having a wonderful {day_of_week}. Remember to take care of yourself!",
-                        f"Happy morning! Your journal entries show your thoughtful nature. Keep being amazing!",
-                        f"Greetings! I'm here to support you through your {day_of_week}. You're doing great!",
-                        f"Hello! I'm your friendly marshmallow pet, here to brighten your morning. Stay positive!",
-                        f"Hi there! I'm always here to listen and support you. Have a wonderful {day_of_week}!"
-                    ]
-                elif time_period == "noon":
-                    return [
-                        f"Good noon! Halfway through the day, and you're doing great!",
-                        f"Happy noon! Time for a quick break and some positive energy.",
-                        f"Greetings! The sun is high, and so are your spirits. Keep going!",
-                        f"Hello! Perfect time for a quick recharge. You're doing amazing!",
-                        f"Hi there! The day is still young, and you're making it count!"
-                    ]
-                elif time_period == "afternoon":
-                    return [
-                        f"Good afternoon! The day is still full of possibilities!",
-                        f"Happy afternoon! Your energy is inspiring. Keep that momentum going!",
-                        f"Greetings! The afternoon sun brings warmth and positivity.",
-                        f"Hello! The day is still yours to make the most of!",
-                        f"Hi there! Afternoon vibes are the best vibes. Keep shining!"
-                    ]
-                elif time_period == "evening":
-                    return [
-                        f"Good evening! Time to reflect on your day's achievements!",
-                        f"Happy evening! Your journal entries show your thoughtful nature.",
-                        f"Greetings! The evening brings peace and reflection. You've done well today!",
-                        f"Hello! The stars are coming out, and so is your inner light!",
-                        f"Hi there! Evening is for winding down and celebrating your day!"
-                    ]
-                else:  # midnight
-                    return [
-                        f"Good midnight! The world is quiet, but your thoughts matter.",
-                        f"Happy midnight! Time for some peaceful reflection.",
-                        f"Greetings! The night is still young, and so are your possibilities.",
-                        f"Hello! The midnight hour brings clarity and peace.",
-                        f"Hi there! The night is yours to dream and plan!"
-                    ]
-
-        except ServerError as e:
-            print(f"[Attempt {attempt + 1}] Gemini API is overloaded. Retrying in 5 seconds...")
-            time.sleep(5)
-        except json.JSONDecodeError:
-            print("Failed to parse JSON:", response.text)
-            return DEFAULT_ADVICE
-        except Exception as e:
-            print("Unexpected error:", e)
-            return DEFAULT_ADVICE
-
-    print("Failed after multiple retries.")
-    return DEFAULT_ADVICE
+@cached_llm_call("greetings", PROMPT_VERSIONS["greetings"], GEMINI_MODEL, lambda result: _should_cache_greetings(result))
+def _generate_daily_greetings(combined_entries: str, time_period: str, day_of_week: str, is_holiday: bool, holiday_name: Optional[str]) -> Optional[List[str]]:
+    """
+    Ask Gemini for the greetings. Returns None if the response wasn't a list of 5,
+    so the caller can use the time-period fallback, or DEFAULT_ADVICE on errors.
+    """
+    greeting_prompt = _greeting_prompt(combined_entries, time_period, day_of_week, is_holiday, holiday_name)
+    return _parse_greetings(_generate(greeting_prompt))
+
+def _parse_greetings(raw_output: Optional[str]) -> Optional[List[str]]:
+    if raw_output is None:
+        return _fallback("greetings", DEFAULT_ADVICE)
+    try:
+        greetings = jsonlib.loads(raw_output)
+    except json.JSONDecodeError:
+        _parse_failed("greetings", raw_output)
+        return _fallback("greetings", DEFAULT_ADVICE)
+
+    if isinstance(greetings, list) and len(greetings) == 5:
+        return greetings
+    _parse_failed("greetings", raw_output)
+    return None
+
+def _should_cache_greetings(result) -> bool:
+    return result is not None and result is not DEFAULT_ADVICE
+
+def _fallback_greetings(time_period: str, day_of_week: str) -> List[str]:
+    """Time-period specific greetings used when Gemini returns an unexpected format."""
+    if time_period == "dawn":
+        return [
+            f"Good dawn! The world is just waking up, and so are you. Let's start this day with positive energy!",
+            f"Early bird catches the worm! Your journal entries show your readiness for the day ahead.",
+            f"Rise and shine! I'm here to support you through this beautiful dawn.",
+            f"Hello early bird! I can feel your determination. Let's make this day amazing!",
+            f"Good dawn on this beautiful day! Your enthusiasm is contagious."
+        ]
+    elif time_period == "morning":
+        return [
+            f"Good morning! I hope you're having a wonderful {day_of_week}. Remember to take care of yourself!",
+            f"Happy morning! Your journal entries show your thoughtful nature. Keep being amazing!",
+            f"Greetings! I'm here to support you through your {day_of_week}. You're doing great!",
+            f"Hello! I'm your friendly marshmallow pet, here to brighten your morning. Stay positive!",
+            f"Hi there! I'm always here to listen and support you. Have a wonderful {day_of_week}!"
+        ]
+    elif time_period == "noon":
+        return [
+            f"Good noon! Halfway through the day, and you're doing great!",
+            f"Happy noon! Time for a quick break and some positive energy.",
+            f"Greetings! The sun is high, and so are your spirits. Keep going!",
+            f"Hello! Perfect time for a quick recharge. You're doing amazing!",
+            f"Hi there! The day is still young, and you're making it count!"
+        ]
+    elif time_period == "afternoon":
+        return [
+            f"Good afternoon! The day is still full of possibilities!",
+            f"Happy afternoon! Your energy is inspiring. Keep that momentum going!",
+            f"Greetings! The afternoon sun brings warmth and positivity.",
+            f"Hello! The day is still yours to make the most of!",
+            f"Hi there! Afternoon vibes are the best vibes. Keep shining!"
+        ]
+    elif time_period == "evening":
+        return [
+            f"Good evening! Time to reflect on your day's achievements!",
+            f"Happy evening! Your journal entries show your thoughtful nature.",
+            f"Greetings! The evening brings peace and reflection. You've done well today!",
+            f"Hello! The stars are coming out, and so is your inner light!",
+            f"Hi there! Evening is for winding down and celebrating your day!"
+        ]
+    else:  # midnight
+        return [
+            f"Good midnight! The world is quiet, but your thoughts matter.",
+            f"Happy midnight! Time for some peaceful reflection.",
+            f"Greetings! The night is still young, and so are your possibilities.",
+            f"Hello! The midnight hour brings clarity and peace.",
+            f"Hi there! The night is yours to dream and plan!"
+        ]
 
 # Test functions
 if __name__ == "__main__":
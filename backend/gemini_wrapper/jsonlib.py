@@ -0,0 +1,32 @@
+"""
+JSON through orjson when it is installed, the standard library otherwise.
+
+Both backends raise json.JSONDecodeError on bad input (orjson's error is a
+subclass), so callers catch that whichever one is in use. `dumps` returns
+compact UTF-8 bytes without escaping non-ASCII text.
+"""
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # Optional; everything works on the standard library
+    orjson = None
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Serialize to compact JSON. With orjson, datetimes, dates and times go to
+    `default` too, so they come out the same as with the standard library.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
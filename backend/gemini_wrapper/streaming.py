@@ -0,0 +1,85 @@
+"""
+Incremental parsing of a streamed JSON array.
+
+Gemini streams its text in arbitrary chunks. JsonArrayStream is fed those
+chunks and hands back each element of the top-level array as soon as the
+element's closing character has arrived, so a list of messages can be shown
+one by one while the rest is still being generated. Anything before the
+opening bracket (such as a Markdown code fence) is ignored.
+"""
+from typing import Any, Iterable, Iterator, List
+
+from gemini_wrapper import jsonlib
+
+
+class JsonArrayStream:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0  # Next character of buffer to scan
+        self.started = False  # Seen the opening bracket
+        self.finished = False  # Seen the closing bracket
+        self.depth = 0  # Nesting inside the current element
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add a chunk and return the elements it completed."""
+        self.buffer += chunk
+        items = []
+        while self.pos < len(self.buffer) and not self.finished:
+            char = self.buffer[self.pos]
+            if not self.started:
+                if char == "[":
+                    self.started = True
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 0:
+                        items.append(self._take(self.pos + 1))
+            elif char == '"':
+                self.in_string = True
+                self._begin()
+            elif char in "[{":
+                self._begin()
+                self.depth += 1
+            elif char in "]}":
+                if self.depth == 0:
+                    # End of the array; flush a trailing number or literal
+                    if self.item_start is not None:
+                        items.append(self._take(self.pos))
+                    self.finished = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        items.append(self._take(self.pos + 1))
+            elif char == "," and self.depth == 0:
+                if self.item_start is not None:
+                    items.append(self._take(self.pos))
+            elif not char.isspace():
+                self._begin()
+            self.pos += 1
+        return items
+
+    def _begin(self):
+        if self.item_start is None and self.depth == 0:
+            self.item_start = self.pos
+
+    def _take(self, end: int) -> Any:
+        raw = self.buffer[self.item_start:end]
+        self.item_start = None
+        # Drop what was consumed so the buffer stays small
+        self.buffer = self.buffer[end:]
+        self.pos -= end
+        return jsonlib.loads(raw)
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Yield the elements of a JSON array streamed as text chunks."""
+    parser = JsonArrayStream()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
@@ -62,4 +62,37 @@ api.interceptors.response.use(
     }
 );
 
+/**
+ * Read a Server-Sent Events endpoint, calling onEvent(event, data) for each event as it arrives.
+ * Uses fetch rather than EventSource so the JWT can be sent in the Authorization header.
+ * Rejects on a non-2xx response so callers can fall back to the regular endpoint.
+ */
+export async function streamEvents(path, onEvent) {
+    const response = await fetch(`${API_URL}${path.replace(/^\//, '')}`, {
+        headers: {
+            Accept: 'text/event-stream',
+            Authorization: `Bearer ${localStorage.getItem(ACCESS_TOKEN)}`,
+        },
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`Stream request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        for (const block of blocks) {
+            const event = block.match(/^event: (.*)$/m)?.[1];
+            const data = block.match(/^data: (.*)$/m)?.[1];
+            if (event && data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 export default api;
@@ -1,19 +1,63 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import EntryCover from './EntryCover';
+import Button from './Button';
+import api from '../api';
 import { useUser } from '../context/UserContext';
 import '../styles/JournalList.css';
 
-// Helper to format date as "Month Day, Year"
-function formatDate(dateStr) {
-  if (!dateStr) return '';
-  const date = new Date(dateStr);
-  return date.toLocaleDateString('en-US', { month: 'long', day: 'numeric', year: 'numeric' });
+// Server-side results while a search or filter is active: ranked full-text search over
+// title and content when there is text to search for, the filtered journal list otherwise
+function useJournalQuery(search, mood, date) {
+  const [state, setState] = useState({ results: [], next: null, loading: false, loadingMore: false });
+  const query = search.trim();
+  const day = date ? date.toLocaleDateString('en-CA') : '';
+  const active = Boolean(query || mood || day);
+
+  useEffect(() => {
+    if (!active) return undefined;
+    let cancelled = false;
+    const params = {};
+    if (query) params.q = query;
+    if (mood) params.mood = mood;
+    if (day) {
+      params.start = day;
+      params.end = day;
+    }
+    setState({ results: [], next: null, loading: true, loadingMore: false });
+    // Wait for the user to stop typing before searching
+    const timer = setTimeout(async () => {
+      try {
+        const res = await api.get(query ? '/journals/search/' : '/journals/', { params });
+        if (!cancelled) setState({ results: res.data.results, next: res.data.next, loading: false, loadingMore: false });
+      } catch {
+        if (!cancelled) setState({ results: [], next: null, loading: false, loadingMore: false });
+      }
+    }, query ? 300 : 0);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [active, query, mood, day]);
+
+  const loadMore = async () => {
+    if (!state.next) return;
+    setState(prev => ({ ...prev, loadingMore: true }));
+    try {
+      const res = await api.get(state.next);
+      setState(prev => ({ ...prev, results: [...prev.results, ...res.data.results], next: res.data.next, loadingMore: false }));
+    } catch {
+      setState(prev => ({ ...prev, loadingMore: false }));
+    }
+  };
+
+  return { active, ...state, loadMore };
 }
 
 function JournalList({ search = '', mood = '', date = null, limit }) {
-  const { journals, loading } = useUser();
+  const { journals, loading, hasMoreJournals, loadingMore, loadMoreJournals } = useUser();
+  const filtered = useJournalQuery(search, mood, date);
 
-  if (loading) {
+  if (loading || filtered.loading) {
     // Show 3 skeleton cards as placeholders
     return (
       <div className="journal-list">
@@ -28,51 +72,55 @@ function JournalList({ search = '', mood = '', date = null, limit }) {
     );
   }
 
-  const searchLower = search.toLowerCase();
-
-  // Filter by title, content, date (raw or formatted), or dominant mood
-  let filteredJournals = journals.filter(entry => {
-    const formattedDate = formatDate(entry.date).toLowerCase();
-    const matchesSearch =
-      (entry.title?.toLowerCase().includes(searchLower)) ||
-      (entry.content?.toLowerCase().includes(searchLower)) ||
-      (entry.date?.toLowerCase().includes(searchLower)) ||
-      (formattedDate.includes(searchLower)) ||
-      (entry.moodStats?.dominantMood?.toLowerCase().includes(searchLower));
-
-    // Mood filter
-    const matchesMood = !mood || (entry.moodStats?.dominantMood?.toLowerCase() === mood);
-
-    // Date filter (compare formatted date string)
-    const matchesDate = !date || formatDate(entry.date) === formatDate(date);
-
-    return matchesSearch && matchesMood && matchesDate;
-  });
+  let entries;
+  let hasMore;
+  let onLoadMore;
+  let busy;
+  if (filtered.active) {
+    // Already ordered by the server (search results by relevance)
+    entries = filtered.results;
+    hasMore = Boolean(filtered.next);
+    onLoadMore = filtered.loadMore;
+    busy = filtered.loadingMore;
+  } else {
+    // Sort by date (most recent first)
+    entries = [...journals].sort((a, b) => new Date(b.date) - new Date(a.date));
+    hasMore = hasMoreJournals;
+    onLoadMore = loadMoreJournals;
+    busy = loadingMore;
+  }
 
-  // Sort by date (most recent first) and apply limit if provided
-  filteredJournals = filteredJournals.sort((a, b) => new Date(b.date) - new Date(a.date));
-  
   if (limit) {
-    filteredJournals = filteredJournals.slice(0, limit);
+    entries = entries.slice(0, limit);
+    hasMore = false;
   }
 
   return (
-    <div className='journal-list'>
-      {filteredJournals.length === 0 ? (
-        <p className="no-entries-found small-text">No entries found.</p>
-      ) : (
-        filteredJournals.map((entry) => (
-          <EntryCover
-            key={entry.id}
-            id={entry.id}
-            title={entry.title}
-            date={entry.date}
-            mood={entry.moodStats?.dominantMood || 'Happy'}
-          />
-        ))
+    <>
+      <div className='journal-list'>
+        {entries.length === 0 ? (
+          <p className="no-entries-found small-text">No entries found.</p>
+        ) : (
+          entries.map((entry) => (
+            <EntryCover
+              key={entry.id}
+              id={entry.id}
+              title={entry.title}
+              date={entry.date}
+              mood={entry.dominantMood || 'Happy'}
+            />
+          ))
+        )}
+      </div>
+      {hasMore && (
+        <div className="journal-load-more">
+          <Button type="small-compact" onClick={onLoadMore} disabled={busy}>
+            {busy ? 'Loading...' : 'Load more'}
+          </Button>
+        </div>
       )}
-    </div>
+    </>
   );
-} 
+}
 
-export default JournalList;
\ No newline at end of file
+export default JournalList;
@@ -1,4 +1,4 @@
-import React, { useMemo } from 'react';
+import React, { useEffect, useMemo, useState } from 'react';
 import Calendar from 'react-calendar';
 import { Icon } from '@iconify/react';
 import 'react-calendar/dist/Calendar.css';
@@ -8,12 +8,25 @@ import { useUser } from '../context/UserContext';
 
 const MoodCalendar = () => {
   const navigate = useNavigate();
-  const { journals } = useUser();
+  const { journals, hasMoreJournals, loadingMore, loadMoreJournals } = useUser();
+  const [activeStartDate, setActiveStartDate] = useState(() => {
+    const today = new Date();
+    return new Date(today.getFullYear(), today.getMonth(), 1);
+  });
+
+  // Journals are loaded a page at a time, newest first; load older pages until the month on screen is covered
+  useEffect(() => {
+    if (!hasMoreJournals || loadingMore || journals.length === 0) return;
+    const oldest = journals.reduce((min, journal) => (journal.date < min ? journal.date : min), journals[0].date);
+    if (oldest.slice(0, 10) >= activeStartDate.toLocaleDateString('en-CA')) {
+      loadMoreJournals();
+    }
+  }, [journals, hasMoreJournals, loadingMore, loadMoreJournals, activeStartDate]);
 
   const moodData = useMemo(() => {
     return journals.reduce((acc, journal) => {
       const date = new Date(journal.date).toLocaleDateString('en-CA');
-      const mood = journal.moodStats?.dominantMood?.toLowerCase() || 'neutral';
+      const mood = journal.dominantMood?.toLowerCase() || 'neutral';
       if (mood) {
         acc[date] = mood;
       }
@@ -24,12 +37,7 @@ const MoodCalendar = () => {
   // console.log('Mood data:', moodData); // Debugging line to check moodData structure
 
   const handleDateClick = (date) => {
-    const formattedDate = date.toLocaleDateString('en-US', {
-      month: 'long',
-      day: 'numeric',
-      year: 'numeric'
-    }); // Format: "June 5, 2025"
-    navigate(`/journal?date=${encodeURIComponent(formattedDate)}`);
+    navigate(`/journal?date=${date.toLocaleDateString('en-CA')}`); // Format: "2025-06-05"
   };
 
   return (
@@ -39,6 +47,7 @@ const MoodCalendar = () => {
       nextLabel={<Icon icon="lucide:circle-chevron-right" width="24" height="24" />}
       showNeighboringMonth={false}
       onClickDay={handleDateClick}
+      onActiveStartDateChange={({ activeStartDate }) => setActiveStartDate(activeStartDate)}
       tileClassName={({ date, view }) => {
         const key = date.toLocaleDateString('en-CA');
         let mood = null;
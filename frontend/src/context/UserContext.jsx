@@ -15,7 +15,9 @@ export const useUser = () => {
 export const UserProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [journals, setJournals] = useState([]);
+  const [nextJournals, setNextJournals] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const fetchUserData = useCallback(async () => {
     try {
@@ -27,6 +29,12 @@ export const UserProvider = ({ children }) => {
 
       const response = await api.get('/users/me/');
       setUser(response.data);
+
+      // Greetings follow the user's local time, so keep the stored timezone in sync with the browser
+      const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+      if (timezone && response.data.profile && response.data.profile.timezone !== timezone) {
+        api.post('/users/set_timezone/', { timezone }).catch(() => {});
+      }
     } catch (error) {
       console.error('Error fetching user data:', error);
       setUser(null);
@@ -54,19 +62,36 @@ export const UserProvider = ({ children }) => {
     return () => window.removeEventListener('storage', handleStorageChange);
   }, [fetchUserData]);
 
-  // Separate fetchJournals function
+  // The list is cursor-paginated, newest first: fetchJournals loads the first page
+  // and loadMoreJournals appends the next one when a component needs older entries
   const fetchJournals = useCallback(async () => {
     setLoading(true);
     try {
       const res = await api.get('/journals/');
-      setJournals(res.data);
+      setJournals(res.data.results);
+      setNextJournals(res.data.next);
     } catch {
       setJournals([]);
+      setNextJournals(null);
     } finally {
       setLoading(false);
     }
   }, []);
 
+  const loadMoreJournals = useCallback(async () => {
+    if (!nextJournals || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await api.get(nextJournals);
+      setJournals(prev => [...prev, ...res.data.results]);
+      setNextJournals(res.data.next);
+    } catch {
+      // Keep the pages already loaded; the next call tries again
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextJournals, loadingMore]);
+
   // Add deleteEntry here
   const deleteEntry = useCallback(async (deleteId) => {
     try {
@@ -82,8 +107,11 @@ export const UserProvider = ({ children }) => {
     user,
     journals,
     loading,
+    hasMoreJournals: Boolean(nextJournals),
+    loadingMore,
     fetchUserData,
     fetchJournals,
+    loadMoreJournals,
     deleteEntry
   };
 
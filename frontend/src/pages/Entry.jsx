@@ -16,6 +16,8 @@ const moodToEmotionCode = {
   sad: 5,
 };
 
+const JOB_POLL_INTERVAL = 1500; // ms between emotion job status checks
+
 function Entry() {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -206,7 +208,20 @@ function Entry() {
     setIsAnalyzing(true);
     try {
       console.log('Processing emotions for entry:', entryId);
-      const response = await api.post(`/journals/${entryId}/process_emotions/`);
+      let response = await api.post(`/journals/${entryId}/process_emotions/`);
+
+      // 202 means the analysis was queued; poll the job until a worker finishes it
+      if (response.status === 202) {
+        let job = response.data;
+        while (job.status === 'pending' || job.status === 'running') {
+          await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+          job = (await api.get(`/emotion-jobs/${job.id}/`)).data;
+        }
+        if (job.status !== 'done') {
+          throw new Error(job.error || 'Emotion processing failed');
+        }
+        response = await api.get(`/journals/${entryId}/`);
+      }
       console.log('Processed emotions:', response.data);
       
       setMoodStats(response.data.moodStats);
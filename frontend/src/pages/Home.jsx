@@ -10,7 +10,7 @@ import DialogBox from '../components/DialogBox';
 import { useUser } from '../context/UserContext';
 import '../styles/Home.css';
 import MoodCalendar from '../components/MoodCalendar';
-import api from '../api';
+import api, { streamEvents } from '../api';
 
 const moodToEmotionCode = {
   anger: 1,
@@ -138,6 +138,20 @@ function Home() {
     // Fetch daily greetings
     useEffect(() => {
         const fetchDailyGreetings = async () => {
+            try {
+                // Show each greeting as soon as it is generated
+                const streamed = [];
+                await streamEvents('/daily-greetings/stream/', (event, data) => {
+                    if (event === 'greeting') {
+                        streamed.push(data.text);
+                        setDailyGreetings([...streamed]);
+                        if (streamed.length === 1) setCurrentGreetingIndex(0);
+                    }
+                });
+                return;
+            } catch (error) {
+                console.error('Error streaming daily greetings, falling back:', error);
+            }
             try {
                 const response = await api.get('/daily-greetings/today/');
                 if (response.data.greetings) {
@@ -42,11 +42,12 @@ function Journal() {
 
     useEffect(() => {
         fetchJournals();
-        // Get date from URL parameters
+        // Get date (YYYY-MM-DD, from the mood calendar) from URL parameters
         const params = new URLSearchParams(location.search);
         const dateParam = params.get('date');
         if (dateParam) {
-            setSearch(dateParam);
+            const [year, month, day] = dateParam.split('-').map(Number);
+            setSelectedDate(new Date(year, month - 1, day));
         }
     }, [fetchJournals, location.search]);
 